@@ -0,0 +1,102 @@
+"""
+Memory report for the object engine: bytes used per animal and per cell.
+
+Creates many animals and cells and measures the memory they allocate with tracemalloc.
+Animals are created the same way as in the simulation, from a dictionary and a location.
+
+The objects are compared with the layout before animals and cells had __slots__,
+rebuilt below with the same attributes: every object had an instance dictionary,
+animals kept the dictionary they were made from and an unused newborn flag, and
+every cell with animals had its own species dictionary and an unused population
+history.
+"""
+
+import tracemalloc
+
+from biosim.animals import Herbivore, Carnivore
+from biosim.cell import Water, Desert, Lowland, Highland
+
+
+class DictAnimal:
+    """Animal with the attributes of the layout before __slots__."""
+
+    def __init__(self, row, loc):
+        self.row = row
+        self.loc = loc
+        self.species = row['species']
+        self.age = row['age']
+        self.weight = row['weight']
+        self.fitness = 0.5
+        self.alive = True
+        self.newborn = None
+
+
+class DictCell:
+    """Cell without animals, with the attributes of the layout before __slots__."""
+
+    def __init__(self, location):
+        self.location = location
+
+
+class DictCellWithAnimals(DictCell):
+    """Cell with animals, with the attributes of the layout before __slots__."""
+
+    def __init__(self, location):
+        super().__init__(location)
+        self.fauna = {'Herbivore': [], 'Carnivore': []}
+        self.cell_pop_history = {'Herbivore': [], 'Carnivore': []}
+        self.species = {'Herbivore': Herbivore, 'Carnivore': Carnivore}
+
+
+class DictCellWithFodder(DictCellWithAnimals):
+    """Cell with fodder, with the attributes of the layout before __slots__."""
+
+    def __init__(self, location):
+        super().__init__(location)
+        self.fodder = 800.0
+
+
+def bytes_per_object(make_object, num_objects=10000):
+    """
+    Measures the average number of bytes allocated for one object.
+
+    Parameters
+    ----------
+    make_object : callable
+        Function without arguments that creates one object.
+    num_objects : int
+        Number of objects to create.
+
+    Returns
+    -------
+    float
+        Bytes per object.
+    """
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    objects = [make_object() for _ in range(num_objects)]
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # the list holding the objects is not part of the objects
+    list_size = objects.__sizeof__()
+    return (end - start - list_size) / num_objects
+
+
+if __name__ == '__main__':
+
+    animals = {'Herbivore': (DictAnimal, Herbivore), 'Carnivore': (DictAnimal, Carnivore)}
+    cells = {'Water': (DictCell, Water), 'Desert': (DictCellWithAnimals, Desert),
+             'Lowland': (DictCellWithFodder, Lowland), 'Highland': (DictCellWithFodder, Highland)}
+
+    print(f'Bytes per animal  {"before":>8s} {"after":>8s}')
+    for species, classes in animals.items():
+        sizes = [bytes_per_object(
+            lambda: animal_class({'species': species, 'age': 5, 'weight': 20}, (2, 2)))
+            for animal_class in classes]
+        print(f'  {species:15s} {sizes[0]:8.1f} {sizes[1]:8.1f}')
+
+    print(f'Bytes per cell    {"before":>8s} {"after":>8s}')
+    for name, classes in cells.items():
+        sizes = [bytes_per_object(lambda: cell_class((2, 2))) for cell_class in classes]
+        print(f'  {name:15s} {sizes[0]:8.1f} {sizes[1]:8.1f}')
@@ -2,14 +2,385 @@
 Implements a class for animals.
 """
 
+import contextlib
+import contextvars
+import heapq
 import math
-import random
+import time
+from bisect import bisect_right
+from operator import attrgetter
+
+import numpy as np
+from scipy.special import expit
+
+from . import rng as _rng
+
+# Parameter set of the simulation running in the current thread, see
+# biosim.parameters.ParameterSet. If None, the class-level parameters are used.
+active_parameters = contextvars.ContextVar('active_parameters', default=None)
+
+# Operation counters of the island running in the current thread, see
+# OperationCounters. If None, the class-level counters are used.
+active_counters = contextvars.ContextVar('active_counters', default=None)
+
+# Sort key of animals whose fitness is up to date
+_fitness_key = attrgetter('_fitness')
+
+
+class FitnessCounter:
+    """
+    Counts how often the fitness of animals is invalidated and how often it is recomputed.
+
+    Every change of age or weight invalidates the fitness. An eager implementation
+    would recompute the fitness each time, the lazy fitness only recomputes it when
+    it is read. The difference is the number of recomputations saved.
+    """
+
+    def __init__(self):
+        """Initializes the counter with zero counts."""
+        self.invalidated = 0
+        self.recomputed = 0
+
+    def reset(self):
+        """Sets both counts to zero."""
+        self.invalidated = 0
+        self.recomputed = 0
+
+    @property
+    def saved(self):
+        """Number of fitness recomputations saved by the lazy fitness."""
+        return self.invalidated - self.recomputed
+
+    def as_dict(self):
+        """
+        Returns the counts as a dictionary.
+
+        Returns
+        -------
+        dict
+            Keys 'invalidated', 'recomputed' and 'saved'.
+        """
+        return {'invalidated': self.invalidated,
+                'recomputed': self.recomputed,
+                'saved': self.saved}
+
+
+class SortCounter:
+    """
+    Counts how often herbivores are sorted by fitness, how many are sorted,
+    and the time spent sorting.
+    """
+
+    def __init__(self):
+        """Initializes the counter with zero counts."""
+        self.sorts = 0
+        self.animals = 0
+        self.seconds = 0.0
+
+    def reset(self):
+        """Sets all counts to zero."""
+        self.sorts = 0
+        self.animals = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        """
+        Returns the counts as a dictionary.
+
+        Returns
+        -------
+        dict
+            Keys 'sorts', 'animals' and 'seconds'.
+        """
+        return {'sorts': self.sorts,
+                'animals': self.animals,
+                'seconds': self.seconds}
+
+
+class OperationCounters:
+    """
+    Counters of the fitness computations of every species and of the herbivore sorts.
+
+    Every :class:`biosim.island.Island` has its own counters and activates them while
+    it runs, so islands running in different threads do not count each other's
+    operations. The animals read the active counters through their class attributes
+    ``fitness_counter`` and ``sort_counter``.
+
+    Attributes
+    ----------
+    fitness : dict
+        :class:`FitnessCounter` of every species, by species name.
+    sort : SortCounter
+        Counter of the herbivore sorts.
+    """
+
+    def __init__(self):
+        """Initializes all counters with zero counts."""
+        self.fitness = {'Herbivore': FitnessCounter(), 'Carnivore': FitnessCounter()}
+        self.sort = SortCounter()
+
+    def reset(self):
+        """Sets all counts to zero."""
+        for counter in self.fitness.values():
+            counter.reset()
+        self.sort.reset()
+
+    def fitness_counts(self):
+        """
+        Returns the fitness counts of every species.
+
+        Returns
+        -------
+        dict
+            :meth:`FitnessCounter.as_dict` of every species, by species name.
+        """
+        return {species: counter.as_dict() for species, counter in self.fitness.items()}
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        Makes these the active counters of the current thread inside a with statement.
+        """
+        token = active_counters.set(self)
+        try:
+            yield self
+        finally:
+            active_counters.reset(token)
+
+
+#: Counters used when no island is running, e.g. for animals and cells used on their own.
+class_counters = OperationCounters()
+
+
+class _ActiveFitnessCounter:
+    """
+    Class attribute giving the fitness counter of a species in the active counters.
+    """
+
+    def __get__(self, instance, owner):
+        counters = active_counters.get()
+        if counters is None:
+            counters = class_counters
+        return counters.fitness[owner.__name__]
+
+
+class _ActiveSortCounter:
+    """
+    Class attribute giving the sort counter in the active counters.
+    """
+
+    def __get__(self, instance, owner):
+        counters = active_counters.get()
+        if counters is None:
+            counters = class_counters
+        return counters.sort
+
+
+class SpeciesConstants:
+    r"""
+    The parameters of a species as plain attributes, together with constants
+    derived from them.
+
+    A new object is made every time the parameters of the species change,
+    so the hot methods of the animals can read attributes instead of looking up
+    and recomputing values from the parameter dictionary.
+
+    Derived constants:
+
+    - offspring_value, :math:`\zeta (w_{birth} + \sigma_{birth})`
+    - birth_mu and birth_sigma, the parameters of the log-normal birth weight
+    - a lookup table with the age factor of the fitness for integer ages
+    """
+
+    age_table_size = 100
+
+    def __init__(self, params, version=0):
+        """
+        Computes the derived constants from the parameters.
+
+        Parameters
+        ----------
+        params : dict
+            Parameters of the species.
+        version : int
+            Version of the parameters the constants are computed from.
+        """
+        self.version = version
+
+        self.w_birth = params['w_birth']
+        self.sigma_birth = params['sigma_birth']
+        self.beta = params['beta']
+        self.eta = params['eta']
+        self.a_half = params['a_half']
+        self.phi_age = params['phi_age']
+        self.w_half = params['w_half']
+        self.phi_weight = params['phi_weight']
+        self.mu = params['mu']
+        self.gamma = params['gamma']
+        self.zeta = params['zeta']
+        self.xi = params['xi']
+        self.omega = params['omega']
+        self.F = params['F']
+        self.delta_phi_max = params.get('DeltaPhiMax')
+
+        w_birth = self.w_birth
+        sigma_birth = self.sigma_birth
+        self.offspring_value = self.zeta * (w_birth + sigma_birth)
+        self.birth_mu = math.log(w_birth ** 2 / (math.sqrt(w_birth ** 2 + sigma_birth ** 2)))
+        self.birth_sigma = math.sqrt(math.log(1 + (sigma_birth ** 2 / w_birth ** 2)))
+
+        self._age_factor_array = None
+        self._age_factor_list = None
+        self._build_age_factors(self.age_table_size)
+
+    def _build_age_factors(self, num_ages):
+        r"""
+        Builds the lookup table with the age factor of the fitness,
+
+        .. math::
+            \frac{1}{1+e^{\phi_{age} \cdot (age - a_{half})}}
+
+        for ages 0 to num_ages - 1.
+
+        Parameters
+        ----------
+        num_ages : int
+            Number of ages in the table.
+        """
+        self._age_factor_array = expit(-self.phi_age * (np.arange(num_ages) - self.a_half))
+        self._age_factor_list = self._age_factor_array.tolist()
+
+    def age_factor(self, age):
+        """
+        Age factor of the fitness for one animal, read from the lookup table.
+        The table is extended when an animal gets older than the table.
+
+        Parameters
+        ----------
+        age : int
+            Age of the animal.
+
+        Returns
+        -------
+        float
+        """
+        try:
+            return self._age_factor_list[age]
+        except IndexError:
+            self._build_age_factors(max(2 * len(self._age_factor_list), age + 1))
+            return self._age_factor_list[age]
+        except TypeError:
+            # age is not an integer, so the table cannot be used
+            return 1 / (1 + math.exp(self.phi_age * (age - self.a_half)))
+
+    def age_factors(self, ages):
+        """
+        Age factors of the fitness for an array of animals, read from the lookup table.
+
+        Parameters
+        ----------
+        ages : numpy.ndarray
+            Integer ages of the animals.
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        ages = np.asarray(ages)
+        if ages.dtype.kind not in 'iu':
+            return expit(-self.phi_age * (ages - self.a_half))
+
+        if ages.size > 0 and ages.max() >= len(self._age_factor_array):
+            self._build_age_factors(2 * int(ages.max()) + 1)
+        return self._age_factor_array[ages]
+
+    def calc_fitness_batch(self, ages, weights):
+        r"""
+        Calculates the fitness of many animals in one call.
+
+        Uses the same formula as :meth:`Animal.calc_fitness`. The age factor is read
+        from the lookup table, and the weight factor uses the logistic function
+        :math:`expit(x) = 1/(1+e^{-x})` so that the whole array is handled at once.
+
+        Parameters
+        ----------
+        ages : array_like
+            Ages of the animals.
+        weights : array_like
+            Weights of the animals.
+
+        Returns
+        -------
+        numpy.ndarray
+            The fitness of every animal. Animals without weight have fitness 0.
+        """
+        weights = np.asarray(weights, dtype=float)
+
+        age_parameter = self.age_factors(ages)
+        weight_parameter = expit(self.phi_weight * (weights - self.w_half))
+        return np.where(weights <= 0, 0.0, age_parameter * weight_parameter)
+
+    def feeding_batch(self, num_animals, fodder):
+        """
+        Calculates how much fodder each of many grazing animals eats.
+
+        The animals eat one after the other, as with :meth:`Herbivore.feeding`:
+        each eats F, or what is left if that is less, until the fodder runs out.
+        The fodder left before each animal eats is a running subtraction of F,
+        computed with ``np.subtract.accumulate`` so the rounding is the same as
+        subtracting one animal at a time.
+
+        Parameters
+        ----------
+        num_animals : int
+            Number of animals, in the order they eat.
+        fodder : float
+            Fodder available.
+
+        Returns
+        -------
+        tuple
+            Array with the amount eaten by each animal that gets fodder, which are the
+            first animals in eating order, and the fodder left.
+        """
+        if num_animals == 0 or fodder <= 0:
+            return np.empty(0), fodder
+
+        if self.F > 0:
+            # at most this many animals get fodder
+            num_animals = min(num_animals, int(fodder // self.F) + 2)
+
+        steps = np.full(num_animals, self.F, dtype=float)
+        steps[0] = fodder
+        fodder_before = np.subtract.accumulate(steps)
+
+        num_fed = np.count_nonzero(fodder_before > 0)
+        fodder_before = fodder_before[:num_fed]
+        amount_eaten = np.where(fodder_before < self.F, fodder_before, self.F)
+
+        return amount_eaten, float(fodder_before[-1] - amount_eaten[-1])
+
+
+class _ActiveConstants:
+    """
+    Class attribute giving the constants of a species, see :meth:`Animal.get_constants`.
+    """
+
+    def __get__(self, instance, owner):
+        # the active set is checked here too, saving a call in the hot methods
+        parameters = active_parameters.get()
+        if parameters is not None:
+            return parameters.constants[owner.__name__]
+        return owner.get_constants()
 
 
 class Animal:
     """
     A complete lifecycle to an animal on the island.
     """
+    # Only these attributes are stored per animal, everything else is at the class level
+    __slots__ = ('loc', 'species', '_age', '_weight', '_fitness', 'alive')
+
     # These parameters are defined at the class level
 
     default_parameters = {'w_birth': None, 'sigma_birth': None,
@@ -21,10 +392,29 @@ class Animal:
 
     params = default_parameters.copy()
 
+    # Counters of the island running in the current thread, see OperationCounters
+    fitness_counter = _ActiveFitnessCounter()
+
+    # If True, end_of_year() returns the survivors by ascending fitness
+    keeps_fitness_order = False
+
+    # Constants derived from params, replaced by set_parameters()
+    _params_version = 0
+    _class_constants = None
+
+    # Constants of the active parameter set, or of params if no set is active
+    _constants = _ActiveConstants()
+
+    def __init_subclass__(cls, **kwargs):
+        """Gives every species its own version counter and derived constants."""
+        super().__init_subclass__(**kwargs)
+        cls._params_version = 0
+        cls._class_constants = SpeciesConstants(cls.params, cls._params_version)
+
     @classmethod
-    def set_parameters(cls, new_parameters):
+    def check_parameters(cls, new_parameters):
         """
-        Set adjusted parameters from user for the animal class.
+        Checks new parameters for the animal class without setting them.
 
         Parameters
         ----------
@@ -79,22 +469,89 @@ class Animal:
                 raise ValueError('All parameters must be positive numbers')
             elif not new_parameters[key] >= 0:
                 raise ValueError('All parameters must be positive numbers')
-            else:
-                cls.params[key] = new_parameters[key]
 
         # DeltaPhiMax must be strictly positive
         if 'DeltaPhiMax' in new_parameters:
             if not new_parameters['DeltaPhiMax'] > 0:
                 raise ValueError('DeltaPhiMax must be strictly positive')
-            else:
-                cls.params["DeltaPhiMax"] = new_parameters['DeltaPhiMax']
 
         # Eta must be less than 1
         if 'eta' in new_parameters:
             if new_parameters['eta'] >= 1:
                 raise ValueError('eta must be less than 1')
-            else:
-                cls.params["eta"] = new_parameters['eta']
+
+    @classmethod
+    def set_parameters(cls, new_parameters):
+        """
+        Set adjusted parameters from user for the animal class.
+
+        These class-level parameters are used when no parameter set is active,
+        and are the starting point of new simulations, see
+        :meth:`biosim.parameters.ParameterSet.from_classes`.
+
+        Parameters
+        ----------
+        new_parameters : dict
+            Legal keys, see :meth:`check_parameters`.
+
+        Raises
+        ------
+        ValueError
+            If any of the parameters are invalid.
+        """
+        cls.check_parameters(new_parameters)
+
+        # All parameters are valid, change them and the derived constants together
+        cls.params.update(new_parameters)
+        cls._params_version += 1
+        if cls._class_constants is not None:
+            cls._class_constants = SpeciesConstants(cls.params, cls._params_version)
+
+    @classmethod
+    def get_constants(cls):
+        """
+        Get the constants derived from the current parameters of the species.
+
+        If a parameter set is active in this thread, see
+        :meth:`biosim.parameters.ParameterSet.activate`, its constants are returned.
+        Otherwise the constants of the class-level parameters are returned, which are
+        recomputed if the parameters have changed since they were made, tracked with
+        a version number.
+
+        Returns
+        -------
+        SpeciesConstants
+        """
+        parameters = active_parameters.get()
+        if parameters is not None:
+            return parameters.constants[cls.__name__]
+
+        if cls._class_constants.version != cls._params_version:
+            cls._class_constants = SpeciesConstants(cls.params, cls._params_version)
+        return cls._class_constants
+
+    @classmethod
+    def age_factor(cls, age):
+        """
+        Age factor of the fitness for one animal, see :meth:`SpeciesConstants.age_factor`.
+        """
+        return cls._constants.age_factor(age)
+
+    @classmethod
+    def age_factors(cls, ages):
+        """
+        Age factors of the fitness for an array of animals,
+        see :meth:`SpeciesConstants.age_factors`.
+        """
+        return cls._constants.age_factors(ages)
+
+    @classmethod
+    def calc_fitness_batch(cls, ages, weights):
+        """
+        Calculates the fitness of many animals in one call,
+        see :meth:`SpeciesConstants.calc_fitness_batch`.
+        """
+        return cls._constants.calc_fitness_batch(ages, weights)
 
     @classmethod
     def get_parameters(cls):
@@ -110,16 +567,199 @@ class Animal:
 
     def __init__(self, row, loc):
         """Create an animal with attributes from row and loc."""
-        self.row = row
         self.loc = loc
-        self.species = self.row["species"]
-        self.age = self.row["age"]
-        self.weight = self.row["weight"]
-        self.fitness = self.calc_fitness()
+        self.species = row["species"]
+        self._age = row["age"]
+        self._weight = row["weight"]
+        self._fitness = None
         self.alive = True
-        self.newborn = None
 
-    def procreation(self, animal_in_pos):
+    @property
+    def age(self):
+        """Age of the animal. Changing it invalidates the fitness."""
+        return self._age
+
+    @age.setter
+    def age(self, value):
+        self._age = value
+        self._invalidate_fitness()
+
+    @property
+    def weight(self):
+        """Weight of the animal. Changing it invalidates the fitness."""
+        return self._weight
+
+    @weight.setter
+    def weight(self, value):
+        self._weight = value
+        self._invalidate_fitness()
+
+    @property
+    def fitness(self):
+        """
+        Fitness of the animal.
+
+        The fitness is computed lazily: it is only recomputed when it is read
+        after the age or weight has changed.
+        """
+        if self._fitness is None:
+            self._fitness = self.calc_fitness()
+            self.fitness_counter.recomputed += 1
+        return self._fitness
+
+    @fitness.setter
+    def fitness(self, value):
+        self._fitness = value
+
+    def _invalidate_fitness(self):
+        """
+        Marks the fitness as outdated, so it is recomputed the next time it is read.
+        """
+        self._fitness = None
+        self.fitness_counter.invalidated += 1
+
+    @classmethod
+    def end_of_year(cls, animals, rng=None):
+        """
+        Ages, reduces the weight of and draws death for many animals of one species.
+
+        Gives the same result as calling :meth:`aging`, then :meth:`loss_of_weight`
+        for every animal with the fitness updated in bulk, and then :meth:`death` for
+        every animal. Ages, weights and fitness are computed for all animals at once,
+        and the death draws are made in the same order, from the same random numbers.
+
+        If the species keeps_fitness_order, as herbivores do, the survivors are put in
+        ascending order of their new fitness with a stable sort of the fitness array,
+        see :meth:`Herbivore.sort_by_fitness`.
+
+        The fitness is never invalidated here, as ages, weights and fitness are all
+        set at once, so nothing is added to fitness_counter.
+
+        Parameters
+        ----------
+        animals : list
+            Animal objects of this species.
+        rng : biosim.rng.BufferedGenerator or None
+            Random number generator, :data:`biosim.rng.default_generator` if None.
+
+        Returns
+        -------
+        list
+            The animals that survive.
+        """
+        if rng is None:
+            rng = _rng.default_generator
+
+        num_animals = len(animals)
+        if num_animals == 0:
+            return []
+
+        constants = cls.get_constants()
+        ages = np.fromiter((animal._age for animal in animals), int, num_animals) + 1
+        weights = np.fromiter((animal._weight for animal in animals), float, num_animals)
+        weights -= constants.eta * weights
+        fitness = constants.calc_fitness_batch(ages, weights)
+        probability_of_death = constants.omega * (1 - fitness)
+
+        uniform = rng.next_uniform
+        survivors = []
+        kept = []
+        for index, animal, age, weight, new_fitness, probability in zip(
+                range(num_animals), animals, ages.tolist(), weights.tolist(), fitness.tolist(),
+                probability_of_death.tolist()):
+            animal._age = age
+            animal._weight = weight
+            animal._fitness = new_fitness
+            if weight <= 0 or uniform() < probability:
+                animal.alive = False
+            else:
+                survivors.append(animal)
+                kept.append(index)
+
+        if cls.keeps_fitness_order and len(survivors) > 1:
+            start = time.perf_counter()
+            order = np.argsort(fitness[kept], kind='stable')
+            survivors = [survivors[i] for i in order.tolist()]
+            cls.sort_counter.seconds += time.perf_counter() - start
+
+        return survivors
+
+    @classmethod
+    def newborns(cls, weights, loc):
+        """
+        Creates newborn animals of age 0 without going through an info dictionary.
+
+        Used by :meth:`biosim.cell.Cell_with_animals.add_newborns` to add all
+        newborns of a cell at once. Their fitness is computed in one call to
+        :meth:`calc_fitness_batch`, as it is read when the herbivores are sorted.
+
+        Parameters
+        ----------
+        weights : array_like
+            Weights of the newborns.
+        loc : tuple
+            Location of the newborns.
+
+        Returns
+        -------
+        list
+            New animal objects.
+        """
+        species = cls.__name__
+        weights = np.asarray(weights, dtype=float)
+        fitness = cls.calc_fitness_batch(np.zeros(len(weights), dtype=int), weights)
+        cls.fitness_counter.recomputed += len(weights)
+
+        newborns = []
+        for weight, newborn_fitness in zip(weights.tolist(), fitness.tolist()):
+            newborn = cls.__new__(cls)
+            newborn.loc = loc
+            newborn.species = species
+            newborn._age = 0
+            newborn._weight = weight
+            newborn._fitness = newborn_fitness
+            newborn.alive = True
+            newborns.append(newborn)
+        return newborns
+
+    @classmethod
+    def from_arrays(cls, ages, weights, fitness, alive, loc):
+        """
+        Recreates animals from arrays, e.g. read from a checkpoint.
+
+        Parameters
+        ----------
+        ages : numpy.ndarray
+            Ages of the animals.
+        weights : numpy.ndarray
+            Weights of the animals.
+        fitness : numpy.ndarray
+            Fitness of the animals, NaN where it is not computed yet.
+        alive : numpy.ndarray
+            True for the animals that are alive.
+        loc : tuple
+            Location of the animals.
+
+        Returns
+        -------
+        list
+            New animal objects, in the order of the arrays.
+        """
+        species = cls.__name__
+        animals = []
+        for age, weight, animal_fitness, animal_alive in zip(
+                ages.tolist(), weights.tolist(), fitness.tolist(), alive.tolist()):
+            animal = cls.__new__(cls)
+            animal.loc = loc
+            animal.species = species
+            animal._age = age
+            animal._weight = weight
+            animal._fitness = None if math.isnan(animal_fitness) else animal_fitness
+            animal.alive = animal_alive
+            animals.append(animal)
+        return animals
+
+    def procreation(self, animal_in_pos, rng=None):
         r"""
         Methods checks if the animal can give birth to a new animal.
         Bellow is the steps taken by the method:
@@ -127,8 +767,7 @@ class Animal:
         - If the offspring value is less than the weight of the animal, the animal can give birth.
         - If the animal can give birth, the probability of procreation is calculated.
         - If the animal procreates, the weight of the newborn is calculated.
-        - Newborn weight is subtracted from the parent.
-        - The fitness of the parent is updated.
+        - Newborn weight is subtracted from the parent, which invalidates its fitness.
         - A newborn object is added to the list of newborns.
 
 
@@ -136,6 +775,8 @@ class Animal:
         ----------
         animal_in_pos : int
             Number of animals in the same position as the animal.
+        rng : biosim.rng.BufferedGenerator or None
+            Random number generator, :data:`biosim.rng.default_generator` if None.
 
         Returns
         -------
@@ -156,8 +797,8 @@ class Animal:
 
             Where :math:`N_{same}` is the number of animals in the same position as the animal.
 
-            The weight of the newborn is calculated by a log-normal distribution from the python
-            ``random.lognormvariate(mu, sigma)``.
+            The weight of the newborn is calculated by a log-normal distribution,
+            ``rng.lognormal(mu, sigma)``.
             Below is a figure of the log-normal distribution, and formulas for
             calculating the parameters mu and sigma.
 
@@ -173,32 +814,25 @@ class Animal:
 
                 Source: https://en.wikipedia.org/wiki/Log-normal_distribution
         """
-        # Initialize variables
-        self.newborn = None
-        zeta = self.params["zeta"]
-        w_birth = self.params["w_birth"]
-        sigma_birth = self.params["sigma_birth"]
-        gamma = self.params["gamma"]
-        xi = self.params["xi"]
+        if rng is None:
+            rng = _rng.default_generator
+
+        # Offspring value, mu and sigma are computed once per parameter change,
+        # see SpeciesConstants
+        constants = self._constants
 
         # Calculate probability of procreation
-        offspring_value = zeta * (w_birth + sigma_birth)
-        if self.weight >= offspring_value:
-            probability_of_procreation = min(1, gamma * self.fitness * animal_in_pos)
+        if self.weight >= constants.offspring_value:
+            probability_of_procreation = min(1, constants.gamma * self.fitness * animal_in_pos)
 
-            if random.random() < probability_of_procreation:
+            if rng.random() < probability_of_procreation:
                 # Calculate weight of newborn
-                mu = math.log(w_birth ** 2 / (
-                    math.sqrt(w_birth ** 2 + sigma_birth ** 2)))
-                sigma = math.sqrt(math.log(1 + (sigma_birth ** 2 / w_birth ** 2)))
-                newborn_weight = random.lognormvariate(mu, sigma)
+                newborn_weight = rng.lognormal(constants.birth_mu, constants.birth_sigma)
 
                 # Check if parent has enough weight to give birth
-                parent_loss = xi * newborn_weight
+                parent_loss = constants.xi * newborn_weight
                 if self.weight > parent_loss:
                     self.weight -= parent_loss
-                    self.newborn = True
-                    self._update_fitness()
                     newborn_info = {"species": self.species, "age": 0, "weight": newborn_weight}
                     return type(self)(newborn_info, self.loc)
 
@@ -230,37 +864,40 @@ class Animal:
             :math:`a_{half}` and :math:`w_{half}` are parameters given by the user.
             :math:`age` and :math:`weight` are the age and weight of the animal.
             :math:`\phi` is the fitness of the animal.
+
+            The age factor only depends on the integer age, so it is read from a
+            lookup table, see :meth:`age_factor`.
         """
-        if self.weight <= 0:
+        weight = self._weight
+        if weight <= 0:
             return 0
         else:
-            phi_weight = self.params["phi_weight"]
-            phi_age = self.params["phi_age"]
-            a_half = self.params["a_half"]
-            w_half = self.params["w_half"]
+            constants = self._constants
+
+            phi_weight = constants.phi_weight
+            w_half = constants.w_half
 
-            age_parameter = 1 / (1 + math.exp(phi_age * (self.age - a_half)))
-            weight_parameter = 1 / (1 + math.exp(-phi_weight * (self.weight - w_half)))
+            age_parameter = constants.age_factor(self._age)
+            weight_parameter = 1 / (1 + math.exp(-phi_weight * (weight - w_half)))
             return age_parameter * weight_parameter
 
     def _update_fitness(self):
         """
-        Updates the fitness of the animal.
+        Updates the fitness of the animal right away.
         """
-        self.fitness = self.calc_fitness()
+        self._fitness = self.calc_fitness()
+        self.fitness_counter.recomputed += 1
 
     def aging(self):
         """
-        Methods that ages animals by one year.
-        Fitness of the animal is updated in next method loss_of_weight(). This
-        makes the code more efficient.
+        Methods that ages animals by one year. This invalidates the fitness.
         """
         self.age += 1
 
     def loss_of_weight(self):
         r"""
         Methods that makes the animal lose weight. Since animals lose weight,
-        the fitness of the animal is updated.
+        the fitness of the animal is invalidated.
         Animal loses an amount of weight given by the following formula:
 
         .. math::
@@ -268,10 +905,9 @@ class Animal:
 
         Where eta, :math:`\eta`, is a default parameter or parameter given by the user.
         """
-        self.weight -= self.params["eta"] * self.weight
-        self._update_fitness()
+        self.weight -= self._constants.eta * self.weight
 
-    def death(self):
+    def death(self, rng=None):
         r"""
         Methods sets the animal to dead if the animals weight is below zero or
         if the animal dies by a probability of death.
@@ -283,16 +919,24 @@ class Animal:
 
         Where omega, :math:`\omega`, is a default parameter or given by the user.
         Fitness, :math:`\phi`, is the fitness of the animal.
+
+        Parameters
+        ----------
+        rng : biosim.rng.BufferedGenerator or None
+            Random number generator, :data:`biosim.rng.default_generator` if None.
         """
-        probability_of_death = self.params["omega"] * (1 - self.fitness)
+        if rng is None:
+            rng = _rng.default_generator
+
+        probability_of_death = self._constants.omega * (1 - self.fitness)
         if self.weight <= 0:
             self.alive = False
-        elif random.random() < probability_of_death:
+        elif rng.random() < probability_of_death:
             self.alive = False
         else:
             pass
 
-    def migrate(self):
+    def migrate(self, rng=None):
         r"""
         Methods checks if the animal migrates or not. With a higher
         fitness the probability of migration increases.
@@ -305,13 +949,21 @@ class Animal:
         Where mu, :math:`\mu`, is a default parameter or given by the user.
         Fitness, :math:`\phi`, is the fitness of the animal.
 
+        Parameters
+        ----------
+        rng : biosim.rng.BufferedGenerator or None
+            Random number generator, :data:`biosim.rng.default_generator` if None.
+
         Returns
         -------
         bool
             True if the animal migrates, False if the animal does not migrate.
         """
-        probability_of_migration = self.params["mu"] * self.fitness
-        if random.random() < probability_of_migration:
+        if rng is None:
+            rng = _rng.default_generator
+
+        probability_of_migration = self._constants.mu * self.fitness
+        if rng.random() < probability_of_migration:
             return True
         else:
             return False
@@ -321,6 +973,8 @@ class Herbivore(Animal):
     """
     Herbivores depends on the amount of food available to survive and reproduce.
     """
+    __slots__ = ()
+
     default_parameters = {'w_birth': 8.0, 'sigma_birth': 1.5,
                           'beta': 0.9, 'eta': 0.05, 'a_half': 40.0,
                           'phi_age': 0.6, 'w_half': 10.0,
@@ -329,12 +983,87 @@ class Herbivore(Animal):
                           'omega': 0.4, 'F': 10.0}
 
     params = default_parameters.copy()
+    sort_counter = _ActiveSortCounter()
+    keeps_fitness_order = True
+
+    @classmethod
+    def sort_by_fitness(cls, herbivores):
+        """
+        Sorts a list of herbivores in place by ascending fitness.
+
+        The herbivores of a cell are kept in this order from year to year: the
+        survivors are put back in fitness order at the end of the year, see
+        :meth:`Animal.end_of_year`, and the parents are moved behind the other
+        herbivores when they give birth, see
+        :meth:`biosim.cell.Cell_with_animals.add_newborns`. The list is therefore a
+        sorted front followed by a short tail of parents, newborns and immigrants.
+        The list sort finds the front as one run, sorts the tail and merges it into
+        the front, comparing the stored fitness values.
+
+        Herbivores with equal fitness keep their order in the list, as the sort is
+        stable. The time spent is recorded in sort_counter.
+
+        Parameters
+        ----------
+        herbivores : list
+            Herbivore objects.
+        """
+        start = time.perf_counter()
+        unsorted = herbivores[:]
+        try:
+            herbivores.sort(key=_fitness_key)
+        except TypeError:
+            # some fitness values are outdated, so they are computed while sorting
+            herbivores[:] = unsorted
+            herbivores.sort(key=attrgetter('fitness'))
+
+        cls.sort_counter.sorts += 1
+        cls.sort_counter.animals += len(herbivores)
+        cls.sort_counter.seconds += time.perf_counter() - start
+
+    @classmethod
+    def merge_by_fitness(cls, herbivores, num_sorted):
+        """
+        Merges the herbivores after the first num_sorted in place into the first ones.
+
+        Used after grazing, when the fed herbivores have gained weight and the unfed
+        ones are still in order. The tail is sorted on its own and merged into the
+        front, so the result is the same as a stable sort of the whole list, without
+        sorting the herbivores again. The herbivores in the tail and the time spent
+        are recorded in sort_counter.
+
+        Parameters
+        ----------
+        herbivores : list
+            Herbivore objects, with up to date fitness.
+        num_sorted : int
+            Number of herbivores at the front in ascending order of fitness.
+        """
+        start = time.perf_counter()
+        tail = herbivores[num_sorted:]
+        tail.sort(key=_fitness_key)
+        if num_sorted and tail and tail[0]._fitness < herbivores[num_sorted - 1]._fitness:
+            herbivores[:] = heapq.merge(herbivores[:num_sorted], tail, key=_fitness_key)
+        else:
+            # the fed herbivores are usually all fitter than the unfed ones
+            herbivores[num_sorted:] = tail
+
+        cls.sort_counter.animals += len(tail)
+        cls.sort_counter.seconds += time.perf_counter() - start
+
+    @classmethod
+    def feeding_batch(cls, num_animals, fodder):
+        """
+        Calculates how much fodder each of many herbivores eats,
+        see :meth:`SpeciesConstants.feeding_batch`.
+        """
+        return cls._constants.feeding_batch(num_animals, fodder)
 
     def feeding(self, fodder):
         """
         Feeding method for planteating animals, herbivores. Herbivore eats the amount
         of fodder given, or the maximum amount of fodder it can eat. After eating the animal
-        gains weight and the fitness is updated.
+        gains weight and the fitness is invalidated.
 
         Parameters
         ----------
@@ -346,14 +1075,14 @@ class Herbivore(Animal):
         amount_eaten : float
             The amount of fodder eaten by the animal.
         """
-        if fodder < self.params["F"]:
+        constants = self._constants
+        if fodder < constants.F:
             amount_eaten = fodder
         else:
-            amount_eaten = self.params["F"]
+            amount_eaten = constants.F
 
         # Add weight and update fitness
-        self.weight += (amount_eaten * self.params["beta"])
-        self._update_fitness()
+        self.weight += (amount_eaten * constants.beta)
         return amount_eaten
 
 
@@ -361,6 +1090,8 @@ class Carnivore(Animal):
     """
     Carnivores depends on the availability of prey to survive and reproduce.
     """
+    __slots__ = ()
+
     default_parameters = {'w_birth': 6.0, 'sigma_birth': 1.0,
                           'beta': 0.75, 'eta': 0.125, 'a_half': 40.0,
                           'phi_age': 0.3, 'w_half': 4.0,
@@ -370,45 +1101,185 @@ class Carnivore(Animal):
 
     params = default_parameters.copy()
 
-    def feeding(self, sorted_lowest_fitness_herbivore):
+    def feeding(self, prey, rng=None):
         """
         Feeding method for predators, carnivores.
 
         - Carnivore tries to kill, with a probability, the weakest herbivore until it's full.
-        - After eating one animal it gains weight and the fitness is updated.
+        - After eating one animal it gains weight, and the fitness is recomputed
+          before the next herbivore is tried.
         - If an animal is killed, the object variable "alive" is set to False.
-        - Carnivore continues to kill until it has tried to kill all Herbivores in the cell.
+        - Carnivore continues to kill until it has tried to kill all Herbivores in the cell
+          with a fitness not higher than its own. The kill probability of the others is zero,
+          so they are skipped by a binary search in the sorted fitness list.
 
 
         Parameters
         ----------
-        sorted_lowest_fitness_herbivore : list
-            List of herbivores sorted by lowest fitness.
+        prey : Prey or list
+            Herbivores in the cell. A list is sorted and wrapped in a Prey object.
+        rng : biosim.rng.BufferedGenerator or None
+            Random number generator, :data:`biosim.rng.default_generator` if None.
         """
-        delta_phi_max = self.params["DeltaPhiMax"]
+        if rng is None:
+            rng = _rng.default_generator
+
+        if not isinstance(prey, Prey):
+            prey = Prey(sorted(prey, key=attrgetter('fitness')))
+
+        constants = self._constants
+        delta_phi_max = constants.delta_phi_max
+        appetite = constants.F
         amount_eaten = 0
 
-        # loop over all herbivores in the cell and eats them if the conditions are met.
-        for herbivore in sorted_lowest_fitness_herbivore:
-            if amount_eaten >= self.params["F"]:
-                break
+        fitness = self.fitness
+        limit = prey.limit(fitness)
+        index = prey.next_alive(0)
+        uniform = rng.next_uniform
 
-            diff_fitness = self.fitness - herbivore.fitness
-            if diff_fitness < 0:
-                probability_of_killing = 0
-            elif 0 < diff_fitness < delta_phi_max:
-                probability_of_killing = (self.fitness - herbivore.fitness) / delta_phi_max
+        # loop over the herbivores the carnivore can kill and eat them if the conditions are met.
+        while index < limit and amount_eaten < appetite:
+            diff_fitness = fitness - prey.fitness[index]
+            if 0 < diff_fitness < delta_phi_max:
+                probability_of_killing = diff_fitness / delta_phi_max
             else:
                 probability_of_killing = 1
 
-            if random.random() < probability_of_killing:
-                desired_food = self.params["F"] - amount_eaten
+            if uniform() < probability_of_killing:
+                herbivore = prey.herbivores[index]
+                desired_food = appetite - amount_eaten
                 if herbivore.weight > desired_food:
                     eating = desired_food
                 else:
                     eating = herbivore.weight
 
-                self.weight += eating * self.params["beta"]
-                herbivore.alive = False
-                self._update_fitness()
+                self.weight += eating * constants.beta
+                prey.kill(index)
                 amount_eaten += eating
+
+                fitness = self.fitness
+                limit = prey.limit(fitness)
+
+            index = prey.next_alive(index + 1)
+
+
+class SortedPrey:
+    """
+    Fitness of the prey in one cell, sorted ascending, with the killed prey skipped.
+
+    Killed prey are not removed. They are marked dead and skipped with a table
+    pointing to the next prey that may be alive, so every carnivore only visits
+    living prey. The prey are compacted once, after all carnivores in the cell have
+    eaten. Used directly by the array engine, see
+    :meth:`biosim.population.Population.hunting`.
+    """
+    __slots__ = ('fitness', '_next_alive')
+
+    def __init__(self, fitness, alive):
+        """
+        Parameters
+        ----------
+        fitness : list
+            Fitness of the prey in ascending order.
+        alive : list
+            True for the prey that are alive, the others are skipped.
+        """
+        self.fitness = fitness
+        self._next_alive = [i if is_alive else i + 1 for i, is_alive in enumerate(alive)]
+        self._next_alive.append(len(fitness))
+
+    def __len__(self):
+        return len(self.fitness)
+
+    def limit(self, fitness):
+        """
+        Number of prey with a fitness not higher than the given fitness.
+
+        Parameters
+        ----------
+        fitness : float
+            Fitness of the carnivore.
+
+        Returns
+        -------
+        int
+            Index of the first prey the carnivore cannot kill.
+        """
+        return bisect_right(self.fitness, fitness)
+
+    def next_alive(self, index):
+        """
+        Finds the first living prey at or after index.
+
+        Parameters
+        ----------
+        index : int
+            Index to start from.
+
+        Returns
+        -------
+        int
+            Index of the living prey, or the number of prey if there is none.
+        """
+        next_alive = self._next_alive
+        while next_alive[index] != index:
+            # point past the dead prey, so they are only walked once
+            next_alive[index] = next_alive[next_alive[index]]
+            index = next_alive[index]
+        return index
+
+    def kill(self, index):
+        """
+        Marks the prey at index as dead.
+
+        Parameters
+        ----------
+        index : int
+            Index of the prey.
+        """
+        self._next_alive[index] = index + 1
+
+
+class Prey(SortedPrey):
+    """
+    Herbivores hunted by the carnivores in one cell, sorted by ascending fitness.
+
+    The herbivores are compacted with :meth:`survivors`, see :class:`SortedPrey`.
+    """
+    __slots__ = ('herbivores',)
+
+    def __init__(self, herbivores):
+        """
+        Reads the fitness of the herbivores and marks the dead ones as skipped.
+
+        Parameters
+        ----------
+        herbivores : list
+            Herbivore objects sorted by ascending fitness.
+        """
+        self.herbivores = herbivores
+        super().__init__([herbivore.fitness for herbivore in herbivores],
+                         [herbivore.alive for herbivore in herbivores])
+
+    def kill(self, index):
+        """
+        Marks the herbivore at index as dead.
+
+        Parameters
+        ----------
+        index : int
+            Index of the herbivore.
+        """
+        self.herbivores[index].alive = False
+        self._next_alive[index] = index + 1
+
+    def survivors(self):
+        """
+        Returns the living herbivores in order of ascending fitness.
+
+        Returns
+        -------
+        list
+            Living herbivore objects.
+        """
+        return [herbivore for herbivore in self.herbivores if herbivore.alive]
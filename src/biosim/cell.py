@@ -1,8 +1,10 @@
 """Implements diffrent characteristics of cells."""
 
-from .animals import Herbivore, Carnivore
+from .animals import Herbivore, Carnivore, Prey, active_parameters
+from . import rng as _rng
 
-import random
+import numpy as np
+from itertools import compress
 
 
 class Cell:
@@ -10,6 +12,8 @@ class Cell:
     Cell characteristics for cells without animals.
     The cell can have a type, color and if it is habitable or not.
     """
+    __slots__ = ('location',)
+
     type = None
     color = None
     _habitable = False
@@ -78,7 +82,10 @@ class Cell_with_animals(Cell):
     Cell characteristics for cells with animals.
     This is a subclass of Cell.
     """
+    __slots__ = ('fauna',)
+
     _habitable = True
+    species = {'Herbivore': Herbivore, 'Carnivore': Carnivore}
 
     def __init__(self, location):
         """
@@ -91,9 +98,6 @@ class Cell_with_animals(Cell):
         """
         super().__init__(location)
         self.fauna = {'Herbivore': [], 'Carnivore': []}
-        self.cell_pop_history = {'Herbivore': [], 'Carnivore': []}
-
-        self.species = {'Herbivore': Herbivore, 'Carnivore': Carnivore}
 
     @property
     def animals(self):
@@ -119,7 +123,26 @@ class Cell_with_animals(Cell):
         ValueError
             Animal species, age or weight is invalid.
         """
+        self.check_animal_info(animal_info)
+
+        new_animal = self.species[animal_info["species"]](animal_info, self.location)
+        self.fauna[animal_info["species"]].append(new_animal)
+
+    @staticmethod
+    def check_animal_info(animal_info):
+        """
+        Raises an error if animal dictionary keys has invalid type of species, age or weight.
 
+        Parameters
+        ----------
+        animal_info : dict
+            Dictionary with information about the animal.
+
+        Raises
+        -------
+        ValueError
+            Animal species, age or weight is invalid.
+        """
         valid_keys = ["species", "age", "weight"]
 
         for key, value in animal_info.items():
@@ -132,9 +155,6 @@ class Cell_with_animals(Cell):
             if key == "weight" and value <= 0:
                 raise ValueError(f"Invalid weight: {value}. Weight must be a positive number")
 
-        new_animal = self.species[animal_info["species"]](animal_info, self.location)
-        self.fauna[animal_info["species"]].append(new_animal)
-
     def add_animal_object(self, animal):
         """
         If an animal object is valid, it is added to the cell.
@@ -169,53 +189,199 @@ class Cell_with_animals(Cell):
         animal_species = animal.species
         self.fauna[animal_species].remove(animal)
 
-    def _sort_herbivore_after_fitness(self, descending=True):
+    def remove_animals(self, animals):
+        """
+        Removes many animal objects from the cell.
+
+        Each species list is rebuilt once, so removing k animals from a cell with
+        n animals costs O(n + k) instead of O(k n) with :meth:`remove_animal`.
+
+        Parameters
+        ----------
+        animals : list
+            Animal objects in the cell.
+        """
+        removed = {id(animal) for animal in animals}
+        for species, animal_list in self.fauna.items():
+            self.fauna[species] = [animal for animal in animal_list if id(animal) not in removed]
+
+    def _update_fitness_in_bulk(self, species, animal_list):
         """
-        Sorts herbivores after fitness
+        Updates the fitness of many animals of one species with one call to
+        calc_fitness_batch(), instead of one call to calc_fitness() per animal.
+
         Parameters
         ----------
-        self
-        descending=True
+        species : str
+            Species of the animals.
+        animal_list : list
+            Animal objects.
+        """
+        if not animal_list:
+            return
+
+        num_animals = len(animal_list)
+        ages = np.fromiter((animal.age for animal in animal_list), int, num_animals)
+        weights = np.fromiter((animal.weight for animal in animal_list), float, num_animals)
+        fitness = self.species[species].get_constants().calc_fitness_batch(ages, weights)
 
+        for animal, new_fitness in zip(animal_list, fitness.tolist()):
+            animal.fitness = new_fitness
+        self.species[species].fitness_counter.recomputed += num_animals
+
+    def _sort_herbivore_after_fitness(self):
+        """
+        Sorts herbivores after ascending fitness.
+
+        The herbivores are kept in this order, so grazing iterates the list in reverse
+        and predation iterates it forwards, see :meth:`biosim.animals.Herbivore.sort_by_fitness`.
         """
-        self.fauna["Herbivore"].sort(key=lambda animal: animal.fitness, reverse=descending)
+        Herbivore.sort_by_fitness(self.fauna["Herbivore"])
 
     # Annual cycle methods
-    def add_newborns(self):
+    def add_newborns(self, rng=None):
         """
         Check if any animals will give birth, and adds newborns to the cell.
-        The method sends the number of animals in the cell to the procreation method,
-        and it returns a newborn object.
+
+        Births are drawn for all animals of a species at once, following the rules
+        of :meth:`biosim.animals.Animal.procreation`: the probabilities are computed
+        from the number of animals at the start of the step, the birth and newborn
+        weight draws are made with one call each, and all newborns are
+        appended to the cell in one go.
+
+        Parameters
+        ----------
+        rng : biosim.rng.BufferedGenerator or None
+            Random number generator, :data:`biosim.rng.default_generator` if None.
         """
+        if rng is None:
+            rng = _rng.default_generator
 
         for species, animal_list in self.fauna.items():
-            for animal in animal_list:
-                newborn = animal.procreation(len(animal_list))
-                if newborn is not None:
-                    self.fauna[species].append(newborn)
+            num_animals = len(animal_list)
+            if num_animals == 0:
+                continue
+
+            animal_class = self.species[species]
+            constants = animal_class.get_constants()
+
+            # fitness is still valid from the bulk update after last year's weight loss
+            fitness = np.fromiter((animal.fitness for animal in animal_list), float, num_animals)
+            weights = np.fromiter((animal.weight for animal in animal_list), float, num_animals)
+
+            probability = np.minimum(1, constants.gamma * fitness * num_animals)
+            gives_birth = ((weights >= constants.offspring_value)
+                           & (rng.random(num_animals) < probability))
+
+            parents = np.flatnonzero(gives_birth)
+            if len(parents) == 0:
+                continue
+
+            newborn_weights = rng.lognormal(constants.birth_mu, constants.birth_sigma,
+                                            len(parents))
+
+            # parents must be heavier than the weight they lose
+            parent_loss = constants.xi * newborn_weights
+            enough_weight = weights[parents] > parent_loss
+            parents = parents[enough_weight]
+            newborn_weights = newborn_weights[enough_weight]
+            weights[parents] -= parent_loss[enough_weight]
+
+            parent_list = [animal_list[i] for i in parents.tolist()]
+            for animal, new_weight in zip(parent_list, weights[parents].tolist()):
+                animal.weight = new_weight
+            self._update_fitness_in_bulk(species, parent_list)
+
+            if animal_class.keeps_fitness_order:
+                # the parents have lost fitness, so they are moved behind the others
+                # and sorted in with the newborns, see Herbivore.sort_by_fitness
+                others = np.ones(num_animals, dtype=bool)
+                others[parents] = False
+                animal_list[:] = list(compress(animal_list, others.tolist())) + parent_list
+
+            animal_list.extend(animal_class.newborns(newborn_weights, self.location))
 
-    def feed_animals(self):
+    def feed_animals(self, rng=None):
         """
-        Feeding method for predators, Carnivores, in a cell. A random Carnivore eats the
-        Herbivores with the lowest fitness first. Method calls the feeding method in the
-        Carnivore class. And removes dead animals from the cell.
+        Feeding method for all animals in a cell.
+
+        The herbivores are sorted by ascending fitness once, then they graze, see
+        :meth:`Cell_with_fodder.graze`. A random Carnivore eats the Herbivores with
+        the lowest fitness first. Method calls the feeding method in the Carnivore
+        class. And removes dead animals from the cell, once all Carnivores have eaten.
+
+        Parameters
+        ----------
+        rng : biosim.rng.BufferedGenerator or None
+            Random number generator, :data:`biosim.rng.default_generator` if None.
         """
-        # skip if there is no herbivores in the cell
-        if self.count_herbivore > 0:
-            self._sort_herbivore_after_fitness(descending=False)
-            random.shuffle(self.fauna["Carnivore"])
+        if rng is None:
+            rng = _rng.default_generator
+
+        self._sort_herbivore_after_fitness()
+        self.graze()
+
+        # skip if there is no herbivores or carnivores in the cell
+        if self.count_herbivore > 0 and self.count_carnivore > 0:
+            prey = Prey(self.fauna["Herbivore"])
+            rng.shuffle(self.fauna["Carnivore"])
             for animal in self.fauna["Carnivore"]:
-                animal.feeding(self.fauna["Herbivore"])
+                animal.feeding(prey, rng)
+
+            # remove dead animals, herbivores are left sorted by lowest fitness for next year
+            self.fauna["Herbivore"] = prey.survivors()
 
-                # remove dead animals
-                herbivores = self.fauna["Herbivore"]
-                self.fauna["Herbivore"] = [animal for animal in herbivores if animal.alive]
+    def graze(self):
+        """
+        Herbivores eat fodder in the cell. There is no fodder in this cell.
+        """
+        pass
 
-    def moving_animals_list(self):
+    def draw_migrants(self, rng=None):
+        """
+        Draws which animals will migrate.
+
+        Follows :meth:`biosim.animals.Animal.migrate`, with one draw for all animals
+        of a species. Where they go is drawn by the island, see
+        :meth:`biosim.island.Island._draw_migrants`.
+
+        Parameters
+        ----------
+        rng : biosim.rng.BufferedGenerator or None
+            Random number generator, :data:`biosim.rng.default_generator` if None.
+
+        Returns
+        -------
+        list
+            Animal objects that will migrate.
+        """
+        if rng is None:
+            rng = _rng.default_generator
+
+        migrants = []
+        for species, animal_list in self.fauna.items():
+            num_animals = len(animal_list)
+            if num_animals == 0:
+                continue
+
+            mu = self.species[species].get_constants().mu
+            fitness = np.fromiter((animal.fitness for animal in animal_list), float, num_animals)
+            migrates = rng.random(num_animals) < mu * fitness
+            migrants.extend(compress(animal_list, migrates.tolist()))
+
+        return migrants
+
+    def moving_animals_list(self, rng=None):
         """
         Method for moving animals from one cell to another.
         The method checks if any animals will migrate, and
         returns a list with the object that will move.
+        The island uses :meth:`draw_migrants` and its neighbour table instead.
+
+        Parameters
+        ----------
+        rng : biosim.rng.BufferedGenerator or None
+            Random number generator, :data:`biosim.rng.default_generator` if None.
 
         Returns
         -------
@@ -223,10 +389,13 @@ class Cell_with_animals(Cell):
             List of tuples with animal object, old location and new location.
 
         """
+        if rng is None:
+            rng = _rng.default_generator
+
         moving_animals = []
         for animal in self.animals:
-            if animal.migrate():
-                new_location = self._get_random_neighboring_cell(self.location)
+            if animal.migrate(rng):
+                new_location = self._get_random_neighboring_cell(self.location, rng)
                 moving_animals.append((animal, self.location, new_location))
 
         return moving_animals
@@ -238,23 +407,29 @@ class Cell_with_animals(Cell):
         # this class has no fodder
         pass
 
-    def _get_random_neighboring_cell(self, location):
+    def _get_random_neighboring_cell(self, location, rng=None):
         """
         Returns a random neighboring cell.
 
         Parameters
         ----------
         location : tuple
+        rng : biosim.rng.BufferedGenerator or None
+            Random number generator, :data:`biosim.rng.default_generator` if None.
 
         Returns
         -------
         new location : tuple
             Tuple with new coordinates.
         """
+        if rng is None:
+            rng = _rng.default_generator
+
         new_location = []
 
         # Change in direction       South, North, West, East
-        direction = random.choice([(-1, 0), (1, 0), (0, -1), (0, 1)])
+        directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+        direction = directions[rng.integers(len(directions))]
 
         # Calculate new coordinates
         for current, change in zip(location, direction):
@@ -271,23 +446,52 @@ class Cell_with_animals(Cell):
 
     def loss_of_weight(self):
         """
-        Reduces weight of all animals in the cell.
-        Calls the loss_of_weight() method in the animal class.
+        Reduces weight of all animals in the cell, following the loss_of_weight()
+        method in the animal class. Weights and fitness are updated for each species
+        at once.
         """
-        for animal in self.animals:
-            animal.loss_of_weight()
+        for species, animal_list in self.fauna.items():
+            if not animal_list:
+                continue
 
-    def animal_death(self):
+            eta = self.species[species].get_constants().eta
+            for animal in animal_list:
+                animal.weight -= eta * animal.weight
+            self._update_fitness_in_bulk(species, animal_list)
+
+    def animal_death(self, rng=None):
         """
         Checks if any animals will die in the cell, and removes them from the cell.
         Uses the death method in the animal class.
+
+        Parameters
+        ----------
+        rng : biosim.rng.BufferedGenerator or None
+            Random number generator, :data:`biosim.rng.default_generator` if None.
         """
         for species, animal_list in self.fauna.items():
             for animal in animal_list:
-                animal.death()
+                animal.death(rng)
             # Remove dead animals
             self.fauna[species] = [animal for animal in animal_list if animal.alive]
 
+    def end_of_year(self, rng=None):
+        """
+        Ages all animals, reduces their weight and removes the animals that die.
+
+        Gives the same result as :meth:`age_animals`, :meth:`loss_of_weight` and
+        :meth:`animal_death` one after another, with one pass per species, see
+        :meth:`biosim.animals.Animal.end_of_year`.
+
+        Parameters
+        ----------
+        rng : biosim.rng.BufferedGenerator or None
+            Random number generator, :data:`biosim.rng.default_generator` if None.
+        """
+        for species, animal_list in self.fauna.items():
+            if animal_list:
+                self.fauna[species] = self.species[species].end_of_year(animal_list, rng)
+
     @property
     def count_herbivore(self):
         """
@@ -316,14 +520,16 @@ class Cell_with_fodder(Cell_with_animals):
     Cell characteristics with fodder for vegetarian animals
     This is a subclass of Cell_with_animals.
     """
+    __slots__ = ('fodder',)
+
     f_max = None
 
     default_parameters = {'f_max': f_max}
 
     @classmethod
-    def set_parameters(cls, new_parameters):
+    def check_parameters(cls, new_parameters):
         """
-        Set the default parameters for the cell
+        Checks new parameters for the cell without setting them.
 
         Parameters
         ----------
@@ -342,6 +548,27 @@ class Cell_with_fodder(Cell_with_animals):
         if 'f_max' in new_parameters:
             if new_parameters['f_max'] < 0:
                 raise ValueError("Invalid parameter: f_max must be positive")
+
+    @classmethod
+    def set_parameters(cls, new_parameters):
+        """
+        Set the default parameters for the cell
+
+        These class-level parameters are used when no parameter set is active,
+        see :meth:`get_f_max`.
+
+        Parameters
+        ----------
+        new_parameters : dict
+            Dictionary with new parameters
+
+        Raises
+        ------
+        ValueError
+            If the parameter is not valid
+        """
+        cls.check_parameters(new_parameters)
+        if 'f_max' in new_parameters:
             cls.f_max = new_parameters['f_max']
 
     @classmethod
@@ -352,6 +579,24 @@ class Cell_with_fodder(Cell_with_animals):
         """
         return {'f_max': cls.f_max}
 
+    @classmethod
+    def get_f_max(cls):
+        """
+        Get the maximum amount of fodder in the cell.
+
+        Taken from the active parameter set, see
+        :meth:`biosim.parameters.ParameterSet.activate`, or from the class if no
+        set is active.
+
+        Returns
+        -------
+        float
+        """
+        parameters = active_parameters.get()
+        if parameters is None:
+            return cls.f_max
+        return parameters.f_max[cls.type]
+
     def __init__(self, location):
         """
         Initialize the Cell_with_fodder class. A class with fodder and animals.
@@ -362,29 +607,41 @@ class Cell_with_fodder(Cell_with_animals):
             Tuple with coordinates for the cell.
         """
         super().__init__(location)
-        self.fodder = self.f_max
+        self.fodder = self.get_f_max()
 
-    def feed_animals(self):
+    def graze(self):
         """
         Feed all vegetarian animals, Herbivores, in the cell.
-        Animals with the highest fitness eats first.
-        Methods calls the feeding method in the Herbivore class.
-        """
-        self._sort_herbivore_after_fitness()
-        for animal in self.fauna["Herbivore"]:
-            if self.fodder > 0:
-                self.fodder -= animal.feeding(self.fodder)
-            else:
-                break
-
-        super().feed_animals()
+        Animals with the highest fitness eats first, so the herbivores, sorted by
+        ascending fitness, are taken from the end of the list.
+        The amount eaten by every herbivore is calculated at once with
+        :meth:`biosim.animals.Herbivore.feeding_batch`, with the same result as
+        calling the feeding method in the Herbivore class for one herbivore at a time.
+        """
+        herbivores = self.fauna["Herbivore"]
+        amount_eaten, self.fodder = Herbivore.feeding_batch(len(herbivores), self.fodder)
+
+        num_fed = len(amount_eaten)
+        if num_fed == 0:
+            return
+
+        fed_animals = herbivores[:-num_fed - 1:-1]
+        weights = np.fromiter((animal.weight for animal in fed_animals), float, num_fed)
+        weights += amount_eaten * Herbivore.get_constants().beta
+        for animal, new_weight in zip(fed_animals, weights.tolist()):
+            animal.weight = new_weight
+        self._update_fitness_in_bulk("Herbivore", fed_animals)
+
+        # The fed herbivores were the fittest and have gained weight, so they are
+        # merged in with the unfed herbivores, which are still in order.
+        Herbivore.merge_by_fitness(herbivores, len(herbivores) - num_fed)
 
     def reset_fodder(self):
         """
         Reset the fodder in the cell to the maximum value.
         This method is called at the end of each year.
         """
-        self.fodder = self.f_max
+        self.fodder = self.get_f_max()
 
 
 class Water(Cell):
@@ -392,6 +649,8 @@ class Water(Cell):
     Water is a subclass of Cell. And in this class there is no fodder and no animals.
     This class is not habitable.
     """
+    __slots__ = ()
+
     type = "Water"
     color = (0.13, 0.00, 1.00)
 
@@ -401,6 +660,8 @@ class Desert(Cell_with_animals):
     Dessert is a subclass of Cell_with_animals.
     In this class animals can move, and predators can eat.
     """
+    __slots__ = ()
+
     type = "Desert"
     color = (1.00, 1.00, 0.40)
 
@@ -410,6 +671,8 @@ class Lowland(Cell_with_fodder):
     Lowland is a subclass of Cell_with_fodder.
     Lowland has a large amount of fodder, and all animals will thrive.
     """
+    __slots__ = ()
+
     type = "Lowland"
     f_max = 800
     color = (0.00, 0.62, 0.00)
@@ -422,6 +685,8 @@ class Highland(Cell_with_fodder):
     Highland has a limited amount of fodder, and Herbivores will struggle to find food.
     Predators can live on their prey until there is no Herbivores left.
     """
+    __slots__ = ()
+
     type = "Highland"
     f_max = 300
     color = (0.20, 1.00, 0.42)
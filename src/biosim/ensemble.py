@@ -0,0 +1,190 @@
+"""
+Implements ensembles of simulations with the same island and different seeds.
+
+Every replica is a headless :class:`biosim.simulation.BioSim` run in a process
+pool. :func:`iter_ensemble` yields the result of every replica as soon as it
+finishes, and :func:`run_ensemble` stacks the results of all replicas into arrays,
+e.g. to compute confidence bands.
+"""
+
+import contextlib
+import functools
+import io
+import multiprocessing
+
+import numpy as np
+
+from .parameters import ParameterSet
+from .simulation import BioSim
+
+
+class ReplicaResult:
+    """
+    Result of one simulation in an ensemble.
+
+    Attributes
+    ----------
+    seed : int
+        Seed of the simulation.
+    populations : dict
+        Number of animals of every species in year 0 to num_years, as arrays.
+    cell_counts : dict or None
+        Number of animals of every species in every cell, as arrays with shape
+        (num_years + 1, map height, map width), if requested.
+    """
+
+    def __init__(self, seed, populations, cell_counts=None):
+        self.seed = seed
+        self.populations = populations
+        self.cell_counts = cell_counts
+
+
+class EnsembleResult:
+    """
+    Stacked results of all simulations in an ensemble, in the order of the seeds.
+
+    Attributes
+    ----------
+    seeds : numpy.ndarray
+        Seeds of the simulations.
+    populations : dict
+        Arrays with shape (number of seeds, num_years + 1) for every species.
+    cell_counts : dict or None
+        Arrays with shape (number of seeds, num_years + 1, map height, map width) for
+        every species, if requested.
+    """
+
+    def __init__(self, replicas):
+        """
+        Parameters
+        ----------
+        replicas : list of ReplicaResult
+            Results of the simulations, in the order of the seeds.
+        """
+        self.seeds = np.array([replica.seed for replica in replicas])
+        self.populations = {species: np.stack([replica.populations[species]
+                                               for replica in replicas])
+                            for species in replicas[0].populations}
+
+        self.cell_counts = None
+        if replicas[0].cell_counts is not None:
+            self.cell_counts = {species: np.stack([replica.cell_counts[species]
+                                                   for replica in replicas])
+                                for species in replicas[0].cell_counts}
+
+
+def run_replica(seed, num_years, island_map=None, ini_pop=None, animal_parameters=None,
+                landscape_parameters=None, engine='object', cell_counts=False):
+    """
+    Runs one headless simulation.
+
+    The simulation starts from the default parameters of all species and landscapes,
+    see :meth:`biosim.parameters.ParameterSet.default`, and changes the given
+    parameters in its own parameter set only.
+
+    Parameters
+    ----------
+    seed : int
+        Seed of the simulation.
+    num_years : int
+        Number of years to simulate.
+    island_map : str
+        Multi-line string with island geography, the default map of BioSim if None.
+    ini_pop : list
+        List of dictionaries specifying initial population.
+    animal_parameters : dict
+        New parameters for every species, e.g. ``{'Herbivore': {'mu': 0.3}}``.
+    landscape_parameters : dict
+        New parameters for every landscape code, e.g. ``{'L': {'f_max': 700}}``.
+    engine : str
+        Population engine, 'object' or 'array'.
+    cell_counts : bool
+        If True, the number of animals in every cell is recorded every year.
+
+    Returns
+    -------
+    ReplicaResult
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim = BioSim(island_map, ini_pop, seed=seed, vis_years=0, engine=engine,
+                     parameters=ParameterSet.default())
+        for species, new_parameters in (animal_parameters or {}).items():
+            sim.set_animal_parameters(species, new_parameters)
+        for landscape, new_parameters in (landscape_parameters or {}).items():
+            sim.set_landscape_parameters(landscape, new_parameters)
+
+        counts = None
+        if cell_counts:
+            sim.update_island_data()
+            counts = {species: [species_counts.copy()]
+                      for species, species_counts in sim.island.counts.items()}
+            for _ in range(num_years):
+                sim.simulate(1)
+                for species, species_counts in sim.island.counts.items():
+                    counts[species].append(species_counts.copy())
+            counts = {species: np.stack(arrays) for species, arrays in counts.items()}
+        else:
+            sim.simulate(num_years)
+
+    populations = {species: np.array([history[year] for year in range(num_years + 1)])
+                   for species, history in sim.pop_history.items()}
+    return ReplicaResult(seed, populations, counts)
+
+
+def iter_ensemble(seeds, num_years, workers=None, **kwargs):
+    """
+    Runs one simulation for every seed in a process pool.
+
+    Parameters
+    ----------
+    seeds : list of int
+        Seeds of the simulations.
+    num_years : int
+        Number of years to simulate.
+    workers : int or None
+        Number of processes, the number of CPUs if None.
+    **kwargs
+        Other arguments of :func:`run_replica`.
+
+    Yields
+    ------
+    ReplicaResult
+        Result of every simulation, in the order they finish.
+    """
+    run = functools.partial(run_replica, num_years=num_years, **kwargs)
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap_unordered(run, seeds)
+
+
+def run_ensemble(seeds, num_years, workers=None, **kwargs):
+    """
+    Runs one simulation for every seed in a process pool and stacks the results.
+
+    Parameters
+    ----------
+    seeds : list of int
+        Seeds of the simulations.
+    num_years : int
+        Number of years to simulate.
+    workers : int or None
+        Number of processes, the number of CPUs if None.
+    **kwargs
+        Other arguments of :func:`run_replica`.
+
+    Returns
+    -------
+    EnsembleResult
+
+    Raises
+    ------
+    ValueError
+        If no seeds are given.
+    """
+    seeds = list(seeds)
+    if not seeds:
+        raise ValueError('At least one seed must be given')
+
+    replicas = {}
+    for replica in iter_ensemble(seeds, num_years, workers, **kwargs):
+        replicas[replica.seed] = replica
+    return EnsembleResult([replicas[seed] for seed in seeds])
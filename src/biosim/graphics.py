@@ -188,9 +188,9 @@ class Graphics:
         :param carnivore_population: current carnivore population.
         :type carnivore_population: int
         :param herbivore_dict_map: current herbivore population distribution.
-        :type herbivore_dict_map: dict
+        :type herbivore_dict_map: numpy.ndarray or dict
         :param carnivore_dict_map: current carnivore population distribution.
-        :type carnivore_dict_map: dict
+        :type carnivore_dict_map: numpy.ndarray or dict
         :param herbivore_age_list: current herbivore age distribution.
         :type herbivore_age_list: list
         :param carnivore_age_list: current carnivore age distribution.
@@ -500,21 +500,32 @@ class Graphics:
         carnivore_y_data[idx] = carnivore_population
         self._carnivore_population_line.set_ydata(carnivore_y_data)
 
+    def _population_map(self, population_map):
+        """
+        Returns the population of every cell as an array shaped like the map.
+
+        :param population_map: Population per cell, as an array shaped like the map,
+            or a dictionary with locations as keys
+        :type population_map: numpy.ndarray or dict
+        """
+        if isinstance(population_map, np.ndarray):
+            return population_map.astype(float)
+
+        animal_map = np.zeros((self._dim_x, self._dim_y))
+        for location, population in population_map.items():
+            animal_map[location[0] - 1, location[1] - 1] = population
+        return animal_map
+
     def _update_herbivore_heatmap(self, herbivore_dict_map):
         """
         Update the herbivore heatmap.
 
-        :param herbivore_dict_map: Dictionary with herbivore population history
-        :type herbivore_dict_map: dict
+        :param herbivore_dict_map: Herbivores per cell
+        :type herbivore_dict_map: numpy.ndarray or dict
         """
-        if self._herbivore_heatmap_img is None:
+        self.herbivore_map = self._population_map(herbivore_dict_map)
 
-            self.herbivore_map = np.zeros((self._dim_x, self._dim_y))
-
-            for location, population_history in herbivore_dict_map.items():
-                x = location[0] - 1
-                y = location[1] - 1
-                self.herbivore_map[x][y] = population_history
+        if self._herbivore_heatmap_img is None:
             cmax = self.cmax_animals["Herbivore"]
             self._herbivore_heatmap_img = self._herbivore_heatmap_ax.imshow(self.herbivore_map,
                                                                             interpolation='nearest',
@@ -524,27 +535,18 @@ class Graphics:
                          ax=self._herbivore_heatmap_ax,
                          location='left', pad=.05)
         else:
-            for location, population_history in herbivore_dict_map.items():
-                x = location[0] - 1
-                y = location[1] - 1
-                self.herbivore_map[x][y] = population_history
             self._herbivore_heatmap_img.set_data(self.herbivore_map)
 
     def _update_carnivore_heatmap(self, carnivore_dict_map):
         """
         Update the carnivore heatmap.
 
-        :param carnivore_dict_map: Dictionary with carnivore population history
-        :type carnivore_dict_map: dict
+        :param carnivore_dict_map: Carnivores per cell
+        :type carnivore_dict_map: numpy.ndarray or dict
         """
-        if self._carnivore_heatmap_img is None:
+        self.carnivore_map = self._population_map(carnivore_dict_map)
 
-            self.carnivore_map = np.zeros((self._dim_x, self._dim_y))
-
-            for key, value in carnivore_dict_map.items():
-                x = key[0] - 1
-                y = key[1] - 1
-                self.carnivore_map[x][y] = value
+        if self._carnivore_heatmap_img is None:
             cmax = self.cmax_animals["Carnivore"]
             self._carnivore_heatmap_img = self._carnivore_heatmap_ax.imshow(self.carnivore_map,
                                                                             interpolation='nearest',
@@ -553,10 +555,6 @@ class Graphics:
                                                                             cmap="YlOrBr")
             plt.colorbar(self._carnivore_heatmap_img, ax=self._carnivore_heatmap_ax)
         else:
-            for key, value in carnivore_dict_map.items():
-                x = key[0] - 1
-                y = key[1] - 1
-                self.carnivore_map[x][y] = value
             self._carnivore_heatmap_img.set_data(self.carnivore_map)
 
     def _update_histogram_age(self, herbivore_age_list, carnivore_age_list):
@@ -9,11 +9,104 @@
     - Gather data from one year, and store it for visualization.
 """
 
+import functools
+
 import numpy as np
 import matplotlib.pyplot as plt
-import random
+from collections.abc import Mapping
+from itertools import compress
+from operator import itemgetter
+
+from .cell import Water, Lowland, Highland, Desert, Cell_with_fodder
+from .animals import Herbivore, Carnivore, OperationCounters, active_counters, active_parameters
+from .population import Population
+from .rng import CellGenerator, PROCREATION, FEEDING, MIGRATION, DEATH
+
+
+# columns of the animal arrays, see Island._animal_arrays
+_animal_columns = {'species': np.int8, 'cell': np.int32, 'age': np.int64,
+                   'weight': float, 'fitness': float, 'alive': bool}
+_species_names = ('Herbivore', 'Carnivore')
+
+
+def _join_columns(parts):
+    """Joins lists of arrays into one array for every animal column."""
+    return {name: (np.concatenate(parts[name]).astype(dtype, copy=False) if parts[name]
+                   else np.empty(0, dtype=dtype))
+            for name, dtype in _animal_columns.items()}
+
+
+def _animal_groups(arrays):
+    """
+    Splits animal arrays into runs of animals of one species in one cell.
+
+    Yields
+    ------
+    tuple
+        Species name, index of the habitable cell and slice of the rows of every run.
+    """
+    species, cells = arrays['species'], arrays['cell']
+    changes = np.flatnonzero((np.diff(species) != 0) | (np.diff(cells) != 0)) + 1
+    bounds = np.concatenate(([0], changes, [len(species)])) if len(species) else []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        yield _species_names[species[start]], int(cells[start]), slice(start, stop)
+
+
+def _with_island_context(method):
+    """
+    Runs an island method with the parameter set and the operation counters of the
+    island active, see :meth:`biosim.parameters.ParameterSet.activate` and
+    :meth:`biosim.animals.OperationCounters.activate`.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if active_counters.get() is self.counters:
+            return method(self, *args, **kwargs)
+        with self.counters.activate():
+            parameters = self.parameters
+            if parameters is None or active_parameters.get() is parameters:
+                return method(self, *args, **kwargs)
+            with parameters.activate():
+                return method(self, *args, **kwargs)
+    return wrapper
+
+
+class CellCounts(Mapping):
+    """
+    Number of animals of one species per cell, read as a dictionary keyed by location.
+
+    A thin view of a count array shaped like the map, for code using
+    :attr:`Island.pop_in_cell`. Only habitable cells are keys.
+    """
+
+    def __init__(self, counts, cell_locations):
+        """
+        Parameters
+        ----------
+        counts : numpy.ndarray
+            Number of animals in each cell of the map.
+        cell_locations : list
+            Locations of the habitable cells.
+        """
+        self.counts = counts
+        self._cell_locations = cell_locations
+        self._habitable = set(cell_locations)
+
+    def __getitem__(self, loc):
+        if loc not in self._habitable:
+            raise KeyError(loc)
+        return int(self.counts[loc[0] - 1, loc[1] - 1])
 
-from .cell import Water, Lowland, Highland, Desert
+    def __setitem__(self, loc, count):
+        if loc not in self._habitable:
+            raise KeyError(loc)
+        self.counts[loc[0] - 1, loc[1] - 1] = count
+
+    def __iter__(self):
+        return iter(self._cell_locations)
+
+    def __len__(self):
+        return len(self._cell_locations)
 
 
 class Island:
@@ -23,8 +116,14 @@ class Island:
 
     allowed_cells = ['W', 'L', 'H', 'D']
 
+    # Change in direction       South, North, West, East
+    directions = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+    # the object engine records fitness_counts and sort_counts every year
+    counts_operations = True
+
     # INIT METHOD
-    def __init__(self, input_island_map, random_seed=0):
+    def __init__(self, input_island_map, random_seed=0, parameters=None):
         """
         Class constructor for island.
 
@@ -34,22 +133,48 @@ class Island:
             Multi-line string with island geography
         random_seed : int
             Integer used as random number seed.
+        parameters : biosim.parameters.ParameterSet or None
+            Parameters of the island, active while it runs. If None, the class-level
+            parameters of the animals and cells are used.
         """
-        random.seed(random_seed)
+        # every island has its own random numbers, passed to the cells and animals
+        self.rng = CellGenerator(random_seed)
+        self.year = 0
+        self.parameters = parameters
+        # counters of the operations of this island, active while it runs
+        self.counters = OperationCounters()
 
         self.map_processed = self._process_input_map(input_island_map)
         self.map_height = self._get_map_height(self.map_processed)
         self.map_width = self._get_map_width(self.map_processed)
         self.map = self._map_processed_to_dict(self.map_processed)
         self.habital_map = self._get_map_with_animals()
+
+        # Dense representation: landscape codes and cell indices shaped like the map
+        self.landscape = self._get_landscape(self.map_processed)
+        self.cell_grid = self._get_cell_grid(self.landscape)
+        self.cell_locations = list(self.habital_map)
+        self.cell_index = {loc: index for index, loc in enumerate(self.cell_locations)}
+        self.cells = list(self.habital_map.values())
+        self.neighbours = self._get_neighbour_table()
         self.bitmap = self.create_colormap(self.map_processed)
 
-        self.pop_in_cell = {'Herbivore': {}, 'Carnivore': {}}
+        self.counts = {'Herbivore': np.zeros(self.landscape.shape, dtype=np.int64),
+                       'Carnivore': np.zeros(self.landscape.shape, dtype=np.int64)}
+        self.pop_in_cell = {species: CellCounts(counts, self.cell_locations)
+                            for species, counts in self.counts.items()}
         self.pop = {'Herbivore': 0, 'Carnivore': 0}
 
+        # indices of the cells with animals, only these are run in the yearly cycle
+        self.active_cells = set()
+        self.active_counts = []
+
         self.specs = {'Herbivore': {'weight': [], 'age': [], 'fitness': []},
                       'Carnivore': {'weight': [], 'age': [], 'fitness': []}}
 
+        self.fitness_counts = []
+        self.sort_counts = []
+
     # METHODS for input and processing
     def _process_input_map(self, input_island_map):
         """
@@ -132,6 +257,7 @@ class Island:
         """
         return len(map_processed[0])
 
+    @_with_island_context
     def _map_processed_to_dict(self, map_processed):
         """
         Creates a map (dict) with coordinates as keys and cell objects as values
@@ -166,6 +292,62 @@ class Island:
 
         return map_with_animals
 
+    def _get_landscape(self, map_processed):
+        """
+        Creates an array with the landscape of every cell as an integer code,
+        the index of its letter in allowed_cells.
+
+        Parameters
+        ----------
+        map_processed : list
+            List of strings with island geography.
+
+        Returns
+        -------
+        numpy.ndarray
+            Landscape codes with the same shape as the map.
+        """
+        return np.array([[self.allowed_cells.index(letter) for letter in line]
+                         for line in map_processed], dtype=np.int8)
+
+    def _get_cell_grid(self, landscape):
+        """
+        Numbers the habitable cells row by row, in the order of habital_map.
+
+        Parameters
+        ----------
+        landscape : numpy.ndarray
+            Landscape codes.
+
+        Returns
+        -------
+        numpy.ndarray
+            Index of every habitable cell, and -1 for water, with the same shape as the map.
+        """
+        habitable = landscape != self.allowed_cells.index('W')
+
+        cell_grid = np.full(landscape.shape, -1, dtype=np.int64)
+        cell_grid[habitable] = np.arange(np.count_nonzero(habitable))
+        return cell_grid
+
+    def _get_neighbour_table(self):
+        """
+        Finds the habitable neighbours of each habitable cell.
+
+        The map is surrounded by water, so all neighbours of a habitable cell are
+        inside the map.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array with shape (number of habitable cells, 4). Row i has the index of
+            the neighbour of cell i in each of the four directions, or -1 if that
+            neighbour is not habitable.
+        """
+        rows, columns = np.nonzero(self.cell_grid >= 0)
+        return np.stack([self.cell_grid[rows + dx, columns + dy] for dx, dy in self.directions],
+                        axis=1)
+
     def _add_cell(self, cell_letter, loc):
         """
         Adds a cell object to the map
@@ -192,6 +374,7 @@ class Island:
         return cell
 
     # METHODS for adding animals
+    @_with_island_context
     def add_population(self, population):
         """
         Adds animals to the map with a given location.
@@ -211,23 +394,277 @@ class Island:
             if loc not in self.map:
                 raise ValueError("Location does not exist on island.")
 
+            if loc in self.cell_index:
+                self._activate_cell(self.cell_index[loc])
+
             for animal_info in item['pop']:
                 self.map[loc].add_animal_from_dict(animal_info)
 
+    def _activate_cell(self, index):
+        """
+        Adds a cell to the active cells, the cells run in the yearly cycle.
+
+        Inactive cells are not reset every year, so the fodder is reset when the
+        cell becomes active.
+
+        Parameters
+        ----------
+        index : int
+            Index of the habitable cell.
+        """
+        if index not in self.active_cells:
+            self.active_cells.add(index)
+            self.cells[index].reset_fodder()
+
+    def _has_animals(self, index):
+        """
+        Checks if there are animals in a habitable cell.
+
+        Parameters
+        ----------
+        index : int
+            Index of the habitable cell.
+
+        Returns
+        -------
+        bool
+        """
+        fauna = self.cells[index].fauna
+        return len(fauna['Herbivore']) > 0 or len(fauna['Carnivore']) > 0
+
+    def _num_animals(self, index):
+        """
+        Counts the animals in a habitable cell.
+
+        Parameters
+        ----------
+        index : int
+            Index of the habitable cell.
+
+        Returns
+        -------
+        int
+        """
+        return sum(len(animals) for animals in self.cells[index].fauna.values())
+
+    def _update_active_cells(self):
+        """
+        Removes cells where all animals have died or moved away from the active cells.
+        """
+        self.active_cells = {index for index in self.active_cells if self._has_animals(index)}
+
+    def _draw_migrants(self, loc, cell):
+        """
+        Draws which animals in a cell migrate, and where they go.
+
+        The directions of all migrating animals are drawn in one call and looked up in
+        the neighbour table. Moves into cells that are not habitable are dropped, so
+        the animal stays.
+
+        Parameters
+        ----------
+        loc : tuple
+            Coordinates of the cell
+        cell : object
+            Cell object
+
+        Returns
+        -------
+        tuple
+            Location of the cell, the migrating animals and an array with the index of
+            their new cells.
+        """
+        animals = cell.draw_migrants(self.rng)
+        directions = self.rng.integers(len(self.directions), size=len(animals))
+        new_cells = self.neighbours[self.cell_index[loc], directions]
+
+        habitable = new_cells >= 0
+        animals = list(compress(animals, habitable.tolist()))
+        return loc, animals, new_cells[habitable]
+
+    def _move_migrants(self, migrants):
+        """
+        Moves the migrating animals from their old cells to their new cells.
+
+        Animals that died after deciding to migrate stay where they are. The cells are
+        moved in the order of their index, so the animals arrive in the same order
+        however the migrants were collected.
+
+        Parameters
+        ----------
+        migrants : list of tuples
+            Migrants of each cell, from :meth:`_draw_migrants`.
+        """
+        self._place_arrivals(self._take_migrants(migrants))
+
+    def _take_migrants(self, migrants):
+        """
+        Removes the migrating animals that are still alive from their old cells.
+
+        Parameters
+        ----------
+        migrants : list of tuples
+            Migrants of each cell, from :meth:`_draw_migrants`.
+
+        Returns
+        -------
+        list of tuples
+            Index of the old cell, array with the index of the new cells and
+            the animals, for every cell with migrants.
+        """
+        arrivals = []
+        for loc, animals, new_cells in migrants:
+            alive = [animal.alive for animal in animals]
+            if not any(alive):
+                continue
+            moved = list(compress(animals, alive))
+            self.habital_map[loc].remove_animals(moved)
+            arrivals.append((self.cell_index[loc], new_cells[alive], moved))
+        return arrivals
+
+    @_with_island_context
+    def _place_arrivals(self, arrivals):
+        """
+        Adds migrating animals to their new cells, in the order of their old cells.
+
+        Parameters
+        ----------
+        arrivals : list of tuples
+            Arriving animals, from :meth:`_take_migrants`.
+        """
+        for _, new_cells, animals in sorted(arrivals, key=itemgetter(0)):
+            for animal, new_cell in zip(animals, new_cells.tolist()):
+                self._activate_cell(new_cell)
+                self.cells[new_cell].add_animal_object(animal)
+
+    @staticmethod
+    def _select_arrivals(arrival, selected):
+        """
+        Returns the part of an arrival going to some of the new cells.
+
+        Parameters
+        ----------
+        arrival : tuple
+            Arriving animals of one old cell, from :meth:`_take_migrants`.
+        selected : numpy.ndarray
+            Boolean mask of the animals to keep.
+
+        Returns
+        -------
+        tuple
+        """
+        source, new_cells, animals = arrival
+        return source, new_cells[selected], list(compress(animals, selected.tolist()))
+
+    def _take_cell(self, index):
+        """
+        Removes the animals from a cell and returns them with the fodder.
+
+        Parameters
+        ----------
+        index : int
+            Index of the habitable cell.
+
+        Returns
+        -------
+        tuple
+            Fodder, or None for cells without fodder, and the animals of each species.
+        """
+        cell = self.cells[index]
+        fauna = cell.fauna
+        cell.fauna = {species: [] for species in fauna}
+        self.active_cells.discard(index)
+        return getattr(cell, 'fodder', None), fauna
+
+    def _put_cell(self, index, content):
+        """
+        Puts animals and fodder taken with :meth:`_take_cell` into a cell.
+
+        Parameters
+        ----------
+        index : int
+            Index of the habitable cell.
+        content : tuple
+            Fodder and animals, from :meth:`_take_cell`.
+        """
+        fodder, fauna = content
+        cell = self.cells[index]
+        cell.fauna = fauna
+        if fodder is not None:
+            cell.fodder = fodder
+        self.active_cells.add(index)
+
+    def _animal_arrays(self):
+        """
+        Collects all animals as arrays, e.g. for a checkpoint.
+
+        The animals are ordered by species and cell, and keep their order in the
+        cell, so :meth:`_put_animal_arrays` gives cells with the same lists.
+
+        Returns
+        -------
+        dict
+            One element per animal in 'species' (0 for Herbivore, 1 for Carnivore),
+            'cell' (index of the habitable cell), 'age', 'weight', 'fitness' (NaN if
+            not computed) and 'alive'.
+        """
+        parts = {name: [] for name in _animal_columns}
+        for code, species in enumerate(_species_names):
+            for index, cell in enumerate(self.cells):
+                animals = cell.fauna[species]
+                num_animals = len(animals)
+                if num_animals == 0:
+                    continue
+                parts['species'].append(np.full(num_animals, code))
+                parts['cell'].append(np.full(num_animals, index))
+                parts['age'].append(np.fromiter((animal._age for animal in animals),
+                                                np.int64, num_animals))
+                parts['weight'].append(np.fromiter((animal._weight for animal in animals),
+                                                   float, num_animals))
+                parts['fitness'].append(np.fromiter(
+                    (np.nan if animal._fitness is None else animal._fitness
+                     for animal in animals), float, num_animals))
+                parts['alive'].append(np.fromiter((animal.alive for animal in animals),
+                                                  bool, num_animals))
+        return _join_columns(parts)
+
+    def _put_animal_arrays(self, arrays):
+        """
+        Adds animals collected with :meth:`_animal_arrays` to the cells.
+
+        Parameters
+        ----------
+        arrays : dict
+            Animal arrays, from :meth:`_animal_arrays`.
+        """
+        for species, index, rows in _animal_groups(arrays):
+            cell = self.cells[index]
+            cell.fauna[species].extend(cell.species[species].from_arrays(
+                arrays['age'][rows], arrays['weight'][rows], arrays['fitness'][rows],
+                arrays['alive'][rows], cell.location))
+
     def _move_all_animals(self, list_of_moving_animals):
         """
         Moves animals from old location to new location.
 
+        The emigrants are collected per old location and removed from each cell at once,
+        so the whole move is linear in the number of animals.
+
         Parameters
         ----------
         list_of_moving_animals : list of tuples
 
         """
+        emigrants = {}
         for animal, old_location, new_location in list_of_moving_animals:
 
             if new_location in self.habital_map and animal.alive:
+                self._activate_cell(self.cell_index[new_location])
                 self.habital_map[new_location].add_animal_object(animal)
-                self.habital_map[old_location].remove_animal(animal)
+                emigrants.setdefault(old_location, []).append(animal)
+
+        for old_location, animals in emigrants.items():
+            self.habital_map[old_location].remove_animals(animals)
 
     # METHODS for creating bitmap and plotting
     def create_colormap(self, map_processed):
@@ -269,6 +706,7 @@ class Island:
 
     # METHODS for yearly cycle
 
+    @_with_island_context
     def yearly_island_cycle(self):
         """
         Method runs through each cell on the island.
@@ -284,24 +722,86 @@ class Island:
         - loss of weight
         - animal death
         - resetting fodder
+
+        Only the active cells, the cells with animals, are run. Empty cells have
+        no animals to count, so the count arrays are cleared first, and the number
+        of active cells is appended to active_counts.
+
+        The number of fitness invalidations and recomputations during the year
+        is appended to fitness_counts, and the number of herbivore sorts and the time
+        spent sorting is appended to sort_counts.
         """
-        migrating_animals = []
         self.specs = {'Herbivore': {'weight': [], 'age': [], 'fitness': []},
                       'Carnivore': {'weight': [], 'age': [], 'fitness': []}}
 
-        for loc, cell in self.habital_map.items():
+        self.counters.reset()
+
+        active_cells = self._start_active_year()
+        migrants = self._run_cells(active_cells)
+        self._move_migrants(migrants)
+        self._update_active_cells()
+        self.collect_data()
+        self.year += 1
 
-            cell.add_newborns()
-            cell.feed_animals()
-            migrating_animals.extend(cell.moving_animals_list())
-            cell.age_animals()
-            cell.loss_of_weight()
-            cell.animal_death()
+        self.fitness_counts.append(self.counters.fitness_counts())
+        self.sort_counts.append(self.counters.sort.as_dict())
+
+    @_with_island_context
+    def _run_cells(self, indices):
+        """
+        Runs the yearly cycle in some of the active cells, without moving the migrants.
+
+        Every phase of every cell draws from its own random stream, see
+        :class:`biosim.rng.CellGenerator`. The result of a cell therefore does not
+        depend on the other cells in indices or on their order, so the active cells
+        can be split into parts that are run separately.
+
+        Parameters
+        ----------
+        indices : list of int
+            Indices of the active cells to run.
+
+        Returns
+        -------
+        list of tuples
+            Migrants of each cell, from :meth:`_draw_migrants`.
+        """
+        rng = self.rng
+        year = self.year
+        migrants = []
+        for index in indices:
+            loc = self.cell_locations[index]
+            cell = self.cells[index]
+
+            rng.select(year, index, PROCREATION)
+            cell.add_newborns(rng)
+            rng.select(year, index, FEEDING)
+            cell.feed_animals(rng)
+            rng.select(year, index, MIGRATION)
+            migrants.append(self._draw_migrants(loc, cell))
+            rng.select(year, index, DEATH)
+            cell.end_of_year(rng)
             cell.reset_fodder()
             self.update_data(loc, cell)
-        self._move_all_animals(migrating_animals)
-        self.collect_data()
+        return migrants
 
+    def _start_active_year(self):
+        """
+        Clears the count arrays and records the number of active cells.
+
+        Returns
+        -------
+        list
+            Indices of the active cells, in the order of habital_map.
+        """
+        for counts in self.counts.values():
+            counts.fill(0)
+
+        active_cells = sorted(self.active_cells)
+        self.active_counts.append(len(active_cells))
+        return active_cells
+
+    @_with_island_context
     def update_data(self, loc, cell):
         """
         Refreshes gathered data in each cell on the island.
@@ -316,8 +816,9 @@ class Island:
             Cell object
 
         """
-        self.pop_in_cell['Herbivore'][loc] = cell.count_herbivore
-        self.pop_in_cell['Carnivore'][loc] = cell.count_carnivore
+        x, y = loc
+        self.counts['Herbivore'][x - 1, y - 1] = cell.count_herbivore
+        self.counts['Carnivore'][x - 1, y - 1] = cell.count_carnivore
 
         for animal in cell.animals:
             self.specs[animal.species]['age'].append(animal.age)
@@ -329,5 +830,355 @@ class Island:
         Summarizes number of animals of each species on the island.
 
         """
-        self.pop['Herbivore'] = sum(self.pop_in_cell['Herbivore'].values())
-        self.pop['Carnivore'] = sum(self.pop_in_cell['Carnivore'].values())
+        self.pop['Herbivore'] = int(self.counts['Herbivore'].sum())
+        self.pop['Carnivore'] = int(self.counts['Carnivore'].sum())
+
+
+class ArrayIsland(Island):
+    """
+    Island running the array engine.
+
+    Every habitable cell keeps one :class:`biosim.population.Population` per species
+    instead of lists of animal objects. Cells are still used for the landscape and
+    the fodder. The public methods and the collected statistics are the same as
+    for :class:`Island`.
+    """
+
+    species = {'Herbivore': Herbivore, 'Carnivore': Carnivore}
+    counts_operations = False
+
+    def __init__(self, input_island_map, random_seed=0, parameters=None):
+        """
+        Class constructor for island with the array engine.
+
+        Parameters
+        ----------
+        input_island_map : str
+            Multi-line string with island geography
+        random_seed : int
+            Integer used as random number seed.
+        parameters : biosim.parameters.ParameterSet or None
+            Parameters of the island, see :class:`Island`.
+        """
+        super().__init__(input_island_map, random_seed, parameters)
+
+        self.populations = {loc: {species: Population(animal_class)
+                                  for species, animal_class in self.species.items()}
+                            for loc in self.habital_map}
+
+    @_with_island_context
+    def add_population(self, population):
+        """
+        Adds animals to the map with a given location.
+
+        Parameters
+        ----------
+        population : list
+            List of dictionaries with animals location and information.
+
+        Raises
+        ------
+        ValueError
+            If location does not exist on island, or if the animals are invalid.
+        """
+        for item in population:
+            loc = item["loc"]
+            if loc not in self.map:
+                raise ValueError("Location does not exist on island.")
+
+            cell = self.map[loc]
+            if not cell.is_habitable:
+                raise ValueError(f"Cannot add animal to {type(cell)} cell at loc: {loc}")
+            self._activate_cell(self.cell_index[loc])
+
+            new_animals = {species: ([], []) for species in self.species}
+            for animal_info in item['pop']:
+                cell.check_animal_info(animal_info)
+                ages, weights = new_animals[animal_info["species"]]
+                ages.append(animal_info["age"])
+                weights.append(animal_info["weight"])
+
+            for species, (ages, weights) in new_animals.items():
+                if ages:
+                    self.populations[loc][species].add(ages, weights)
+
+    @_with_island_context
+    def yearly_island_cycle(self):
+        """
+        Runs the yearly cycle on the populations of every cell.
+
+        The steps are the same as in :meth:`Island.yearly_island_cycle`,
+        but every step works on whole arrays of animals.
+        """
+        self.specs = {'Herbivore': {'weight': [], 'age': [], 'fitness': []},
+                      'Carnivore': {'weight': [], 'age': [], 'fitness': []}}
+
+        migrating_animals = self._run_cells(self._start_active_year())
+        self._move_all_populations(migrating_animals)
+        self._update_active_cells()
+        self.collect_data()
+        self.year += 1
+
+    @_with_island_context
+    def _run_cells(self, indices):
+        """
+        Runs the yearly cycle on the populations of some of the active cells,
+        without moving the migrants.
+
+        See :meth:`Island._run_cells`.
+
+        Parameters
+        ----------
+        indices : list of int
+            Indices of the active cells to run.
+
+        Returns
+        -------
+        list of tuples
+            Location of each cell and the migrants of each species.
+        """
+        rng = self.rng
+        year = self.year
+        migrating_animals = []
+        for index in indices:
+            loc = self.cell_locations[index]
+            cell = self.cells[index]
+            populations = self.populations[loc]
+            herbivores = populations['Herbivore']
+            carnivores = populations['Carnivore']
+
+            rng.select(year, index, PROCREATION)
+            herbivores.procreation(rng)
+            carnivores.procreation(rng)
+
+            rng.select(year, index, FEEDING)
+            if isinstance(cell, Cell_with_fodder):
+                cell.fodder = herbivores.grazing(cell.fodder)
+            carnivores.hunting(herbivores, rng)
+
+            rng.select(year, index, MIGRATION)
+            migrants = {species: self._draw_migrants(loc, pop)
+                        for species, pop in populations.items()}
+
+            rng.select(year, index, DEATH)
+            for species, pop in populations.items():
+                pop.aging()
+                pop.loss_of_weight()
+                pop.death(rng)
+
+                # only animals that survive the year can move
+                moving, new_cells = migrants[species]
+                survived = pop.alive[moving]
+                new_index = np.cumsum(pop.alive) - 1
+                migrants[species] = (new_index[moving[survived]], new_cells[survived])
+                pop.compact()
+
+            cell.reset_fodder()
+            self.update_data(loc, cell)
+            migrating_animals.append((loc, migrants))
+
+        return migrating_animals
+
+    def _has_animals(self, index):
+        """
+        Checks if there are animals in a habitable cell.
+
+        Parameters
+        ----------
+        index : int
+            Index of the habitable cell.
+
+        Returns
+        -------
+        bool
+        """
+        return any(len(pop) > 0 for pop in self.populations[self.cell_locations[index]].values())
+
+    def _num_animals(self, index):
+        """
+        Counts the animals in a habitable cell.
+
+        Parameters
+        ----------
+        index : int
+            Index of the habitable cell.
+
+        Returns
+        -------
+        int
+        """
+        return sum(len(pop) for pop in self.populations[self.cell_locations[index]].values())
+
+    def _draw_migrants(self, loc, pop):
+        """
+        Draws which animals in a population migrate, and where they go.
+
+        Moves into cells that are not habitable are dropped, so the animal stays.
+
+        Parameters
+        ----------
+        loc : tuple
+            Coordinates of the cell
+        pop : Population
+            Population in the cell
+
+        Returns
+        -------
+        tuple
+            Indices of the migrating animals and array with the index of their new cells.
+        """
+        index = np.flatnonzero(pop.migration(self.rng))
+        directions = self.rng.integers(len(self.directions), size=len(index))
+        new_cells = self.neighbours[self.cell_index[loc], directions]
+
+        habitable = new_cells >= 0
+        return index[habitable], new_cells[habitable]
+
+    def _move_all_populations(self, migrating_animals):
+        """
+        Moves the migrating animals from their old cells to their new cells.
+
+        The cells are moved in the order of their index, see :meth:`Island._move_migrants`.
+
+        Parameters
+        ----------
+        migrating_animals : list of tuples
+            Location of the old cell and the migrants of each species.
+        """
+        self._place_arrivals(self._take_migrants(migrating_animals))
+
+    def _take_migrants(self, migrating_animals):
+        """
+        Removes the migrating animals from their old cells.
+
+        Parameters
+        ----------
+        migrating_animals : list of tuples
+            Location of the old cell and the migrants of each species.
+
+        Returns
+        -------
+        list of tuples
+            Index of the old cell, array with the index of the new cells, and the
+            species, ages and weights of the animals.
+        """
+        arrivals = []
+        for loc, migrants in migrating_animals:
+            for species, (index, new_cells) in migrants.items():
+                if len(index) == 0:
+                    continue
+                pop = self.populations[loc][species]
+                selected = np.zeros(len(pop), dtype=bool)
+                selected[index] = True
+                ages, weights = pop.take(selected)
+                arrivals.append((self.cell_index[loc], new_cells, (species, ages, weights)))
+        return arrivals
+
+    @_with_island_context
+    def _place_arrivals(self, arrivals):
+        """
+        Adds migrating animals to their new cells, in the order of their old cells.
+
+        Parameters
+        ----------
+        arrivals : list of tuples
+            Arriving animals, from :meth:`_take_migrants`.
+        """
+        for _, new_cells, (species, ages, weights) in sorted(arrivals, key=itemgetter(0)):
+            for new_cell in np.unique(new_cells).tolist():
+                self._activate_cell(new_cell)
+                moving = new_cells == new_cell
+                new_loc = self.cell_locations[new_cell]
+                self.populations[new_loc][species].add(ages[moving], weights[moving])
+
+    @staticmethod
+    def _select_arrivals(arrival, selected):
+        """
+        Returns the part of an arrival going to some of the new cells.
+
+        See :meth:`Island._select_arrivals`.
+        """
+        source, new_cells, (species, ages, weights) = arrival
+        return source, new_cells[selected], (species, ages[selected], weights[selected])
+
+    def _take_cell(self, index):
+        """
+        Removes the populations from a cell and returns them with the fodder.
+
+        See :meth:`Island._take_cell`.
+        """
+        cell = self.cells[index]
+        loc = self.cell_locations[index]
+        populations = self.populations[loc]
+        self.populations[loc] = {species: Population(animal_class)
+                                 for species, animal_class in self.species.items()}
+        self.active_cells.discard(index)
+        return getattr(cell, 'fodder', None), populations
+
+    def _put_cell(self, index, content):
+        """
+        Puts populations and fodder taken with :meth:`_take_cell` into a cell.
+
+        See :meth:`Island._put_cell`.
+        """
+        fodder, populations = content
+        self.populations[self.cell_locations[index]] = populations
+        if fodder is not None:
+            self.cells[index].fodder = fodder
+        self.active_cells.add(index)
+
+    def _animal_arrays(self):
+        """
+        Collects all animals as arrays, see :meth:`Island._animal_arrays`.
+
+        Returns
+        -------
+        dict
+        """
+        parts = {name: [] for name in _animal_columns}
+        for code, species in enumerate(_species_names):
+            for index, loc in enumerate(self.cell_locations):
+                pop = self.populations[loc][species]
+                if len(pop) == 0:
+                    continue
+                parts['species'].append(np.full(len(pop), code))
+                parts['cell'].append(np.full(len(pop), index))
+                parts['age'].append(pop.age)
+                parts['weight'].append(pop.weight)
+                parts['fitness'].append(pop.fitness)
+                parts['alive'].append(pop.alive)
+        return _join_columns(parts)
+
+    def _put_animal_arrays(self, arrays):
+        """
+        Adds animals collected with :meth:`_animal_arrays` to the populations.
+
+        Parameters
+        ----------
+        arrays : dict
+            Animal arrays, from :meth:`_animal_arrays`.
+        """
+        for species, index, rows in _animal_groups(arrays):
+            pop = self.populations[self.cell_locations[index]][species]
+            pop.age = np.concatenate((pop.age, arrays['age'][rows]))
+            pop.weight = np.concatenate((pop.weight, arrays['weight'][rows]))
+            pop.fitness = np.concatenate((pop.fitness, arrays['fitness'][rows]))
+            pop.alive = np.concatenate((pop.alive, arrays['alive'][rows]))
+
+    def update_data(self, loc, cell):
+        """
+        Refreshes gathered data for the populations in one cell.
+
+        Parameters
+        ----------
+        loc : tuple
+            Coordinates of the cell
+        cell : object
+            Cell object
+        """
+        x, y = loc
+        for species, pop in self.populations[loc].items():
+            self.counts[species][x - 1, y - 1] = len(pop)
+            self.specs[species]['age'].extend(pop.age.tolist())
+            self.specs[species]['weight'].extend(pop.weight.tolist())
+            self.specs[species]['fitness'].extend(pop.fitness.tolist())
@@ -0,0 +1,265 @@
+"""
+Implements a population log written while the simulation runs.
+
+The number of animals of every species is appended to the log every year. The
+rows are kept in a buffer and written every few years, and the file can be synced
+to disk at a fixed interval, so a crash only loses the last years. Two formats
+are supported, chosen by the suffix of the file name:
+
+- ``.csv``: a header ``year,Herbivore,Carnivore`` and one row per year.
+- ``.bin``: a header line and a JSON line with the column names, followed by one
+  record of little-endian 64-bit integers per year. :func:`read_log` reads the
+  records as one array per column without parsing text.
+
+A log opened from a year after the start only keeps the rows of the years before,
+so a simulation resumed from a checkpoint continues its log without duplicates.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+_binary_magic = b'BIOSIMLOG\n'
+
+
+def log_path(file_name):
+    """
+    Adds the '.csv' suffix to a log file name without a '.csv' or '.bin' suffix.
+
+    Parameters
+    ----------
+    file_name : str or pathlib.Path
+        Name of the log file.
+
+    Returns
+    -------
+    pathlib.Path
+    """
+    path = Path(file_name)
+    if path.suffix not in ('.csv', '.bin'):
+        path = path.with_name(path.name + '.csv')
+    return path
+
+
+def _read_binary_header(data):
+    """Returns the column names and the size of the header of a binary log."""
+    end = data.index(b'\n', len(_binary_magic)) + 1
+    columns = json.loads(data[len(_binary_magic):end])['columns']
+    return columns, end
+
+
+def _record_type(columns):
+    """Returns the type of one record of a binary log."""
+    return np.dtype([(column, '<i8') for column in columns])
+
+
+def _complete_lines(data, start):
+    """Yields the offset and text of every line ending with a newline."""
+    offset = start
+    while True:
+        end = data.find(b'\n', offset)
+        if end < 0:
+            return
+        yield offset, data[offset:end]
+        offset = end + 1
+
+
+def read_log(file_name):
+    """
+    Reads a population log.
+
+    A last row that was only partly written before a crash is left out.
+
+    Parameters
+    ----------
+    file_name : str or pathlib.Path
+        Name of the log file, in either format.
+
+    Returns
+    -------
+    dict
+        One integer array for 'year' and for every species.
+    """
+    data = Path(file_name).read_bytes()
+
+    if data.startswith(_binary_magic):
+        columns, offset = _read_binary_header(data)
+        record_type = _record_type(columns)
+        num_records = (len(data) - offset) // record_type.itemsize
+        records = np.frombuffer(data, record_type, num_records, offset)
+        return {column: records[column].astype(np.int64) for column in columns}
+
+    lines = _complete_lines(data, 0)
+    _, header = next(lines)
+    columns = header.decode().split(',')
+    rows = [[int(value) for value in line.split(b',')] for _, line in lines if line]
+    table = np.array(rows, dtype=np.int64).reshape(len(rows), len(columns))
+    return {column: table[:, number] for number, column in enumerate(columns)}
+
+
+class PopulationLog:
+    """
+    Appends the number of animals of every species to a log file every year.
+
+    Used as a context manager, the log is closed at the end of the with statement.
+    """
+
+    def __init__(self, file_name, species=('Herbivore', 'Carnivore'), start_year=0,
+                 flush_years=10, fsync_years=None):
+        """
+        Opens the log file.
+
+        Parameters
+        ----------
+        file_name : str or pathlib.Path
+            Name of the log file, '.csv' is added without a '.csv' or '.bin' suffix.
+        species : tuple
+            Species to log, in column order.
+        start_year : int
+            First year to write. Rows of this and later years already in the file
+            are removed, earlier rows are kept. With 0 the file is written anew.
+        flush_years : int
+            Number of years buffered before they are written to the file.
+        fsync_years : int or None
+            Years between syncing the file to disk, None to leave it to the system.
+            The buffered rows are also written when a sync is due, so with
+            fsync_years less than flush_years the file is synced every fsync_years.
+
+        Raises
+        ------
+        ValueError
+            If flush_years or fsync_years is not a positive integer, or the existing
+            file has other columns.
+        """
+        if not isinstance(flush_years, int) or isinstance(flush_years, bool) or flush_years < 1:
+            raise ValueError('flush_years must be a positive integer')
+        if fsync_years is not None and (not isinstance(fsync_years, int)
+                                        or isinstance(fsync_years, bool) or fsync_years < 1):
+            raise ValueError('fsync_years must be a positive integer or None')
+
+        self.path = log_path(file_name)
+        self.binary = self.path.suffix == '.bin'
+        self.columns = ['year'] + list(species)
+        self.flush_years = flush_years
+        self.fsync_years = fsync_years
+        self.last_year = None
+
+        self._rows = []
+        self._unsynced_years = 0
+        self._file = self._open(start_year)
+
+    def _open(self, start_year):
+        """
+        Opens the file, keeping the rows before start_year of an existing log.
+        An empty file, e.g. left by a crash before the header was written, is
+        written anew like a missing one.
+        """
+        if start_year > 0 and self.path.exists() and self.path.stat().st_size > 0:
+            file = open(self.path, 'r+b')
+            data = file.read()
+            file.seek(self._keep_rows(data, start_year))
+            file.truncate()
+            return file
+
+        file = open(self.path, 'wb')
+        if self.binary:
+            file.write(_binary_magic + json.dumps({'columns': self.columns}).encode() + b'\n')
+        else:
+            file.write((','.join(self.columns) + '\n').encode())
+        file.flush()
+        return file
+
+    def _keep_rows(self, data, start_year):
+        """
+        Finds the end of the rows before start_year in an existing log.
+
+        Returns
+        -------
+        int
+            Offset in the file where the next row is written.
+        """
+        if self.binary:
+            columns, offset = _read_binary_header(data)
+            record_type = _record_type(columns)
+            num_records = (len(data) - offset) // record_type.itemsize
+            years = np.frombuffer(data, record_type, num_records, offset)['year']
+        else:
+            lines = _complete_lines(data, 0)
+            _, header = next(lines)
+            columns = header.decode().split(',')
+
+        if columns != self.columns:
+            raise ValueError(f'Log {self.path} has columns {columns}, not {self.columns}')
+
+        if self.binary:
+            num_kept = int(np.count_nonzero(years < start_year))
+            if num_kept:
+                self.last_year = int(years[num_kept - 1])
+            return offset + num_kept * record_type.itemsize
+
+        end = len(header) + 1
+        for offset, line in lines:
+            year = int(line.split(b',', 1)[0])
+            if year >= start_year:
+                return offset
+            self.last_year = year
+            end = offset + len(line) + 1
+        return end
+
+    def write(self, year, counts):
+        """
+        Adds the counts of one year.
+
+        Parameters
+        ----------
+        year : int
+            Year of the counts.
+        counts : dict
+            Number of animals of every species.
+        """
+        self._rows.append([year] + [counts[column] for column in self.columns[1:]])
+        self.last_year = year
+        if len(self._rows) >= self.flush_years or self._sync_due():
+            self.flush()
+
+    def _sync_due(self):
+        """Returns True if fsync_years years have passed since the last sync."""
+        return (self.fsync_years is not None
+                and self._unsynced_years + len(self._rows) >= self.fsync_years)
+
+    def flush(self):
+        """
+        Writes the buffered rows to the file, and syncs it to disk if it is time.
+        """
+        if self._rows:
+            if self.binary:
+                self._file.write(np.array(self._rows, dtype='<i8').tobytes())
+            else:
+                self._file.write(''.join(','.join(map(str, row)) + '\n'
+                                         for row in self._rows).encode())
+            self._unsynced_years += len(self._rows)
+            self._rows = []
+        self._file.flush()
+
+        if self._sync_due():
+            os.fsync(self._file.fileno())
+            self._unsynced_years = 0
+
+    def close(self):
+        """
+        Writes the buffered rows and closes the file.
+        """
+        if self._file.closed:
+            return
+        self.flush()
+        if self.fsync_years is not None and self._unsynced_years:
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
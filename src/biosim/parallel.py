@@ -0,0 +1,482 @@
+"""
+Implements the yearly cycle of an island in several worker processes.
+
+The map is split into strips of rows, and every worker process owns the cells in
+one strip. The strips are chosen so every worker has about the same number of
+animals, and they are chosen again every few years as the animals spread.
+
+All steps of the yearly cycle except migration only use the animals in one cell,
+so every worker runs them on its own cells. Animals migrating into another strip
+are sent to the main process once per year, which passes them on to the worker
+owning their new cell.
+
+Every cell draws random numbers from its own streams, see
+:class:`biosim.rng.CellGenerator`, and the migrants arrive in the same order as
+in a serial run. The statistics are therefore identical for any number of workers.
+"""
+
+import multiprocessing
+import time
+import traceback
+
+import numpy as np
+
+from .parameters import ParameterSet
+
+
+def row_strips(row_weights, num_strips):
+    """
+    Splits rows into contiguous strips with about the same total weight.
+
+    Parameters
+    ----------
+    row_weights : array_like
+        Weight, e.g. the number of habitable cells, of every row.
+    num_strips : int
+        Wanted number of strips.
+
+    Returns
+    -------
+    list of tuples
+        First and last row + 1 of every strip. There are fewer strips than wanted
+        if there are not enough rows with weight.
+    """
+    cumulative = np.cumsum(row_weights)
+    targets = cumulative[-1] * np.arange(1, num_strips) / num_strips
+
+    # every strip ends after the row where the cumulative weight reaches its target
+    ends = np.searchsorted(cumulative, targets, side='left') + 1
+    boundaries = np.unique(np.concatenate(([0], ends, [len(cumulative)])))
+
+    return list(zip(boundaries[:-1].tolist(), boundaries[1:].tolist()))
+
+
+def _island_parameters(island):
+    """Returns the parameter set of an island, made from the classes if it has none."""
+    if island.parameters is None:
+        return ParameterSet.from_classes()
+    return island.parameters
+
+
+def _sum_counts(counts):
+    """Adds up a list of dictionaries with the same keys."""
+    return {key: sum(count[key] for count in counts) for key in counts[0]}
+
+
+def _run_year(island, worker, owner, collect_specs):
+    """
+    Runs the cells of one worker and draws their migrants.
+
+    Returns
+    -------
+    tuple
+        Arrivals staying in the strip, and the statistics and arrivals for other
+        workers to be sent to the main process.
+    """
+    if island.counts_operations:
+        island.counters.reset()
+    island.specs = {'Herbivore': {'weight': [], 'age': [], 'fitness': []},
+                    'Carnivore': {'weight': [], 'age': [], 'fitness': []}}
+
+    active_cells = island._start_active_year()
+    arrivals = island._take_migrants(island._run_cells(active_cells))
+
+    local, outgoing = [], []
+    for arrival in arrivals:
+        owners = owner[arrival[1]]
+        if (owners == worker).all():
+            local.append(arrival)
+            continue
+        for other in np.unique(owners).tolist():
+            part = island._select_arrivals(arrival, owners == other)
+            if other == worker:
+                local.append(part)
+            else:
+                outgoing.append((other, part))
+
+    counts = {}
+    for species, species_counts in island.counts.items():
+        positions = np.flatnonzero(species_counts)
+        counts[species] = (positions, species_counts.flat[positions])
+
+    operations = None
+    if island.counts_operations:
+        operations = (island.counters.fitness_counts(), island.counters.sort.as_dict())
+
+    stats = {'counts': counts,
+             'active': len(active_cells),
+             'animals': sum(int(species_counts.sum()) for species_counts in island.counts.values()),
+             'specs': island.specs if collect_specs else None,
+             'operations': operations}
+    return local, (stats, outgoing)
+
+
+def _worker(connection, island_class, island_map, seed, parameters):
+    """
+    Main loop of a worker process.
+
+    Parameters
+    ----------
+    connection : multiprocessing.connection.Connection
+        Connection to the main process.
+    island_class : type
+        Island or ArrayIsland.
+    island_map : str
+        Multi-line string with island geography.
+    seed : int
+        Seed of the island.
+    parameters : biosim.parameters.ParameterSet
+        Parameters of the island, replaced when the main process sends a new set.
+    """
+    try:
+        island = island_class(island_map, seed, parameters)
+        worker, owner = None, None
+
+        while True:
+            message = connection.recv()
+            command = message[0]
+
+            if command == 'cells':
+                _, worker, owner, island.year, cells = message
+                for index, content in cells:
+                    island._put_cell(index, content)
+
+            elif command == 'year':
+                _, parameters, collect_specs = message
+                start = time.perf_counter()
+                if parameters is not None:
+                    island.parameters = parameters
+                local, (stats, outgoing) = _run_year(island, worker, owner, collect_specs)
+                stats['seconds'] = time.perf_counter() - start
+                connection.send(('ok', (stats, outgoing)))
+
+                _, incoming = connection.recv()
+                island._place_arrivals(local + incoming)
+                island._update_active_cells()
+                island.year += 1
+
+            elif command == 'rebalance':
+                _, owner = message
+                leaving = [index for index in sorted(island.active_cells)
+                           if owner[index] != worker]
+                connection.send(('ok', [(index, island._take_cell(index)) for index in leaving]))
+
+            elif command == 'stop':
+                cells = [(index, island._take_cell(index)) for index in sorted(island.active_cells)]
+                connection.send(('ok', cells))
+                return
+    except Exception:
+        connection.send(('error', traceback.format_exc()))
+
+
+class StripWorkers:
+    """
+    Runs the yearly cycle of an island in worker processes, one strip of rows each.
+
+    The animals are moved to the workers by :meth:`start` and back to the island by
+    :meth:`stop`. In between, :meth:`yearly_island_cycle` replaces
+    :meth:`biosim.island.Island.yearly_island_cycle` and updates the statistics of
+    the island in the same way.
+
+    The rows are weighted by the number of animals and cells with animals in them,
+    and every `rebalance_years` the strips are chosen again from the counts of the
+    last year. The cells that change owner are moved between the workers.
+    The time every worker spent running its cells is appended to :attr:`utilisation`
+    every year.
+    """
+
+    # seconds to wait for a worker process to end when stopping
+    join_timeout = 10
+
+    def __init__(self, island, workers, rebalance_years=10):
+        """
+        Parameters
+        ----------
+        island : biosim.island.Island
+            Island to run, with the object or array engine.
+        workers : int
+            Number of worker processes.
+        rebalance_years : int
+            Years between choosing new strips, 0 to keep the first strips.
+
+        Raises
+        ------
+        ValueError
+            If workers is not a positive integer, or rebalance_years is negative.
+        """
+        if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+            raise ValueError('workers must be a positive integer')
+        if (not isinstance(rebalance_years, int) or isinstance(rebalance_years, bool)
+                or rebalance_years < 0):
+            raise ValueError('rebalance_years must be a non-negative integer')
+
+        self.island = island
+        self.workers = workers
+        self.rebalance_years = rebalance_years
+        self.strips = []
+        self.owner = None
+        self.utilisation = []
+
+        # row of every habitable cell, to add up the animals in each row
+        self._cell_rows = np.array([loc[0] - 1 for loc in island.cell_locations], dtype=np.int64)
+        self._connections = []
+        self._processes = []
+        self._failed = False
+        self._years = 0
+        # parameter set the workers have, only sent again when the island gets a new one
+        self._parameters = None
+
+    def _partition(self, cell_weights):
+        """
+        Chooses strips with about the same total weight, and the owner of every cell.
+
+        Parameters
+        ----------
+        cell_weights : numpy.ndarray
+            Weight of every habitable cell, by cell index.
+        """
+        row_weights = np.bincount(self._cell_rows, cell_weights,
+                                  minlength=self.island.map_height)
+        if row_weights.sum() == 0:
+            row_weights = (self.island.cell_grid >= 0).sum(axis=1)
+
+        self.strips = row_strips(row_weights, self.workers)
+        self.owner = self._get_owner(self.strips)
+
+    def _get_owner(self, strips):
+        """
+        Finds the worker owning every habitable cell.
+
+        Returns
+        -------
+        numpy.ndarray
+            Worker of every habitable cell, by cell index.
+        """
+        owner = np.empty(len(self.island.cells), dtype=np.int64)
+        for worker, (start, stop) in enumerate(strips):
+            rows = self.island.cell_grid[start:stop]
+            owner[rows[rows >= 0]] = worker
+        return owner
+
+    def _count_weights(self):
+        """
+        Weighs every habitable cell by the animals counted in the last year.
+
+        A cell with animals also costs one for running it at all.
+
+        Returns
+        -------
+        numpy.ndarray
+            Weight of every habitable cell, by cell index.
+        """
+        counts = sum(self.island.counts.values()).ravel()
+        grid = self.island.cell_grid.ravel()
+        animals = np.zeros(len(self.island.cells), dtype=np.int64)
+        animals[grid[grid >= 0]] = counts[grid >= 0]
+        return animals + (animals > 0)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+    def start(self):
+        """
+        Starts the worker processes and moves the animals of every strip to its worker.
+        """
+        island = self.island
+        island_map = '\n'.join(island.map_processed)
+        active_cells = sorted(island.active_cells)
+        self._parameters = _island_parameters(island)
+
+        cell_weights = np.zeros(len(island.cells), dtype=np.int64)
+        for index in active_cells:
+            cell_weights[index] = island._num_animals(index) + 1
+        self._partition(cell_weights)
+
+        for worker in range(self.workers):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker, daemon=True,
+                                              args=(worker_connection, type(island),
+                                                    island_map, island.rng.seed,
+                                                    self._parameters))
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+            cells = [(index, island._take_cell(index))
+                     for index in active_cells if self.owner[index] == worker]
+            self._send(worker, ('cells', worker, self.owner, island.year, cells))
+
+    def rebalance(self):
+        """
+        Chooses new strips from the counts of the last year and moves the cells
+        that change owner to their new worker.
+        """
+        self._partition(self._count_weights())
+
+        for worker in range(self.workers):
+            self._send(worker, ('rebalance', self.owner))
+
+        incoming = [[] for _ in self._connections]
+        for worker in range(self.workers):
+            for index, content in self._receive(worker):
+                incoming[self.owner[index]].append((index, content))
+
+        for worker, cells in enumerate(incoming):
+            self._send(worker, ('cells', worker, self.owner, self.island.year, cells))
+
+    def _lost(self, worker, error):
+        """
+        Marks the workers as failed after the connection to a worker was lost.
+
+        Returns
+        -------
+        RuntimeError
+            Error to raise, naming the strip of the worker.
+        """
+        self._failed = True
+        start, stop = self.strips[worker]
+        return RuntimeError(f'Lost worker process {worker} of strip rows {start}-{stop - 1}: '
+                            f'{error!r}')
+
+    def _send(self, worker, message):
+        """
+        Sends a message to a worker.
+
+        Raises
+        ------
+        RuntimeError
+            If the worker process has died.
+        """
+        try:
+            self._connections[worker].send(message)
+        except OSError as error:
+            raise self._lost(worker, error) from error
+
+    def _receive(self, worker):
+        """
+        Receives a reply from a worker.
+
+        Raises
+        ------
+        RuntimeError
+            If the worker failed or its process has died.
+        """
+        try:
+            status, reply = self._connections[worker].recv()
+        except (EOFError, OSError) as error:
+            raise self._lost(worker, error) from error
+        if status == 'error':
+            self._failed = True
+            raise RuntimeError(f'Worker process {worker} failed:\n{reply}')
+        return reply
+
+    def yearly_island_cycle(self, collect_specs=True):
+        """
+        Runs one year in all workers and collects the statistics in the island.
+
+        Parameters
+        ----------
+        collect_specs : bool
+            If False, the ages, weights and fitness of the animals are not sent to
+            the main process, and the specs of the island are left empty.
+        """
+        parameters = _island_parameters(self.island)
+        if parameters is self._parameters:
+            parameters = None
+        else:
+            self._parameters = parameters
+        start = time.perf_counter()
+        for worker in range(self.workers):
+            self._send(worker, ('year', parameters, collect_specs))
+
+        replies = [self._receive(worker) for worker in range(self.workers)]
+        seconds = time.perf_counter() - start
+
+        incoming = [[] for _ in self._connections]
+        for _, outgoing in replies:
+            for worker, arrival in outgoing:
+                incoming[worker].append(arrival)
+        for worker, arrivals in enumerate(incoming):
+            self._send(worker, ('arrivals', arrivals))
+
+        worker_stats = [stats for stats, _ in replies]
+        self._collect_stats(worker_stats)
+
+        busy = [stats['seconds'] for stats in worker_stats]
+        self.utilisation.append({'seconds': busy,
+                                 'utilisation': [worker_seconds / seconds
+                                                 for worker_seconds in busy],
+                                 'animals': [stats['animals'] for stats in worker_stats],
+                                 'strips': list(self.strips)})
+
+        self._years += 1
+        if self.rebalance_years and self._years % self.rebalance_years == 0:
+            self.rebalance()
+
+    def _collect_stats(self, worker_stats):
+        """
+        Puts the statistics from all workers into the island.
+
+        Parameters
+        ----------
+        worker_stats : list of dict
+            Statistics of every worker, in strip order.
+        """
+        island = self.island
+        island.specs = {'Herbivore': {'weight': [], 'age': [], 'fitness': []},
+                        'Carnivore': {'weight': [], 'age': [], 'fitness': []}}
+        for counts in island.counts.values():
+            counts.fill(0)
+
+        for stats in worker_stats:
+            for species, (positions, values) in stats['counts'].items():
+                island.counts[species].flat[positions] = values
+            if stats['specs'] is not None:
+                for species, specs in stats['specs'].items():
+                    for key, values in specs.items():
+                        island.specs[species][key].extend(values)
+
+        island.active_counts.append(sum(stats['active'] for stats in worker_stats))
+        island.collect_data()
+        island.year += 1
+
+        if island.counts_operations:
+            operations = [stats['operations'] for stats in worker_stats]
+            island.fitness_counts.append(
+                {species: _sum_counts([fitness[species] for fitness, _ in operations])
+                 for species in operations[0][0]})
+            island.sort_counts.append(_sum_counts([sort for _, sort in operations]))
+
+    def stop(self):
+        """
+        Moves the animals back to the island and stops the worker processes.
+
+        If a worker has failed, the processes are terminated and the animals they
+        owned are lost. Processes that have not ended after join_timeout seconds
+        are killed.
+        """
+        try:
+            if self._failed:
+                return
+            for worker in range(len(self._connections)):
+                self._send(worker, ('stop',))
+            for worker in range(len(self._connections)):
+                for index, content in self._receive(worker):
+                    self.island._put_cell(index, content)
+        finally:
+            for process in self._processes:
+                if self._failed:
+                    process.terminate()
+                process.join(self.join_timeout)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+            self._processes = []
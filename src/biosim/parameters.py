@@ -0,0 +1,237 @@
+"""
+Implements parameter sets, the parameters of one simulation.
+
+Every :class:`biosim.simulation.BioSim` has its own :class:`ParameterSet` with the
+parameters of all species and landscapes. A set is an immutable snapshot: changing
+a parameter makes a new set, which shares the constants of all unchanged species
+with the old one. Simulations can therefore share a set, and change it, without
+affecting each other.
+
+The island activates its set in the current thread while it runs, see
+:meth:`ParameterSet.activate`. Animals and cells then take their constants from the
+active set instead of from their class. The class-level parameters, set with e.g.
+:meth:`biosim.animals.Animal.set_parameters`, are only used when no set is active,
+and are the starting point of new simulations.
+"""
+
+import contextlib
+from types import MappingProxyType
+
+from .animals import Herbivore, Carnivore, SpeciesConstants, active_parameters
+from .cell import Lowland, Highland
+
+
+class ParameterSet:
+    """
+    Immutable parameters of all species and landscapes of one simulation.
+
+    Attributes
+    ----------
+    constants : mapping
+        Read-only view of the :class:`biosim.animals.SpeciesConstants` of every
+        species, by species name.
+    f_max : mapping
+        Read-only view of the maximum amount of fodder of every landscape, by
+        landscape type, e.g. 'Lowland'.
+    """
+
+    species = {'Herbivore': Herbivore, 'Carnivore': Carnivore}
+    landscapes = {'L': Lowland, 'H': Highland}
+
+    def __init__(self, animal_parameters, landscape_parameters):
+        """
+        Parameters
+        ----------
+        animal_parameters : dict
+            All parameters of every species, e.g. ``{'Herbivore': {'w_birth': 8., ...}}``.
+        landscape_parameters : dict
+            All parameters of every landscape code, e.g. ``{'L': {'f_max': 800}}``.
+        """
+        self._animal_parameters = {species: dict(animal_parameters[species])
+                                   for species in self.species}
+        self._landscape_parameters = {landscape: dict(landscape_parameters[landscape])
+                                      for landscape in self.landscapes}
+        self.constants = MappingProxyType(
+            {species: SpeciesConstants(parameters)
+             for species, parameters in self._animal_parameters.items()})
+        self.f_max = MappingProxyType(
+            {self.landscapes[landscape].type: parameters['f_max']
+             for landscape, parameters in self._landscape_parameters.items()})
+
+    @classmethod
+    def from_classes(cls):
+        """
+        Makes a set with the current class-level parameters.
+
+        Returns
+        -------
+        ParameterSet
+        """
+        return cls({species: animal_class.params
+                    for species, animal_class in cls.species.items()},
+                   {landscape: cell_class.get_parameters()
+                    for landscape, cell_class in cls.landscapes.items()})
+
+    @classmethod
+    def default(cls):
+        """
+        Makes a set with the default parameters.
+
+        Returns
+        -------
+        ParameterSet
+        """
+        return cls({species: animal_class.default_parameters
+                    for species, animal_class in cls.species.items()},
+                   {landscape: cell_class.default_parameters
+                    for landscape, cell_class in cls.landscapes.items()})
+
+    def as_dict(self):
+        """
+        Returns all parameters as plain dictionaries.
+
+        Returns
+        -------
+        dict
+            Keys 'animal_parameters' and 'landscape_parameters', the arguments of
+            :class:`ParameterSet` giving an equal set.
+        """
+        return {'animal_parameters': {species: dict(parameters) for species, parameters
+                                      in self._animal_parameters.items()},
+                'landscape_parameters': {landscape: dict(parameters) for landscape, parameters
+                                         in self._landscape_parameters.items()}}
+
+    def __reduce__(self):
+        # the constants are computed again when the set is unpickled
+        return ParameterSet, (self._animal_parameters, self._landscape_parameters)
+
+    def _replace(self, **attributes):
+        """Makes a new set with some attributes replaced and the others shared."""
+        changed = object.__new__(type(self))
+        changed.__dict__.update(self.__dict__, **attributes)
+        return changed
+
+    def animal_parameters(self, species):
+        """
+        Parameters of a species.
+
+        Parameters
+        ----------
+        species : str
+            Name of the species.
+
+        Returns
+        -------
+        mapping
+            Read-only view of the parameters.
+
+        Raises
+        ------
+        ValueError
+            If the species is invalid.
+        """
+        if species not in self.species:
+            raise ValueError("Invalid species. Choose between Herbivore and Carnivore")
+        return MappingProxyType(self._animal_parameters[species])
+
+    def landscape_parameters(self, landscape):
+        """
+        Parameters of a landscape.
+
+        Parameters
+        ----------
+        landscape : str
+            Code letter for landscape.
+
+        Returns
+        -------
+        mapping
+            Read-only view of the parameters.
+
+        Raises
+        ------
+        ValueError
+            If the landscape has no parameters.
+        """
+        if landscape not in self.landscapes:
+            raise ValueError("Invalid landscape. Only L and H has fodder")
+        return MappingProxyType(self._landscape_parameters[landscape])
+
+    def with_animal_parameters(self, species, new_parameters):
+        """
+        Makes a new set with changed parameters for a species.
+
+        Parameters
+        ----------
+        species : str
+            Name of the species.
+        new_parameters : dict
+            New parameter values.
+
+        Returns
+        -------
+        ParameterSet
+            The new set. The other species share their constants with this set.
+
+        Raises
+        ------
+        ValueError
+            If the species or any of the parameters are invalid,
+            see :meth:`biosim.animals.Animal.check_parameters`.
+        """
+        parameters = {**self.animal_parameters(species), **new_parameters}
+        self.species[species].check_parameters(new_parameters)
+
+        return self._replace(
+            _animal_parameters={**self._animal_parameters, species: parameters},
+            constants=MappingProxyType({**self.constants,
+                                        species: SpeciesConstants(parameters)}))
+
+    def with_landscape_parameters(self, landscape, new_parameters):
+        """
+        Makes a new set with changed parameters for a landscape.
+
+        Parameters
+        ----------
+        landscape : str
+            Code letter for landscape.
+        new_parameters : dict
+            New parameter values.
+
+        Returns
+        -------
+        ParameterSet
+            The new set. All species share their constants with this set.
+
+        Raises
+        ------
+        ValueError
+            If the landscape or any of the parameters are invalid.
+        """
+        parameters = {**self.landscape_parameters(landscape), **new_parameters}
+        cell_class = self.landscapes[landscape]
+        cell_class.check_parameters(new_parameters)
+
+        return self._replace(
+            _landscape_parameters={**self._landscape_parameters, landscape: parameters},
+            f_max=MappingProxyType({**self.f_max, cell_class.type: parameters['f_max']}))
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        Makes this the active set of the current thread inside a with statement.
+
+        Other threads, and code outside the with statement, are not affected.
+
+        Example
+        -------
+        .. code:: python
+
+            with parameters.activate():
+                island.yearly_island_cycle()
+        """
+        token = active_parameters.set(self)
+        try:
+            yield self
+        finally:
+            active_parameters.reset(token)
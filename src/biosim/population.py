@@ -0,0 +1,303 @@
+"""
+Implements a struct-of-arrays population for the array engine.
+
+Instead of one Python object per animal, all animals of one species in one cell
+are stored as parallel NumPy arrays. The array engine is selected with
+``BioSim(..., engine='array')`` and is driven by :class:`biosim.island.ArrayIsland`.
+"""
+
+import math
+
+import numpy as np
+
+from .animals import SortedPrey
+
+
+class Population:
+    """
+    All animals of one species in one cell, stored as parallel arrays.
+
+    Element ``i`` of :attr:`age`, :attr:`weight`, :attr:`fitness` and :attr:`alive`
+    describes the same animal. Dead animals stay in the arrays until :meth:`compact`
+    is called.
+    """
+
+    def __init__(self, animal_class):
+        """
+        Initializes an empty population.
+
+        Parameters
+        ----------
+        animal_class : type
+            Animal class, Herbivore or Carnivore, providing the parameters.
+        """
+        self.animal_class = animal_class
+        self.species = animal_class.__name__
+        self.age = np.empty(0, dtype=np.int64)
+        self.weight = np.empty(0, dtype=float)
+        self.fitness = np.empty(0, dtype=float)
+        self.alive = np.empty(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.age)
+
+    @property
+    def constants(self):
+        """Constants derived from the current parameters of the species."""
+        return self.animal_class.get_constants()
+
+    def add(self, ages, weights):
+        """
+        Adds animals to the population.
+
+        Parameters
+        ----------
+        ages : array_like
+            Ages of the new animals.
+        weights : array_like
+            Weights of the new animals.
+        """
+        ages = np.asarray(ages, dtype=np.int64)
+        weights = np.asarray(weights, dtype=float)
+
+        self.age = np.concatenate((self.age, ages))
+        self.weight = np.concatenate((self.weight, weights))
+        self.fitness = np.concatenate((self.fitness, self.calc_fitness(ages, weights)))
+        self.alive = np.concatenate((self.alive, np.ones(len(ages), dtype=bool)))
+
+    def calc_fitness(self, ages, weights):
+        """
+        Calculates fitness for arrays of ages and weights.
+
+        See :meth:`biosim.animals.Animal.calc_fitness_batch`.
+
+        Returns
+        -------
+        numpy.ndarray
+            Fitness of every animal.
+        """
+        return self.constants.calc_fitness_batch(ages, weights)
+
+    def _calc_one_fitness(self, age, weight):
+        """Scalar version of :meth:`calc_fitness`, used inside sequential loops."""
+        if weight <= 0:
+            return 0
+        c = self.constants
+        age_parameter = c.age_factor(age)
+        weight_parameter = 1 / (1 + math.exp(-c.phi_weight * (weight - c.w_half)))
+        return age_parameter * weight_parameter
+
+    def update_fitness(self):
+        """
+        Recalculates the fitness of all animals.
+        """
+        self.fitness = self.calc_fitness(self.age, self.weight)
+
+    def compact(self):
+        """
+        Removes dead animals from the arrays.
+        """
+        if not self.alive.all():
+            keep = self.alive
+            self.age = self.age[keep]
+            self.weight = self.weight[keep]
+            self.fitness = self.fitness[keep]
+            self.alive = self.alive[keep]
+
+    def take(self, selected):
+        """
+        Removes the selected animals and returns their ages and weights.
+
+        Parameters
+        ----------
+        selected : numpy.ndarray
+            Boolean mask of animals to remove.
+
+        Returns
+        -------
+        tuple
+            Ages and weights of the removed animals.
+        """
+        ages = self.age[selected]
+        weights = self.weight[selected]
+
+        keep = ~selected
+        self.age = self.age[keep]
+        self.weight = self.weight[keep]
+        self.fitness = self.fitness[keep]
+        self.alive = self.alive[keep]
+
+        return ages, weights
+
+    # Annual cycle methods
+    def procreation(self, rng):
+        """
+        Draws births for all animals at once and adds the newborns.
+
+        Follows the same rules as :meth:`biosim.animals.Animal.procreation`,
+        using the number of animals at the start of the step.
+
+        Parameters
+        ----------
+        rng : biosim.rng.BufferedGenerator
+            Random number generator.
+        """
+        n = len(self)
+        if n == 0:
+            return
+
+        c = self.constants
+        probability = np.minimum(1, c.gamma * self.fitness * n)
+        gives_birth = (self.weight >= c.offspring_value) & (rng.random(n) < probability)
+
+        num_births = np.count_nonzero(gives_birth)
+        if num_births == 0:
+            return
+
+        newborn_weight = rng.lognormal(c.birth_mu, c.birth_sigma, num_births)
+
+        parents = np.flatnonzero(gives_birth)
+        parent_loss = c.xi * newborn_weight
+        enough_weight = self.weight[parents] > parent_loss
+
+        parents = parents[enough_weight]
+        self.weight[parents] -= parent_loss[enough_weight]
+        self.fitness[parents] = self.calc_fitness(self.age[parents], self.weight[parents])
+
+        newborn_weight = newborn_weight[enough_weight]
+        self.add(np.zeros(len(newborn_weight), dtype=np.int64), newborn_weight)
+
+    def grazing(self, fodder):
+        """
+        Herbivores eat fodder in order of descending fitness.
+
+        Parameters
+        ----------
+        fodder : float
+            Fodder available in the cell.
+
+        Returns
+        -------
+        float
+            Fodder left in the cell.
+        """
+        if len(self) == 0 or fodder <= 0:
+            return fodder
+
+        c = self.constants
+        order = np.argsort(-self.fitness, kind="stable")
+
+        # every herbivore eats F, or what is left after the fitter ones have eaten
+        amount_eaten, fodder = c.feeding_batch(len(order), fodder)
+        fed = order[:len(amount_eaten)]
+
+        self.weight[fed] += amount_eaten * c.beta
+        self.fitness[fed] = self.calc_fitness(self.age[fed], self.weight[fed])
+
+        return fodder
+
+    def hunting(self, prey, rng):
+        """
+        Carnivores hunt the prey population in random order.
+
+        Every carnivore tries to kill the herbivores with the lowest fitness
+        first, following :meth:`biosim.animals.Carnivore.feeding`. The prey is
+        sorted once and shared by all carnivores, see :class:`biosim.animals.SortedPrey`,
+        so a carnivore only visits living prey it can kill, and only until it is full.
+        Killed prey is removed when all carnivores have eaten.
+
+        Parameters
+        ----------
+        prey : Population
+            Herbivore population in the same cell.
+        rng : biosim.rng.BufferedGenerator
+            Random number generator.
+        """
+        if len(self) == 0 or len(prey) == 0:
+            return
+
+        c = self.constants
+        appetite = c.F
+        beta = c.beta
+        delta_phi_max = c.delta_phi_max
+        uniform = rng.next_uniform
+
+        order = np.argsort(prey.fitness, kind="stable")
+        sorted_prey = SortedPrey(prey.fitness[order].tolist(), prey.alive[order].tolist())
+        prey_fitness = sorted_prey.fitness
+        prey_weight = prey.weight[order].tolist()
+        next_alive = sorted_prey.next_alive
+        killed = []
+
+        for carnivore in rng.permutation(len(self)).tolist():
+            age = int(self.age[carnivore])
+            weight = float(self.weight[carnivore])
+            fitness = float(self.fitness[carnivore])
+            amount_eaten = 0
+
+            # only the prey with a fitness not higher than the carnivore's can be killed
+            limit = sorted_prey.limit(fitness)
+            index = next_alive(0)
+            while index < limit and amount_eaten < appetite:
+                # the kill probability is diff_fitness / delta_phi_max, capped at 1,
+                # and 1 for prey with the same fitness as the carnivore
+                diff_fitness = fitness - prey_fitness[index]
+                if uniform() * delta_phi_max < diff_fitness or diff_fitness == 0:
+                    eating = min(appetite - amount_eaten, prey_weight[index])
+                    weight += eating * beta
+                    fitness = self._calc_one_fitness(age, weight)
+                    sorted_prey.kill(index)
+                    killed.append(index)
+                    amount_eaten += eating
+                    limit = sorted_prey.limit(fitness)
+
+                index = next_alive(index + 1)
+
+            self.weight[carnivore] = weight
+            self.fitness[carnivore] = fitness
+
+        if killed:
+            prey.alive[order[killed]] = False
+            prey.compact()
+
+    def migration(self, rng):
+        """
+        Draws which animals want to migrate.
+
+        Parameters
+        ----------
+        rng : biosim.rng.BufferedGenerator
+            Random number generator.
+
+        Returns
+        -------
+        numpy.ndarray
+            Boolean mask of animals that will migrate.
+        """
+        return rng.random(len(self)) < self.constants.mu * self.fitness
+
+    def aging(self):
+        """
+        Ages all animals by one year.
+        """
+        self.age += 1
+
+    def loss_of_weight(self):
+        """
+        All animals lose the fraction eta of their weight, and fitness is updated.
+        """
+        self.weight -= self.constants.eta * self.weight
+        self.update_fitness()
+
+    def death(self, rng):
+        """
+        Draws deaths for all animals and marks them as dead.
+
+        Parameters
+        ----------
+        rng : biosim.rng.BufferedGenerator
+            Random number generator.
+        """
+        probability_of_death = self.constants.omega * (1 - self.fitness)
+        dies = (self.weight <= 0) | (rng.random(len(self)) < probability_of_death)
+        self.alive &= ~dies
@@ -0,0 +1,139 @@
+"""
+Implements the random number generators used by one simulation.
+
+Every :class:`biosim.island.Island` owns a :class:`CellGenerator` and passes it
+to the cells and animals, so two simulations in one process do not share random
+numbers. Methods that are called without a generator use :data:`default_generator`.
+
+The island selects a separate stream for every year, cell and phase of the yearly
+cycle, so the random numbers a cell gets do not depend on which other cells are
+run before it, or in which process.
+"""
+
+from itertools import chain, islice
+
+import numpy as np
+
+
+class BufferedGenerator:
+    """
+    A :class:`numpy.random.Generator` that hands out uniform numbers from
+    pre-generated blocks.
+
+    Most draws in the simulation are single uniform numbers, and asking NumPy for
+    one number at a time is slow. Uniform numbers are therefore drawn in blocks of
+    block_size and chained into one stream, and both single numbers and arrays
+    are taken from that stream. Loops drawing many single numbers can call
+    :attr:`next_uniform` directly. The other distributions are drawn directly
+    from the generator.
+    """
+
+    block_size = 4096
+
+    def __init__(self, seed=None):
+        """
+        Parameters
+        ----------
+        seed : int, numpy.random.BitGenerator or None
+            Seed of the generator, or the bit generator to use.
+        """
+        self.generator = np.random.default_rng(seed)
+        self._restart()
+
+    def _restart(self):
+        """Drops the buffered numbers, the next number is drawn from the generator."""
+        self._stream = chain.from_iterable(self._blocks())
+        #: Returns the next uniform number in [0, 1) without any Python overhead.
+        self.next_uniform = self._stream.__next__
+
+    def _blocks(self):
+        """Draws new blocks of uniform numbers as they are needed."""
+        while True:
+            yield self.generator.random(self.block_size).tolist()
+
+    def random(self, size=None):
+        """
+        Returns uniform numbers in [0, 1).
+
+        Parameters
+        ----------
+        size : int or None
+            Number of values. If None, one float is returned.
+
+        Returns
+        -------
+        float or numpy.ndarray
+        """
+        if size is None:
+            return self.next_uniform()
+        return np.fromiter(islice(self._stream, size), float, size)
+
+    def lognormal(self, mean, sigma, size=None):
+        """Draws from a log-normal distribution, see :meth:`numpy.random.Generator.lognormal`."""
+        return self.generator.lognormal(mean, sigma, size)
+
+    def integers(self, low, high=None, size=None):
+        """Draws random integers, see :meth:`numpy.random.Generator.integers`."""
+        return self.generator.integers(low, high, size)
+
+    def permutation(self, x):
+        """Returns a random permutation, see :meth:`numpy.random.Generator.permutation`."""
+        return self.generator.permutation(x)
+
+    def shuffle(self, x):
+        """Shuffles a list in place, see :meth:`numpy.random.Generator.shuffle`."""
+        self.generator.shuffle(x)
+
+
+# Phases of the yearly cycle with their own random streams
+PROCREATION, FEEDING, MIGRATION, DEATH = range(4)
+
+
+class CellGenerator(BufferedGenerator):
+    """
+    A counter-based generator with one stream for every year, cell and phase.
+
+    The generator is a :class:`numpy.random.Philox` keyed by the seed. Philox
+    numbers are a function of the key and a 256-bit counter, and :meth:`select`
+    sets the counter to ``(0, phase, cell index, year)``. The draws of one phase
+    then only increase the lowest word, so the streams never overlap, and the same
+    cell gets the same numbers no matter how the cells are split or ordered.
+    """
+
+    block_size = 256
+
+    def __init__(self, seed=0):
+        """
+        Parameters
+        ----------
+        seed : int
+            Seed of the generator. The Philox key is the seed modulo :math:`2^{128}`,
+            so any integer is accepted, and a negative seed gives another key than
+            the non-negative seeds below :math:`2^{127}`.
+        """
+        self.seed = seed
+        super().__init__(np.random.Philox(key=seed % 2**128))
+        self._state = self.generator.bit_generator.state
+
+    def select(self, year, cell_index, phase):
+        """
+        Continues with the stream of one year, cell and phase.
+
+        Parameters
+        ----------
+        year : int
+            Year of the simulation.
+        cell_index : int
+            Index of the habitable cell.
+        phase : int
+            Phase of the yearly cycle, one of :data:`PROCREATION`, :data:`FEEDING`,
+            :data:`MIGRATION` and :data:`DEATH`.
+        """
+        self._state['state']['counter'][:] = (0, phase, cell_index, year)
+        self.generator.bit_generator.state = self._state
+        self._restart()
+
+
+#: Generator used when cells and animals are called without one. It has a fixed seed,
+#: so code using it gives the same results every run.
+default_generator = BufferedGenerator(0)
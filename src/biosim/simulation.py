@@ -1,13 +1,17 @@
 """
 Implements a complete simulation for BioSim class.
 """
-from .island import Island
-from .cell import Lowland, Highland
-from .animals import Herbivore, Carnivore
+from .island import Island, ArrayIsland
 from .graphics import Graphics
+from .parallel import StripWorkers
+from .parameters import ParameterSet
+from .log import PopulationLog, log_path
 
-import csv
-import pickle
+import json
+import os
+from pathlib import Path
+
+import numpy as np
 
 
 # The material in this file is licensed under the BSD 3-clause license
@@ -21,6 +25,9 @@ class BioSim:
     of the ecosystem.
     Choose between multiple different parameters to adjust your simulation and preferred output.
     """
+    # version of the checkpoint files written by save_checkpoint
+    checkpoint_version = 1
+
     _default_map = """\
                WWWWWWWWWWWWWWWWWWWWW
                WWWWWWWWHWWWWLLLLLLLW
@@ -39,7 +46,8 @@ class BioSim:
     def __init__(self, island_map=None, ini_pop=None, seed=123,
                  vis_years=1, ymax_animals=None, cmax_animals=None, hist_specs=None,
                  img_years=None, img_dir=None, img_base=None, img_fmt='png',
-                 log_file=None):
+                 log_file=None, engine='object', workers=1, rebalance_years=10, parameters=None,
+                 log_flush_years=10, log_fsync_years=None, keep_history=True):
         """
         Initializes the BioSim class with the following parameters:
 
@@ -68,7 +76,24 @@ class BioSim:
         img_fmt : str
             File type for figures, e.g. 'png' or 'pdf'
         log_file : str
-            If given, write animal counts to this file
+            If given, write animal counts to this file while simulating, see
+            :class:`biosim.log.PopulationLog`
+        engine : str
+            Population engine, 'object' (default) or 'array'
+        workers : int
+            Number of processes running the yearly cycle (default: 1)
+        rebalance_years : int
+            Years between choosing new strips with `workers` > 1, 0 to keep the first
+            strips (default: 10)
+        parameters : biosim.parameters.ParameterSet
+            Parameters of all species and landscapes (default: the current class-level
+            parameters)
+        log_flush_years : int
+            Years buffered before they are written to the log file (default: 10)
+        log_fsync_years : int
+            Years between syncing the log file to disk (default: None, never)
+        keep_history : bool
+            If False, `pop_history` only holds the last year (default: True)
 
         Notes
         -----
@@ -100,20 +125,62 @@ class BioSim:
           where `img_number` are consecutive image numbers starting from 0.
 
         - `img_dir` and `img_base` must either be both None or both strings.
+        - The 'object' engine keeps every animal as an object in lists in each cell.
+          The 'array' engine keeps the animals of each species in each cell as NumPy
+          arrays, which uses far less memory and time for large populations.
+          Both engines give the same public API and statistics.
+        - With `workers` > 1, the map is split into strips of rows, and the cells
+          of every strip are run in their own process during :meth:`simulate`.
+          The results are identical to a run with one worker. The strips are
+          chosen again every `rebalance_years` years so every worker has about the
+          same number of animals, and `worker_utilisation` gets the time spent by each worker
+          every year, see :class:`biosim.parallel.StripWorkers`.
+        - The log file is a CSV file, or a binary file if its name ends with '.bin',
+          see :mod:`biosim.log`. Without either suffix, '.csv' is added.
+          The counts of every year are appended while :meth:`simulate` runs.
+        - Every simulation has its own parameters, see :attr:`parameters`.
+          :meth:`set_animal_parameters` and :meth:`set_landscape_parameters` only
+          change the parameters of this simulation, so several simulations can run
+          in one process, also in different threads.
         """
 
         self.final_year = None
         self.current_year = 0
 
+        # output options, stored in checkpoints
+        self._options = {'vis_years': vis_years, 'ymax_animals': ymax_animals,
+                         'cmax_animals': cmax_animals, 'hist_specs': hist_specs,
+                         'img_years': img_years, 'img_dir': img_dir, 'img_base': img_base,
+                         'img_fmt': img_fmt, 'log_file': log_file, 'workers': workers,
+                         'rebalance_years': rebalance_years,
+                         'log_flush_years': log_flush_years, 'log_fsync_years': log_fsync_years,
+                         'keep_history': keep_history}
+
         if island_map is None:
             island_map = self._default_map
             print('Using default map')
 
-        self.island = Island(island_map, seed)
+        engines = {'object': Island, 'array': ArrayIsland}
+        if engine not in engines:
+            raise ValueError(f"Invalid engine: {engine}. Choose between {list(engines)}")
+        if parameters is None:
+            parameters = ParameterSet.from_classes()
+        self.engine = engine
+        self.island = engines[engine](island_map, seed, parameters)
+
+        if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+            raise ValueError('workers must be a positive integer')
+        if (not isinstance(rebalance_years, int) or isinstance(rebalance_years, bool)
+                or rebalance_years < 0):
+            raise ValueError('rebalance_years must be a non-negative integer')
+        self.workers = workers
+        self.rebalance_years = rebalance_years
+        self.worker_utilisation = []
 
         if ini_pop is not None:
             self.island.add_population(ini_pop)
         self.pop_history = {'Herbivore': {}, 'Carnivore': {}}
+        self.keep_history = keep_history
 
         if vis_years <= 0 and type(vis_years) != int:
             raise ValueError('vis_years must be a positive integer')
@@ -132,7 +199,21 @@ class BioSim:
         else:
             print('Visualization is disabled')
 
-        self.log_file = log_file
+        self.log_file = None if log_file is None else str(log_path(log_file))
+        self.log_flush_years = log_flush_years
+        self.log_fsync_years = log_fsync_years
+
+    @property
+    def parameters(self):
+        """
+        Parameters of all species and landscapes in this simulation.
+
+        Return
+        -------
+        parameters : biosim.parameters.ParameterSet
+            Immutable parameter set, replaced by a new set when parameters are changed.
+        """
+        return self.island.parameters
 
     def set_animal_parameters(self, species, new_parameters):
         """
@@ -164,13 +245,7 @@ class BioSim:
 
         """
 
-        if species == "Herbivore":
-            Herbivore.set_parameters(new_parameters)
-
-        elif species == "Carnivore":
-            Carnivore.set_parameters(new_parameters)
-        else:
-            raise ValueError("Invalid species. Choose between Herbivore and Carnivore")
+        self.island.parameters = self.parameters.with_animal_parameters(species, new_parameters)
 
     def set_landscape_parameters(self, landscape, new_parameters):
         """
@@ -200,22 +275,38 @@ class BioSim:
         and by decreasing the f_max, the amount of fodder is decreased.
 
         """
-        if landscape == "L":
-            Lowland.set_parameters(new_parameters)
-        elif landscape == "H":
-            Highland.set_parameters(new_parameters)
-        else:
-            raise ValueError("Invalid landscape. Only L and H has fodder")
+        self.island.parameters = self.parameters.with_landscape_parameters(landscape,
+                                                                           new_parameters)
 
-    def simulate(self, num_years):
+    def simulate(self, num_years, checkpoint_every=None, checkpoint_dir=None,
+                 keep_checkpoints=3):
         """
         Run simulation while visualizing the result. Look at __init__
         for information about the parameters and features.
 
         :param num_years: number of simulation steps to execute
+        :param checkpoint_every: years between checkpoints, None for no checkpoints
+        :param checkpoint_dir: directory of the checkpoints
+        :param keep_checkpoints: number of newest checkpoints kept, None to keep all
 
         .. note:: If image directory is given then image files will be numbered consecutively.
+
+        .. note:: With `checkpoint_every`, a checkpoint, see :meth:`save_checkpoint`,
+            is written to `checkpoint_dir` after every year divisible by it, and the
+            older checkpoints beyond `keep_checkpoints` are deleted. After a crash,
+            :meth:`resume` loads the newest checkpoint, and the rest of the run gives
+            the same result as without the crash.
         """
+        if checkpoint_every is not None:
+            if (not isinstance(checkpoint_every, int) or isinstance(checkpoint_every, bool)
+                    or checkpoint_every < 1):
+                raise ValueError('checkpoint_every must be a positive integer')
+            if checkpoint_dir is None:
+                raise ValueError('checkpoint_dir must be given with checkpoint_every')
+            if keep_checkpoints is not None and (not isinstance(keep_checkpoints, int)
+                                                 or isinstance(keep_checkpoints, bool)
+                                                 or keep_checkpoints < 1):
+                raise ValueError('keep_checkpoints must be a positive integer or None')
 
         self.final_year = self.current_year + num_years
 
@@ -228,28 +319,78 @@ class BioSim:
 
         self.update_graphics()
 
-        while self.current_year < self.final_year:
+        log = None
+        if self.log_file is not None:
+            log = PopulationLog(self.log_file, tuple(self.pop_history),
+                                start_year=self.current_year,
+                                flush_years=self.log_flush_years,
+                                fsync_years=self.log_fsync_years)
+
+        strips = None
+        try:
+            if log is not None:
+                log.write(self.current_year, self.island.pop)
+
+            if self.workers > 1:
+                strips = StripWorkers(self.island, self.workers, self.rebalance_years)
+                strips.start()
+
+            while self.current_year < self.final_year:
+
+                if strips is None:
+                    self.island.yearly_island_cycle()
+                else:
+                    strips.yearly_island_cycle(self._is_graphics_year(self.current_year + 1))
+                self.current_year += 1
+                year = self.current_year
+                print(f"\rSimulating... year: {year} out of {self.final_year}", flush=True,
+                      end='')
+                self.update_history_data()
+                if log is not None:
+                    log.write(year, self.island.pop)
+
+                self.update_graphics()
+
+                if checkpoint_every is not None and year % checkpoint_every == 0:
+                    # the log is flushed so it has every year of the checkpoint, and
+                    # the animals are in the workers, so they are collected first
+                    if log is not None:
+                        log.flush()
+                    if strips is not None:
+                        strips.stop()
+                    self._write_checkpoint(checkpoint_dir, keep_checkpoints)
+                    if strips is not None:
+                        strips.start()
+        finally:
+            if strips is not None:
+                strips.stop()
+                self.worker_utilisation.extend(strips.utilisation)
+            if log is not None:
+                log.close()
+        print()
 
-            self.island.yearly_island_cycle()
-            self.current_year += 1
-            year = self.current_year
-            print(f"\rSimulating... year: {year} out of {self.final_year}", flush=True, end='')
-            self.update_history_data()
+    def _is_graphics_year(self, year):
+        """
+        Checks if the graphics are updated after a year.
 
-            self.update_graphics()
-        print()
+        Parameters
+        ----------
+        year : int
+            Year of the simulation.
 
-        if self.log_file is not None:
-            print(f"Saving log file to {self.log_file}")
-            self.save_log_file()
+        Returns
+        -------
+        bool
+        """
+        return self.vis_years != 0 and year % self.vis_years == 0
 
     def update_graphics(self):
-        if self.vis_years != 0 and self.current_year % self.vis_years == 0:
+        if self._is_graphics_year(self.current_year):
             self.graphics.update(self.current_year,
                                  herbivore_population=self.island.pop['Herbivore'],
                                  carnivore_population=self.island.pop['Carnivore'],
-                                 herbivore_dict_map=self.island.pop_in_cell['Herbivore'],
-                                 carnivore_dict_map=self.island.pop_in_cell['Carnivore'],
+                                 herbivore_dict_map=self.island.counts['Herbivore'],
+                                 carnivore_dict_map=self.island.counts['Carnivore'],
                                  herbivore_age_list=self.island.specs['Herbivore']['age'],
                                  carnivore_age_list=self.island.specs['Carnivore']['age'],
                                  herbivore_weight_list=self.island.specs['Herbivore']['weight'],
@@ -260,7 +401,12 @@ class BioSim:
     def update_history_data(self):
         """
         Updates history data for visualization.
+
+        Without `keep_history`, the earlier years are removed.
         """
+        if not self.keep_history:
+            for species_history in self.pop_history.values():
+                species_history.clear()
 
         self.pop_history['Herbivore'][self.current_year] = self.island.pop['Herbivore']
         self.pop_history['Carnivore'][self.current_year] = self.island.pop['Carnivore']
@@ -297,7 +443,10 @@ class BioSim:
 
     def save_log_file(self):
         """
-        Save population history as a csv file.
+        Save population history as a log file, with all years in `pop_history`.
+
+        :meth:`simulate` writes the log file while it runs, so this is only needed
+        to write the history again.
 
         Example
         -------
@@ -312,47 +461,216 @@ class BioSim:
         if self.log_file is None:
             return
 
-        if self.log_file[-4:] != ".csv":
-            self.log_file += ".csv"
+        with PopulationLog(self.log_file, tuple(self.pop_history),
+                           flush_years=self.log_flush_years,
+                           fsync_years=self.log_fsync_years) as log:
+            for year in sorted(self.pop_history['Herbivore']):
+                log.write(year, {species: species_history[year]
+                                 for species, species_history in self.pop_history.items()})
 
-        with open(self.log_file, "w") as file:
-            writer = csv.writer(file)
-            header = ["year"] + list(self.pop_history.keys())
-            writer.writerow(header)
+    def save_checkpoint(self, file_name):
+        """
+        Saves the state of the simulation to a binary checkpoint file.
 
-            for year in range(self.current_year + 1):
-                count = [self.pop_history[species][year] for species in self.pop_history.keys()]
-                row = [year] + count
-                writer.writerow(row)
+        The file is an uncompressed NumPy ``.npz`` file with the map, engine, seed,
+        parameters, output options, current year, population history, fodder and
+        active cells, and the species, cell, age, weight, fitness and alive flag
+        of every animal as contiguous arrays. The random numbers of a year only
+        depend on the seed and the year, see :class:`biosim.rng.CellGenerator`, so
+        a simulation loaded with :meth:`load_checkpoint` continues exactly as this one.
+        Graphics and the fitness and sort counts are not stored.
 
-    def _save_simulation(self, file_name):
+        The file is written under a temporary name, flushed to disk and renamed, so
+        an existing checkpoint is never replaced by a partly written one.
+
+        Parameters
+        ----------
+        file_name : str or pathlib.Path
+            Name of the file, '.npz' is added if missing.
+
+        Returns
+        -------
+        pathlib.Path
+            Path of the file written.
         """
-        Save the simulation to a file.
+        path = Path(file_name)
+        if path.suffix != '.npz':
+            path = path.with_name(path.name + '.npz')
+
+        island = self.island
+        years = sorted(self.pop_history['Herbivore'])
+        history = {f'history_{species}': np.array([species_history[year] for year in years],
+                                                  dtype=np.int64)
+                   for species, species_history in self.pop_history.items()}
+        animals = {f'animal_{name}': values for name, values in island._animal_arrays().items()}
+        fodder = np.array([getattr(cell, 'fodder', np.nan) for cell in island.cells], dtype=float)
+
+        # written under a temporary name and renamed, so there is never a partial file
+        temporary = path.with_name(path.name + '.tmp')
+        with open(temporary, 'wb') as file:
+            np.savez(file,
+                     checkpoint_version=self.checkpoint_version,
+                     island_map='\n'.join(island.map_processed),
+                     engine=self.engine,
+                     seed=island.rng.seed,
+                     parameters=json.dumps(self.parameters.as_dict()),
+                     options=json.dumps(self._options, default=str),
+                     current_year=self.current_year,
+                     final_year=-1 if self.final_year is None else self.final_year,
+                     island_year=island.year,
+                     history_years=np.array(years, dtype=np.int64),
+                     fodder=fodder,
+                     active_cells=np.array(sorted(island.active_cells), dtype=np.int64),
+                     active_counts=np.array(island.active_counts, dtype=np.int64),
+                     **history, **animals)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+        return path
+
+    @classmethod
+    def load_checkpoint(cls, file_name, **kwargs):
+        """
+        Loads a simulation from a checkpoint file written by :meth:`save_checkpoint`.
 
-        :param file_name: name of file to save to
+        Parameters
+        ----------
+        file_name : str or pathlib.Path
+            Name of the checkpoint file.
+        **kwargs
+            Output options of :class:`BioSim`, e.g. `vis_years`, replacing the stored
+            options. The map, population, seed, engine and parameters are taken from
+            the checkpoint and cannot be replaced.
+
+        Returns
+        -------
+        BioSim
+            Simulation continuing from the year of the checkpoint.
 
-        This feature is not fully implemented yet.
+        Raises
+        ------
+        ValueError
+            If the file is not a checkpoint of a version this class can read, or if
+            kwargs are not output options.
+        """
+        with np.load(file_name) as data:
+            version = int(data['checkpoint_version']) if 'checkpoint_version' in data else None
+            if version != cls.checkpoint_version:
+                raise ValueError(f'Unsupported checkpoint version: {version}')
+
+            options = json.loads(str(data['options']))
+            not_options = sorted(set(kwargs) - set(options))
+            if not_options:
+                raise ValueError(f'Only output options can be given with a checkpoint, '
+                                 f'not {not_options}')
+            options.update(kwargs)
+            parameters = ParameterSet(**json.loads(str(data['parameters'])))
+            sim = cls(str(data['island_map']), seed=int(data['seed']), engine=str(data['engine']),
+                      parameters=parameters, **options)
+
+            sim.current_year = int(data['current_year'])
+            if int(data['final_year']) >= 0:
+                sim.final_year = int(data['final_year'])
+            years = data['history_years'].tolist()
+            for species, species_history in sim.pop_history.items():
+                species_history.update(zip(years, data[f'history_{species}'].tolist()))
+
+            island = sim.island
+            island.year = int(data['island_year'])
+            island.active_counts = data['active_counts'].tolist()
+            island.active_cells = set(data['active_cells'].tolist())
+            for cell, fodder in zip(island.cells, data['fodder'].tolist()):
+                if hasattr(cell, 'fodder'):
+                    cell.fodder = fodder
+            island._put_animal_arrays({name[len('animal_'):]: data[name]
+                                       for name in data.files if name.startswith('animal_')})
+
+        sim.update_island_data()
+        return sim
+
+    @staticmethod
+    def _find_checkpoints(checkpoint_dir):
+        """
+        Finds the checkpoints written by :meth:`simulate` in a directory.
+
+        Returns
+        -------
+        list of tuples
+            Year and path of every checkpoint, oldest first.
+        """
+        checkpoints = []
+        for path in Path(checkpoint_dir).glob('checkpoint_*.npz'):
+            year = path.stem[len('checkpoint_'):]
+            if year.isdigit():
+                checkpoints.append((int(year), path))
+        return sorted(checkpoints)
+
+    def _write_checkpoint(self, checkpoint_dir, keep_checkpoints):
+        """
+        Writes a checkpoint of the current year, and deletes the oldest checkpoints
+        beyond keep_checkpoints.
+        """
+        directory = Path(checkpoint_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.save_checkpoint(directory / f'checkpoint_{self.current_year:06d}.npz')
+
+        if keep_checkpoints is not None:
+            for _, path in self._find_checkpoints(directory)[:-keep_checkpoints]:
+                path.unlink()
+
+    @classmethod
+    def resume(cls, checkpoint_dir, **kwargs):
+        """
+        Loads the newest checkpoint written by :meth:`simulate`.
+
+        The years left of the interrupted run are ``sim.final_year - sim.year``.
+
+        Example
+        -------
+        .. code:: python
+
+            sim = BioSim.resume('checkpoints')
+            sim.simulate(sim.final_year - sim.year, checkpoint_every=10,
+                         checkpoint_dir='checkpoints')
+
+        Parameters
+        ----------
+        checkpoint_dir : str or pathlib.Path
+            Directory of the checkpoints.
+        **kwargs
+            Output options, see :meth:`load_checkpoint`.
+
+        Returns
+        -------
+        BioSim
+
+        Raises
+        ------
+        ValueError
+            If there are no checkpoints in the directory.
         """
-        if file_name[-4:] != ".pkl":
-            file_name += ".pkl"
+        checkpoints = cls._find_checkpoints(checkpoint_dir)
+        if not checkpoints:
+            raise ValueError(f'No checkpoints in {checkpoint_dir}')
+        return cls.load_checkpoint(checkpoints[-1][1], **kwargs)
 
-        with open(file_name, "wb") as file:
-            pickle.dump(self, file)
+    def _save_simulation(self, file_name):
+        """
+        Save the simulation to a file, see :meth:`save_checkpoint`.
+
+        :param file_name: name of file to save to
+        """
+        return self.save_checkpoint(file_name)
 
     @staticmethod
     def _load_simulation(file_name):
         """
-        Load a simulation from a file.
+        Load a simulation from a file, see :meth:`load_checkpoint`.
 
         :param file_name: name of file to load from
         :return: simulation object
-
-        This feature is not fully implemented yet.
         """
-        with open(file_name, "rb") as file:
-            sim = pickle.load(file)
-
-        return sim
+        return BioSim.load_checkpoint(file_name)
 
     @property
     def year(self):
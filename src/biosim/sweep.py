@@ -0,0 +1,359 @@
+"""
+Implements parameter sweeps with results stored on disk.
+
+A sweep runs one headless simulation for every point of a parameter grid and every
+seed, see :func:`biosim.ensemble.run_replica`. Parameters are named
+``'<species or landscape>.<parameter>'``, e.g. ``'Herbivore.gamma'`` or
+``'L.f_max'``.
+
+Every result is saved in its own ``.npz`` file in a :class:`SweepStore`, named by
+a hash of the map, initial population, parameters, seed, number of years and
+engine. Points that are already in the store are skipped, so an interrupted sweep
+continues where it stopped when it is run again. When the sweep is done, the
+results are consolidated into one columnar table, see :meth:`SweepStore.consolidate`.
+"""
+
+import functools
+import hashlib
+import itertools
+import json
+import multiprocessing
+import numbers
+import os
+from pathlib import Path
+
+import numpy as np
+
+from .ensemble import run_replica
+from .parameters import ParameterSet
+from .simulation import BioSim
+
+
+def parameter_grid(grid):
+    """
+    Makes all combinations of parameter values.
+
+    Parameters
+    ----------
+    grid : dict
+        Values of every parameter, e.g. ``{'Herbivore.gamma': [0.1, 0.2]}``.
+
+    Returns
+    -------
+    list of dict
+        One dictionary with a value for every parameter for each point.
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def split_point(point):
+    """
+    Splits the parameters of a point into animal and landscape parameters.
+
+    Parameters
+    ----------
+    point : dict
+        Parameter values, e.g. ``{'Herbivore.gamma': 0.1, 'L.f_max': 700}``.
+
+    Returns
+    -------
+    tuple
+        Animal parameters and landscape parameters, as taken by
+        :func:`biosim.ensemble.run_replica`.
+
+    Raises
+    ------
+    ValueError
+        If a parameter name is not '<species or landscape>.<parameter>', the
+        landscape has no parameters, or the species or landscape has no such
+        parameter.
+    """
+    animal_parameters, landscape_parameters = {}, {}
+    for name, value in point.items():
+        owner, _, parameter = name.partition('.')
+        if not parameter:
+            raise ValueError(f"Invalid parameter name: {name}. Use '<species>.<parameter>'")
+        if owner in ParameterSet.species:
+            parameters = animal_parameters
+            defaults = ParameterSet.species[owner].default_parameters
+        elif owner in ParameterSet.landscapes:
+            parameters = landscape_parameters
+            defaults = ParameterSet.landscapes[owner].default_parameters
+        else:
+            raise ValueError(f"Invalid parameter name: {name}. Choose a species or landscape "
+                             f"among {list(ParameterSet.species) + list(ParameterSet.landscapes)}")
+        if parameter not in defaults:
+            raise ValueError(f"Invalid parameter name: {name}. {owner} has the parameters "
+                             f"{list(defaults)}")
+        parameters.setdefault(owner, {})[parameter] = value
+    return animal_parameters, landscape_parameters
+
+
+def point_key(point, seed, num_years, island_map=None, ini_pop=None, engine='object'):
+    """
+    Makes the key of one simulation in a sweep.
+
+    Parameters
+    ----------
+    point : dict
+        Parameter values.
+    seed : int
+        Seed of the simulation.
+    num_years : int
+        Number of years to simulate.
+    island_map : str
+        Multi-line string with island geography, the default map of BioSim if None.
+    ini_pop : list
+        List of dictionaries specifying initial population.
+    engine : str
+        Population engine.
+
+    Returns
+    -------
+    str
+        SHA-256 hash of all inputs. Numeric parameter values are hashed as floats,
+        so e.g. 1 and 1.0 give the same key.
+    """
+    if island_map is None:
+        island_map = BioSim._default_map
+    lines = [line.strip() for line in island_map.split('\n') if line.strip()]
+    parameters = {name: float(value) if isinstance(value, numbers.Real)
+                  and not isinstance(value, bool) else value
+                  for name, value in point.items()}
+
+    inputs = {'map': lines, 'ini_pop': ini_pop, 'parameters': parameters, 'seed': seed,
+              'num_years': num_years, 'engine': engine}
+    text = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class SweepStore:
+    """
+    Directory with the results of a sweep.
+
+    Every simulation is first saved in its own ``.npz`` file, holding the columns of
+    one row of the result table: the key, the seed, the parameter values and the
+    number of animals of every species in every year. :meth:`consolidate` collects
+    these rows into one columnar table, ``table.npz``, and removes the files.
+    """
+
+    table_name = 'table.npz'
+
+    def __init__(self, directory):
+        """
+        Parameters
+        ----------
+        directory : str or pathlib.Path
+            Directory of the store, created if it does not exist.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._table_keys = set(self._table_rows_keys())
+
+    def _path(self, key):
+        return self.directory / f'{key}.npz'
+
+    def _table_rows_keys(self):
+        """Returns the keys of the consolidated table."""
+        if not (self.directory / self.table_name).exists():
+            return []
+        with np.load(self.directory / self.table_name) as data:
+            return data['key'].tolist()
+
+    def _file_keys(self):
+        """Returns the keys of the simulations saved in their own files."""
+        return sorted(path.stem for path in self.directory.glob('*.npz')
+                      if not path.name.endswith('.tmp.npz') and path.name != self.table_name)
+
+    def __contains__(self, key):
+        return key in self._table_keys or self._path(key).exists()
+
+    def keys(self):
+        """
+        Returns the keys of all stored simulations.
+
+        Returns
+        -------
+        list of str
+        """
+        return sorted(self._table_keys.union(self._file_keys()))
+
+    def save(self, key, point, seed, populations):
+        """
+        Saves the result of one simulation.
+
+        The file is written under a temporary name and then renamed, so an interrupted
+        sweep never leaves a partly written result.
+
+        Parameters
+        ----------
+        key : str
+            Key from :func:`point_key`.
+        point : dict
+            Parameter values.
+        seed : int
+            Seed of the simulation.
+        populations : dict
+            Number of animals of every species in every year, as arrays.
+        """
+        temporary = self.directory / f'{key}.tmp.npz'
+        columns = {f'param:{name}': value for name, value in point.items()}
+        columns.update({f'pop:{species}': counts for species, counts in populations.items()})
+        np.savez(temporary, key=key, seed=seed, **columns)
+        os.replace(temporary, self._path(key))
+
+    def _rows(self):
+        """Returns the stored simulations as rows, from the table and from their files."""
+        rows = []
+        if self._table_keys:
+            with np.load(self.directory / self.table_name) as data:
+                columns = {name: data[name] for name in data.files}
+            for index in range(len(columns['key'])):
+                row = {name: column[index] for name, column in columns.items()}
+                rows.append({name: value for name, value in row.items()
+                             if not (name.startswith('param:') and np.isnan(value))})
+        for key in self._file_keys():
+            if key not in self._table_keys:
+                with np.load(self._path(key)) as data:
+                    rows.append({name: data[name] for name in data.files})
+        return rows
+
+    def _columns(self):
+        """
+        Makes the columns of the result table, named 'param:<name>' for parameters
+        and 'pop:<species>' for populations.
+        """
+        rows = self._rows()
+
+        parameter_names = sorted({name for row in rows for name in row
+                                  if name.startswith('param:')})
+        species_names = sorted({name for row in rows for name in row
+                                if name.startswith('pop:')})
+        if len({len(row[name]) for row in rows for name in species_names}) > 1:
+            raise ValueError('All simulations in the store must have the same number of years')
+
+        columns = {'key': np.array([str(row['key']) for row in rows]),
+                   'seed': np.array([int(row['seed']) for row in rows], dtype=np.int64)}
+        for name in parameter_names:
+            columns[name] = np.array([float(row[name]) if name in row else np.nan
+                                      for row in rows])
+        for name in species_names:
+            columns[name] = np.stack([row[name] for row in rows])
+        return columns
+
+    def consolidate(self):
+        """
+        Collects all results into the columnar table of the store.
+
+        The table is written under a temporary name and then renamed, and only then
+        are the files of the single simulations removed, so an interrupted
+        consolidation loses no results.
+
+        Returns
+        -------
+        int
+            Number of simulations in the table.
+
+        Raises
+        ------
+        ValueError
+            If the simulations have a different number of years.
+        """
+        file_keys = self._file_keys()
+        if not file_keys:
+            return len(self._table_keys)
+
+        columns = self._columns()
+        temporary = self.directory / 'table.tmp.npz'
+        np.savez(temporary, **columns)
+        os.replace(temporary, self.directory / self.table_name)
+        self._table_keys = set(columns['key'].tolist())
+
+        for key in file_keys:
+            self._path(key).unlink()
+        return len(self._table_keys)
+
+    def load(self):
+        """
+        Loads all results as one table.
+
+        Returns
+        -------
+        dict
+            Columns 'key' and 'seed', one column for every parameter, with NaN where
+            a simulation did not set it, and one array with shape
+            (number of simulations, num_years + 1) for every species.
+
+        Raises
+        ------
+        ValueError
+            If the simulations have a different number of years.
+        """
+        return {name.split(':', 1)[-1]: column for name, column in self._columns().items()}
+
+
+def _run_task(task, num_years, **kwargs):
+    """Runs one point with one seed, and returns it with its key."""
+    key, point, seed = task
+    animal_parameters, landscape_parameters = split_point(point)
+    replica = run_replica(seed, num_years, animal_parameters=animal_parameters,
+                          landscape_parameters=landscape_parameters, **kwargs)
+    return key, point, seed, replica.populations
+
+
+def run_sweep(points, seeds, num_years, store, workers=None, island_map=None, ini_pop=None,
+              engine='object'):
+    """
+    Runs every point with every seed that is not in the store yet, and then
+    consolidates the store, see :meth:`SweepStore.consolidate`.
+
+    Parameters
+    ----------
+    points : list of dict
+        Parameter values of every point, e.g. from :func:`parameter_grid`.
+    seeds : list of int
+        Seeds to run every point with.
+    num_years : int
+        Number of years to simulate.
+    store : SweepStore or str or pathlib.Path
+        Store of the results, or its directory.
+    workers : int or None
+        Number of processes, the number of CPUs if None.
+    island_map : str
+        Multi-line string with island geography, the default map of BioSim if None.
+    ini_pop : list
+        List of dictionaries specifying initial population.
+    engine : str
+        Population engine, 'object' or 'array'.
+
+    Returns
+    -------
+    int
+        Number of simulations that were run.
+
+    Raises
+    ------
+    ValueError
+        If a parameter name is invalid, see :func:`split_point`.
+    """
+    if not isinstance(store, SweepStore):
+        store = SweepStore(store)
+
+    tasks = []
+    for point in points:
+        split_point(point)
+        for seed in seeds:
+            key = point_key(point, seed, num_years, island_map, ini_pop, engine)
+            if key not in store:
+                tasks.append((key, point, seed))
+
+    if tasks:
+        run = functools.partial(_run_task, num_years=num_years, island_map=island_map,
+                                ini_pop=ini_pop, engine=engine)
+        with multiprocessing.Pool(workers) as pool:
+            for key, point, seed, populations in pool.imap_unordered(run, tasks):
+                store.save(key, point, seed, populations)
+
+    store.consolidate()
+    return len(tasks)
@@ -2,9 +2,10 @@ import pytest
 from pytest import approx
 import math
 from math import exp
+import numpy as np
 import scipy.stats as stats
 
-from biosim.animals import Herbivore, Carnivore
+from biosim.animals import Herbivore, Carnivore, Prey
 
 
 def std_herb():
@@ -137,6 +138,32 @@ def test_bad_params(reset_default_params, species, change):
             Carnivore.set_parameters(change)
 
 
+@pytest.mark.parametrize("species", [Herbivore, Carnivore])
+def test_constants_follow_parameters(reset_default_params, species):
+    """Test that derived constants are recomputed with a new version when parameters change"""
+    old_constants = species.get_constants()
+    species.set_parameters({"zeta": 2, "w_birth": 10, "sigma_birth": 2, "F": 20})
+    constants = species.get_constants()
+
+    assert constants.version == old_constants.version + 1
+    assert constants.F == 20
+    assert constants.offspring_value == approx(2 * (10 + 2))
+    assert constants.birth_mu == approx(math.log(10 ** 2 / math.sqrt(10 ** 2 + 2 ** 2)))
+    assert constants.birth_sigma == approx(math.sqrt(math.log(1 + 2 ** 2 / 10 ** 2)))
+
+
+def test_invalid_parameters_unchanged(reset_default_params):
+    """Test that parameters and constants are unchanged if any new parameter is invalid"""
+    old_constants = Carnivore.get_constants()
+
+    with pytest.raises(ValueError):
+        Carnivore.set_parameters({"F": 10, "eta": 2})
+
+    assert Carnivore.params["F"] == 50
+    assert Carnivore.params["eta"] == 0.125
+    assert Carnivore.get_constants() is old_constants
+
+
 @pytest.mark.parametrize("loc, species, age, weight, new_params",
                          [[(1, 2), "Herbivore", 5, 20,
                            {"phi_age": 0.6, "phi_weight": 0.1, "a_half": 40, "w_half": 10}],
@@ -166,8 +193,7 @@ def test_init(reset_default_params, loc, species, age, weight, new_params):
               'age': animal.age,
               'weight': animal.weight,
               "fitness": animal.fitness,
-              "alive": animal.alive,
-              "newborn": animal.newborn
+              "alive": animal.alive
               }
 
     age_param = 1 / (1 + math.exp(new_params["phi_age"] * (age - new_params["a_half"])))
@@ -180,8 +206,7 @@ def test_init(reset_default_params, loc, species, age, weight, new_params):
                 'age': age,
                 'weight': weight,
                 "fitness": fitness,
-                "alive": True,
-                "newborn": None
+                "alive": True
                 }
     assert result == approx(expected)
 
@@ -238,6 +263,31 @@ def test_calc_fitness(species, age_change, weight):
     assert animal.calc_fitness() == approx(fitness)
 
 
+@pytest.mark.parametrize("species", ["Herbivore", "Carnivore"])
+def test_calc_fitness_batch(species):
+    """Test that batch fitness is the same as fitness for each animal"""
+    animal_class = {"Herbivore": Herbivore, "Carnivore": Carnivore}[species]
+    ages = [0, 5, 40, 150]
+    weights = [1, 20, 60, 0]
+
+    animals = [animal_class({'species': species, 'age': age, 'weight': weight}, (1, 2))
+               for age, weight in zip(ages, weights)]
+
+    fitness = animal_class.calc_fitness_batch(ages, weights)
+
+    assert fitness.tolist() == approx([animal.fitness for animal in animals])
+
+
+@pytest.mark.parametrize("age", [0, 5, 40, 99, 100, 1000])
+def test_age_factor_table(reset_default_params, age):
+    """Test that the age factor lookup table follows parameter changes and old ages"""
+    Herbivore.set_parameters({"phi_age": 0.5, "a_half": 30})
+    expected = 1 / (1 + exp(0.5 * (age - 30)))
+
+    assert Herbivore.age_factor(age) == approx(expected)
+    assert Herbivore.age_factors(np.array([age]))[0] == approx(expected)
+
+
 def test_update_fitness():
     """Test that fitness is updated correctly"""
     stat = {'species': "Herbivore",
@@ -251,6 +301,23 @@ def test_update_fitness():
     assert animal.fitness == approx(animal.calc_fitness())
 
 
+def test_lazy_fitness(mocker):
+    """Test that fitness is only recomputed when it is read after a change"""
+    animal = std_herb()
+    old_fitness = animal.fitness
+    mocker.spy(Herbivore, "calc_fitness")
+    Herbivore.fitness_counter.reset()
+
+    animal.feeding(10)
+    animal.loss_of_weight()
+    animal.aging()
+
+    assert Herbivore.calc_fitness.call_count == 0
+    assert animal.fitness != old_fitness
+    assert animal.fitness == approx(animal.calc_fitness())
+    assert Herbivore.fitness_counter.as_dict() == {'invalidated': 3, 'recomputed': 1, 'saved': 2}
+
+
 @pytest.mark.parametrize("species, age", [("Herbivore", 5),
                                           ("Herbivore", 1),
                                           ("Herbivore", 150),
@@ -364,6 +431,23 @@ def test_feeding_herb_weight(animal, fodder):
         assert animal.weight == approx(animal.params["beta"] * animal.params["F"] + old_weight)
 
 
+@pytest.mark.parametrize("num_animals", [1, 7, 100])
+@pytest.mark.parametrize("fodder", [0, 3.3, 10, 55.5, 800, 1234.567])
+def test_feeding_batch(num_animals, fodder):
+    """Test that batched grazing gives exactly the same result as one feeding at a time"""
+    herbs = [std_herb() for _ in range(num_animals)]
+    fodder_left = fodder
+    for herb in herbs:
+        if fodder_left > 0:
+            fodder_left -= herb.feeding(fodder_left)
+
+    amount_eaten, batch_fodder_left = Herbivore.feeding_batch(num_animals, fodder)
+    weights = 60 + amount_eaten * Herbivore.params['beta']
+
+    assert batch_fodder_left == fodder_left
+    assert weights.tolist() == [herb.weight for herb in herbs if herb.weight > 60]
+
+
 def test_herb_death_eaten(reset_default_params):
     """Test that herbivore dies if eaten"""
     herb = std_herb()
@@ -468,3 +552,84 @@ def test_carn_eat_prob_fitness():
         carn.feeding([herb])
 
     assert herb.alive is True
+
+
+def test_carn_eat_equal_fitness(reset_default_params):
+    """Test that a carnivore always kills a herbivore with the same fitness"""
+    herb = std_herb()
+    carn = std_carn()
+
+    herb.fitness = 0.5
+    carn.fitness = 0.5
+
+    carn.feeding([herb])
+
+    assert not herb.alive
+
+
+def test_prey_limit():
+    """Test that the limit is the number of herbivores a carnivore can kill"""
+    herbs = [std_herb() for _ in range(3)]
+    for herb, fitness in zip(herbs, [0.1, 0.3, 0.5]):
+        herb.fitness = fitness
+
+    prey = Prey(herbs)
+
+    assert prey.fitness == [0.1, 0.3, 0.5]
+    assert prey.limit(0.3) == 2
+    assert prey.limit(0.05) == 0
+
+
+def test_carn_eat_unsorted_list(reset_default_params):
+    """Test that a list of herbivores is sorted before the carnivore eats"""
+    herbs = [std_herb() for _ in range(3)]
+    for herb, fitness in zip(herbs, [0.5, 0.1, 0.3]):
+        herb.fitness = fitness
+    carn = std_carn()
+    carn.fitness = 0.2
+
+    Carnivore.set_parameters({"DeltaPhiMax": 0.01})
+
+    carn.feeding(herbs)
+
+    assert [herb.alive for herb in herbs] == [True, False, True]
+
+
+def test_prey_kill():
+    """Test that killed herbivores are skipped and removed by survivors"""
+    herbs = [std_herb() for _ in range(5)]
+    prey = Prey(herbs)
+
+    prey.kill(1)
+    prey.kill(2)
+    prey.kill(4)
+
+    assert prey.next_alive(0) == 0
+    assert prey.next_alive(1) == 3
+    assert prey.next_alive(4) == 5
+    assert prey.survivors() == [herbs[0], herbs[3]]
+
+
+def test_prey_shared(reset_default_params):
+    """Test that carnivores sharing prey do not eat the same herbivore twice"""
+    herbs = [Herbivore({'species': 'Herbivore', 'age': 1000, 'weight': 10}, (1, 2))
+             for _ in range(20)]
+    carns = [std_carn() for _ in range(3)]
+    Carnivore.set_parameters({"DeltaPhiMax": .1, "F": 20})  # every carnivore eats two herbivores
+
+    prey = Prey(herbs)
+    for carn in carns:
+        carn.feeding(prey)
+
+    assert len(prey.survivors()) == 20 - 3 * 2
+    assert all(carn.weight == approx(60 + 20 * Carnivore.params['beta']) for carn in carns)
+
+
+@pytest.mark.parametrize("animal_class", [Herbivore, Carnivore])
+def test_slots(animal_class):
+    """Test that animals do not get an instance dictionary."""
+    animal = animal_class({'species': animal_class.__name__, 'age': 5, 'weight': 20}, (2, 2))
+
+    assert not hasattr(animal, '__dict__')
+    with pytest.raises(AttributeError):
+        animal.row = None
@@ -1,9 +1,12 @@
 """Test the Cell-class."""
+from operator import attrgetter
+
 import pytest
 from pytest import approx
 
 from biosim.cell import Lowland, Highland, Desert, Water
 from biosim.animals import Herbivore, Carnivore, Animal
+from biosim.rng import BufferedGenerator
 
 
 @pytest.fixture
@@ -166,8 +169,22 @@ def test_remove_animals(cell_with_animals):
     assert len(cell.animals) == 0
 
 
-def test_sort_herbs_fitness_desc():
-    """Test that the animals are sorted by fitness."""
+def test_remove_many_animals():
+    """Test that many animals are removed and the others keep their order."""
+    cell = Lowland((2, 2))
+    for age in range(10):
+        cell.add_animal_from_dict({'species': 'Herbivore', 'age': age, 'weight': 20})
+        cell.add_animal_from_dict({'species': 'Carnivore', 'age': age, 'weight': 20})
+
+    removed = cell.fauna['Herbivore'][::2] + cell.fauna['Carnivore'][:3]
+    cell.remove_animals(removed)
+
+    assert [herb.age for herb in cell.fauna['Herbivore']] == [1, 3, 5, 7, 9]
+    assert [carn.age for carn in cell.fauna['Carnivore']] == [3, 4, 5, 6, 7, 8, 9]
+
+
+def test_sort_herbs_fitness():
+    """Test that the animals are sorted by ascending fitness."""
     cell = Lowland((2, 2))
 
     animals = [{'species': 'Herbivore',
@@ -182,32 +199,96 @@ def test_sort_herbs_fitness_desc():
     # list of herbivore fitness in ascending order
     fitness_list = [animal.fitness for animal in cell.fauna['Herbivore']]
 
-    # Check if list is sorted with descending order
-    is_sorted = all(a >= b for a, b in zip(fitness_list, fitness_list[1:]))
+    # Check if list is sorted with ascending order
+    is_sorted = all(a <= b for a, b in zip(fitness_list, fitness_list[1:]))
 
     assert is_sorted
 
 
-def test_sort_herbs_fitness_asc():
-    """Test that the animals are sorted by fitness."""
+def test_sort_herbs_newcomers():
+    """Test that newcomers are merged into the order and the sorts are counted."""
     cell = Lowland((2, 2))
+    for age in range(100, 0, -5):
+        cell.add_animal_from_dict({'species': 'Herbivore', 'age': age, 'weight': 20})
+    cell._sort_herbivore_after_fitness()
 
-    animals = [{'species': 'Herbivore',
-                'age': age,
-                'weight': 20} for age in range(100, 0, -5)]
+    for age in range(0, 100, 7):
+        cell.add_animal_from_dict({'species': 'Herbivore', 'age': age, 'weight': 30})
 
-    for animal in animals:
-        cell.add_animal_from_dict(animal)
+    Herbivore.sort_counter.reset()
+    cell._sort_herbivore_after_fitness()
 
-    cell._sort_herbivore_after_fitness(descending=False)
+    fitness_list = [animal.fitness for animal in cell.fauna['Herbivore']]
+    assert fitness_list == sorted(fitness_list)
+    assert Herbivore.sort_counter.sorts == 1
+    assert Herbivore.sort_counter.animals == len(fitness_list)
+
+
+@pytest.mark.parametrize("num_sorted", [0, 1, 10, 30])
+def test_sort_herbs_ties_keep_order(num_sorted):
+    """Test that the sort is a stable sort of the whole list, wherever the sorted front ends."""
+    herbivores = [Herbivore({'species': 'Herbivore', 'age': age, 'weight': weight}, (2, 2))
+                  for age in (10, 5, 10, 5, 20) for weight in (20, 30, 20, 10, 30, 20)]
+    herbivores[:num_sorted] = sorted(herbivores[:num_sorted], key=attrgetter('fitness'))
+    expected = sorted(herbivores, key=attrgetter('fitness'))
+
+    Herbivore.sort_by_fitness(herbivores)
+
+    assert [id(animal) for animal in herbivores] == [id(animal) for animal in expected]
+
+
+@pytest.mark.parametrize("num_sorted", [0, 1, 10, 30])
+def test_merge_herbs_by_fitness(num_sorted):
+    """Test that merging a tail gives a stable sort of the whole list."""
+    herbivores = [Herbivore({'species': 'Herbivore', 'age': age, 'weight': weight}, (2, 2))
+                  for age in (10, 5, 10, 5, 20) for weight in (20, 30, 20, 10, 30, 20)]
+    herbivores[:num_sorted] = sorted(herbivores[:num_sorted], key=attrgetter('fitness'))
+    expected = sorted(herbivores, key=attrgetter('fitness'))
+
+    Herbivore.merge_by_fitness(herbivores, num_sorted)
+
+    assert [id(animal) for animal in herbivores] == [id(animal) for animal in expected]
+
+
+def test_feeding_sorts_once():
+    """Test that the herbivores of a cell are sorted once when they feed."""
+    cell = Lowland((2, 2))
+    for age in range(100, 0, -5):
+        cell.add_animal_from_dict({'species': 'Herbivore', 'age': age, 'weight': 20})
+
+    Herbivore.sort_counter.reset()
+    cell.feed_animals()
 
-    # list of herbivore fitness in ascending order
     fitness_list = [animal.fitness for animal in cell.fauna['Herbivore']]
+    assert fitness_list == sorted(fitness_list)
+    assert Herbivore.sort_counter.sorts == 1
 
-    # Check if list is sorted with descending order
-    is_sorted = all(a <= b for a, b in zip(fitness_list, fitness_list[1:]))
 
-    assert is_sorted
+def test_sort_herbs_outdated_fitness():
+    """Test that herbivores with outdated fitness are sorted by their new fitness."""
+    herbivores = [Herbivore({'species': 'Herbivore', 'age': 5, 'weight': weight}, (2, 2))
+                  for weight in (10, 20, 30, 40)]
+    herbivores[0].weight = 50
+    herbivores[2].weight = 5
+    expected = [herbivores[i] for i in (2, 1, 3, 0)]
+
+    Herbivore.sort_by_fitness(herbivores)
+
+    assert herbivores == expected
+
+
+def test_graze_fittest_first(reset_cell_defaults):
+    """Test that the fittest herbivores eat when there is not enough fodder for all."""
+    cell = Lowland((2, 2))
+    cell.set_parameters({'f_max': Herbivore.params['F'] * 2})
+    cell.reset_fodder()
+    for age in range(100, 0, -5):
+        cell.add_animal_from_dict({'species': 'Herbivore', 'age': age, 'weight': 20})
+
+    cell.feed_animals()
+
+    fed = [animal for animal in cell.fauna['Herbivore'] if animal.weight > 20]
+    assert sorted(animal.age for animal in fed) == [5, 10]
 
 
 @pytest.mark.parametrize("cell_class", [Desert, Water])
@@ -233,15 +314,50 @@ def test_change_params(reset_cell_defaults, cell_class):
     assert cell.f_max == 100
 
 
-def test_add_newborns(cell_with_animals, mocker):
-    """Test that the method is called the right number of times."""
-    cell, herb, carn = cell_with_animals
+def test_add_newborns(reset_animal_defaults):
+    """Test that all heavy animals give birth and lose the right weight."""
+    Herbivore.set_parameters({'gamma': 100})  # Ensure that all herbivores procreate
+    cell = Lowland((2, 2))
+    for _ in range(10):
+        cell.add_animal_from_dict({'species': 'Herbivore', 'age': 5, 'weight': 200})
+
+    cell.add_newborns()
+
+    parents = cell.fauna['Herbivore'][:10]
+    newborns = cell.fauna['Herbivore'][10:]
+    xi = Herbivore.params['xi']
+
+    assert len(newborns) == 10
+    assert all(newborn.age == 0 and newborn.loc == (2, 2) for newborn in newborns)
+    assert [parent.weight for parent in parents] == approx(
+        [200 - xi * newborn.weight for newborn in newborns])
 
-    mocker.spy(Animal, "procreation")
+
+def test_add_newborns_parents_behind(reset_animal_defaults):
+    """Test that herbivore parents are moved behind the herbivores that do not give birth."""
+    Herbivore.set_parameters({'gamma': 100})
+    cell = Lowland((2, 2))
+    for weight in (10, 200, 12, 200, 14):
+        cell.add_animal_from_dict({'species': 'Herbivore', 'age': 5, 'weight': weight})
+    residents = [cell.fauna['Herbivore'][i] for i in (0, 2, 4)]
+    parents = [cell.fauna['Herbivore'][i] for i in (1, 3)]
 
     cell.add_newborns()
 
-    assert Animal.procreation.call_count == 2
+    assert cell.fauna['Herbivore'][:5] == residents + parents
+    assert all(newborn.age == 0 for newborn in cell.fauna['Herbivore'][5:])
+
+
+def test_add_newborns_light_animals(cell_with_animals, reset_animal_defaults):
+    """Test that animals lighter than the offspring value do not give birth."""
+    Herbivore.set_parameters({'gamma': 100})
+    Carnivore.set_parameters({'gamma': 100})
+    cell, herb, carn = cell_with_animals
+
+    cell.add_newborns()
+
+    assert len(cell.animals) == 2
+    assert herb.weight == 20
 
 
 def test_add_newborns_list(cell_with_animals, reset_animal_defaults):
@@ -263,13 +379,30 @@ def test_add_newborns_list(cell_with_animals, reset_animal_defaults):
 
 
 def test_feed_animals_count(cell_with_animals, mocker):
-    """Test that the method is called the right number of times."""
-    mocker.spy(Herbivore, "feeding")
+    """Test that the herbivore grazes and the carnivore feeding is called once."""
     mocker.spy(Carnivore, "feeding")
     cell, herb, carn = cell_with_animals
     cell.feed_animals()
 
-    assert Herbivore.feeding.call_count + Carnivore.feeding.call_count == 2
+    assert Carnivore.feeding.call_count == 1
+    assert herb.weight == approx(20 + Herbivore.params['F'] * Herbivore.params['beta'])
+
+
+def test_feed_carnivores(reset_animal_defaults):
+    """Test that eaten herbivores are removed once all carnivores have eaten."""
+    Carnivore.set_parameters({'DeltaPhiMax': 0.01, 'F': 20})  # every carnivore eats two
+    cell = Desert((2, 2))
+    for _ in range(20):
+        cell.add_animal_from_dict({'species': 'Herbivore', 'age': 1000, 'weight': 10})
+    for _ in range(5):
+        cell.add_animal_from_dict({'species': 'Carnivore', 'age': 5, 'weight': 50})
+
+    cell.feed_animals()
+
+    herbivores = cell.fauna['Herbivore']
+    assert len(herbivores) == 20 - 5 * 2
+    assert all(herb.alive for herb in herbivores)
+    assert [herb.fitness for herb in herbivores] == sorted(herb.fitness for herb in herbivores)
 
 
 def test_fodder_reset(cell_with_animals):
@@ -289,8 +422,6 @@ def test_herb_full(reset_cell_defaults, mocker):
     cell.set_parameters({'f_max': eat*eat_times})
     cell.reset_fodder()
 
-    mocker.spy(Herbivore, "feeding")
-
     animals = [Herbivore({'species': 'Herbivore', 'age': 5, 'weight': 200},
                          (2, 2)) for _ in range(5)]
 
@@ -299,7 +430,9 @@ def test_herb_full(reset_cell_defaults, mocker):
 
     cell.feed_animals()
 
-    assert Herbivore.feeding.call_count == eat_times
+    assert sum(animal.weight > 200 for animal in animals) == eat_times
+    assert cell.fodder == 0
+    assert all(animal.fitness == approx(animal.calc_fitness()) for animal in animals)
 
 
 def test_count_carn(cell_with_animals):
@@ -320,6 +453,16 @@ def test_moving_animals_list(cell_with_animals):
                 assert loc in ((1, 2), (2, 1), (2, 3), (3, 2))
 
 
+@pytest.mark.parametrize("mu, num_migrants", [(0, 0), (1000, 2)])
+def test_draw_migrants(cell_with_animals, reset_animal_defaults, mu, num_migrants):
+    """Test that no animals or all animals are drawn as migrants."""
+    Herbivore.set_parameters({'mu': mu})
+    Carnivore.set_parameters({'mu': mu})
+    cell, herb, carn = cell_with_animals
+
+    assert len(cell.draw_migrants()) == num_migrants
+
+
 @pytest.fixture
 def reset_fodder():
     """Reset the fodder in the cell."""
@@ -382,13 +525,14 @@ def test_age_animals_count(cell_with_animals, mocker):
     assert Animal.aging.call_count == 2
 
 
-def test_loss_of_weight_count(cell_with_animals, mocker):
-    """Test that the method is called the right number of times."""
-    mocker.spy(Animal, "loss_of_weight")
+def test_loss_of_weight(cell_with_animals):
+    """Test that all animals lose weight and get their fitness updated."""
     cell, herb, carn = cell_with_animals
     cell.loss_of_weight()
 
-    assert Animal.loss_of_weight.call_count == 2
+    for animal in (herb, carn):
+        assert animal.weight == approx(20 - animal.params['eta'] * 20)
+        assert animal.fitness == approx(animal.calc_fitness())
 
 
 def test_animal_death_count(cell_with_animals, mocker):
@@ -398,3 +542,32 @@ def test_animal_death_count(cell_with_animals, mocker):
     cell.animal_death()
 
     assert Animal.death.call_count == 2
+
+
+def make_cell_with_many_animals():
+    """Create a cell with animals of different age and weight."""
+    cell = Lowland((2, 2))
+    for age in range(0, 60, 3):
+        for species in ('Herbivore', 'Carnivore'):
+            cell.add_animal_from_dict({'species': species, 'age': age, 'weight': 1 + age / 2})
+    return cell
+
+
+def test_end_of_year():
+    """Test that the fused end of year gives the same result as the three methods."""
+    cell = make_cell_with_many_animals()
+    cell.age_animals()
+    cell.loss_of_weight()
+    cell.animal_death(BufferedGenerator(4))
+
+    fused_cell = make_cell_with_many_animals()
+    fused_cell.end_of_year(BufferedGenerator(4))
+
+    # herbivores are left in stable fitness order
+    cell.fauna['Herbivore'].sort(key=attrgetter('fitness'))
+    for species in ('Herbivore', 'Carnivore'):
+        expected = [(animal.age, animal.weight, animal.fitness)
+                    for animal in cell.fauna[species]]
+        result = [(animal.age, animal.weight, animal.fitness)
+                  for animal in fused_cell.fauna[species]]
+        assert result == expected
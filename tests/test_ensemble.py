@@ -0,0 +1,81 @@
+"""Test the ensemble runner."""
+import numpy as np
+import pytest
+
+from biosim.animals import Herbivore
+from biosim.ensemble import run_replica, iter_ensemble, run_ensemble
+from biosim.simulation import BioSim
+
+geogr = """\
+           WWWWWWW
+           WLLLHHW
+           WLLDLLW
+           WWWWWWW"""
+
+ini_pop = [{'loc': (2, 3),
+            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(40)]
+            + [{'species': 'Carnivore', 'age': 5, 'weight': 20} for _ in range(5)]}]
+
+
+def test_replica_same_as_biosim():
+    """Test that a replica gives the same populations as a BioSim run with its seed."""
+    sim = BioSim(geogr, ini_pop, seed=7, vis_years=0)
+    sim.simulate(10)
+
+    replica = run_replica(7, 10, island_map=geogr, ini_pop=ini_pop)
+
+    for species, history in sim.pop_history.items():
+        assert replica.populations[species].tolist() == [history[year] for year in range(11)]
+
+
+def test_replica_cell_counts():
+    """Test that the cell counts add up to the populations, and do not change them."""
+    replica = run_replica(3, 6, island_map=geogr, ini_pop=ini_pop, cell_counts=True)
+    without_counts = run_replica(3, 6, island_map=geogr, ini_pop=ini_pop)
+
+    for species, counts in replica.cell_counts.items():
+        assert counts.shape == (7, 4, 7)
+        assert counts.sum(axis=(1, 2)).tolist() == replica.populations[species].tolist()
+        assert replica.populations[species].tolist() == \
+            without_counts.populations[species].tolist()
+
+
+def test_replica_parameters():
+    """Test that the parameters are used in the replica and reset afterwards."""
+    replica = run_replica(3, 5, island_map=geogr, ini_pop=ini_pop,
+                          animal_parameters={'Herbivore': {'gamma': 0}})
+
+    assert (np.diff(replica.populations['Herbivore']) <= 0).all()
+    assert Herbivore.params['gamma'] == Herbivore.default_parameters['gamma']
+
+    run_replica(3, 1, island_map=geogr, ini_pop=ini_pop)
+    assert Herbivore.params['gamma'] == Herbivore.default_parameters['gamma']
+
+
+def test_iter_ensemble_yields_every_seed():
+    """Test that every seed gives one result."""
+    seeds = [4, 5, 6]
+    results = list(iter_ensemble(seeds, 3, workers=2, island_map=geogr, ini_pop=ini_pop))
+
+    assert sorted(result.seed for result in results) == seeds
+
+
+def test_run_ensemble_stacked():
+    """Test that the results are stacked in the order of the seeds."""
+    seeds = [9, 2, 5]
+    ensemble = run_ensemble(seeds, 4, workers=2, island_map=geogr, ini_pop=ini_pop,
+                            cell_counts=True)
+
+    assert ensemble.seeds.tolist() == seeds
+    assert ensemble.populations['Herbivore'].shape == (3, 5)
+    assert ensemble.cell_counts['Carnivore'].shape == (3, 5, 4, 7)
+
+    replica = run_replica(2, 4, island_map=geogr, ini_pop=ini_pop)
+    assert ensemble.populations['Herbivore'][1].tolist() == \
+        replica.populations['Herbivore'].tolist()
+
+
+def test_run_ensemble_no_seeds():
+    """Test that an ensemble without seeds raises ValueError."""
+    with pytest.raises(ValueError):
+        run_ensemble([], 4)
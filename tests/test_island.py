@@ -16,11 +16,25 @@ Not implemented yet
 Requirements violated
 - raise value error
 '''
+import threading
+
+from biosim.animals import Herbivore
 from biosim.cell import Water, Desert, Highland, Lowland
-from biosim.island import Island
+from biosim.island import Island, ArrayIsland
+from biosim.parameters import ParameterSet
+import numpy as np
 import pytest
 
 
+@pytest.fixture
+def reset_cell_defaults():
+    """Reset cell parameters to default values after each test."""
+    yield
+
+    Lowland.set_parameters(Lowland.default_parameters)
+    Highland.set_parameters(Highland.default_parameters)
+
+
 def test_create_island():
     """Test that island is created with correct attributes"""
     map_string = """\
@@ -170,3 +184,257 @@ def test_move_all_animals():
     island._move_all_animals(moving_list)
 
     assert len(island.map[(2, 3)].fauna["Herbivore"]) == number
+    assert len(island.map[(2, 2)].fauna["Herbivore"]) == 0
+
+
+def test_move_animals_swap():
+    """Test that animals can move both ways between two cells in the same year"""
+    island = Island("WWWW\nWLDW\nWWWW")
+    island.add_population([{'loc': (2, 2),
+                            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}]},
+                           {'loc': (2, 3),
+                            'pop': [{'species': 'Herbivore', 'age': 7, 'weight': 20}]}])
+    herb_west = island.map[(2, 2)].fauna['Herbivore'][0]
+    herb_east = island.map[(2, 3)].fauna['Herbivore'][0]
+
+    island._move_all_animals([(herb_west, (2, 2), (2, 3)),
+                              (herb_east, (2, 3), (2, 2)),
+                              (herb_east, (2, 3), (1, 3))])
+
+    assert island.map[(2, 2)].fauna['Herbivore'] == [herb_east]
+    assert island.map[(2, 3)].fauna['Herbivore'] == [herb_west]
+
+
+def test_fitness_counts():
+    """Test that the yearly cycle records fitness invalidations and recomputations"""
+    parameters = ParameterSet.default().with_animal_parameters(
+        'Herbivore', {'gamma': 0, 'mu': 0, 'omega': 0})
+    island = Island("WWWW\nWLDW\nWWWW", parameters=parameters)
+    island.add_population([{'loc': (2, 2),
+                            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                    for _ in range(20)]}])
+    island.yearly_island_cycle()
+    island.yearly_island_cycle()
+
+    # No herbivore gives birth, migrates or dies, and there is fodder for all 20.
+    # In the first year their fitness is computed when it is first read. In both
+    # years eating invalidates it, and it is recomputed once after grazing. The end
+    # of the year sets the fitness without invalidating it.
+    no_counts = {'invalidated': 0, 'recomputed': 0, 'saved': 0}
+    assert island.fitness_counts == [
+        {'Herbivore': {'invalidated': 20, 'recomputed': 40, 'saved': -20},
+         'Carnivore': no_counts},
+        {'Herbivore': {'invalidated': 20, 'recomputed': 20, 'saved': 0},
+         'Carnivore': no_counts}]
+
+
+def test_sort_counts():
+    """Test that the yearly cycle records the herbivore sorts"""
+    island = Island("WWWW\nWLDW\nWWWW")
+    island.add_population([{'loc': (2, 2),
+                            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                    for _ in range(20)]}])
+    island.yearly_island_cycle()
+
+    assert len(island.sort_counts) == 1
+    assert island.sort_counts[0]['sorts'] > 0
+    assert island.sort_counts[0]['seconds'] >= 0
+
+
+def count_operations(num_herbivores, num_years):
+    """Run an island and return its operation counts without the timings"""
+    island = Island("WWWW\nWLDW\nWWWW")
+    island.add_population([{'loc': (2, 2),
+                            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                    for _ in range(num_herbivores)]}])
+    for _ in range(num_years):
+        island.yearly_island_cycle()
+
+    sorts = [{key: value for key, value in counts.items() if key != 'seconds'}
+             for counts in island.sort_counts]
+    return island.fitness_counts, sorts
+
+
+def test_counts_in_threads():
+    """Test that islands run in threads count their own operations"""
+    sizes = [10, 40, 80]
+    expected = [count_operations(size, 10) for size in sizes]
+
+    results = [None] * len(sizes)
+
+    def run(number):
+        results[number] = count_operations(sizes[number], 10)
+
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(len(sizes))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == expected
+
+
+def test_neighbour_table():
+    """Test that the neighbour table only points to habitable cells"""
+    island = Island("WWWW\nWLDW\nWWLW\nWWWW")
+
+    west = island.cell_index[(2, 2)]
+    east = island.cell_index[(2, 3)]
+    south = island.cell_index[(3, 3)]
+
+    assert island.neighbours[west].tolist() == [-1, -1, -1, east]
+    assert island.neighbours[east].tolist() == [-1, south, west, -1]
+    assert island.cell_locations[south] == (3, 3)
+
+
+def test_migrants_stay_on_land():
+    """Test that migrants only move to habitable cells, and that none are lost"""
+    Herbivore.set_parameters({'mu': 1000})
+    island = Island("WWWW\nWLDW\nWWWW")
+    island.add_population([{'loc': (2, 2),
+                            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                    for _ in range(100)]}])
+
+    migrants = [island._draw_migrants(loc, cell) for loc, cell in island.habital_map.items()]
+    island._move_migrants(migrants)
+    Herbivore.set_parameters(Herbivore.default_parameters)
+
+    loc, animals, new_cells = migrants[0]
+    assert 0 < len(animals) < 100
+    assert set(new_cells.tolist()) == {island.cell_index[(2, 3)]}
+    assert len(island.map[(2, 3)].fauna['Herbivore']) == len(animals)
+    assert len(island.map[(2, 2)].fauna['Herbivore']) == 100 - len(animals)
+
+
+def test_landscape_and_cell_grid():
+    """Test that the dense map has landscape codes and numbers the habitable cells"""
+    island = Island("WWWW\nWLDW\nWHWW\nWWWW")
+
+    assert island.landscape.tolist() == [[0, 0, 0, 0],
+                                         [0, 1, 3, 0],
+                                         [0, 2, 0, 0],
+                                         [0, 0, 0, 0]]
+    assert island.cell_grid[1:3, 1:3].tolist() == [[0, 1], [2, -1]]
+    assert island.cell_locations == list(island.habital_map)
+
+
+def test_pop_in_cell_view():
+    """Test that pop_in_cell reads the count arrays as a dictionary by location"""
+    island = Island("WWWW\nWLDW\nWWWW")
+    island.add_population([{'loc': (2, 3),
+                            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                    for _ in range(7)]}])
+    for loc, cell in island.habital_map.items():
+        island.update_data(loc, cell)
+    island.collect_data()
+
+    assert island.counts['Herbivore'].tolist() == [[0, 0, 0, 0], [0, 0, 7, 0], [0, 0, 0, 0]]
+    assert dict(island.pop_in_cell['Herbivore']) == {(2, 2): 0, (2, 3): 7}
+    assert island.pop['Herbivore'] == 7
+    with pytest.raises(KeyError):
+        island.pop_in_cell['Herbivore'][(1, 1)]
+
+
+def test_active_cells():
+    """Test that only cells with animals are active, and that the count is recorded"""
+    island = Island("WWWWW\nWLLLW\nWWWWW")
+    assert island.active_cells == set()
+
+    island.add_population([{'loc': (2, 2),
+                            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}]}])
+    assert island.active_cells == {island.cell_index[(2, 2)]}
+
+    herb = island.map[(2, 2)].fauna['Herbivore'][0]
+    island._move_migrants([((2, 2), [herb], np.array([island.cell_index[(2, 3)]]))])
+    island._update_active_cells()
+    assert island.active_cells == {island.cell_index[(2, 3)]}
+
+    island.yearly_island_cycle()
+    assert island.active_counts == [1]
+
+
+def test_fodder_reset_on_activation(reset_cell_defaults):
+    """Test that an inactive cell gets fresh fodder when animals arrive"""
+    island = Island("WWWW\nWLLW\nWWWW")
+    Lowland.set_parameters({'f_max': 123})
+
+    island.add_population([{'loc': (2, 3),
+                            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}]}])
+
+    assert island.map[(2, 3)].fodder == 123
+
+
+def test_islands_have_own_random_numbers():
+    """Test that two islands with the same seed give the same result when run interleaved"""
+    def make_island():
+        island = Island("WWWWW\nWLLLW\nWLHLW\nWWWWW", random_seed=2)
+        island.add_population([{'loc': (2, 3),
+                                'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                        for _ in range(50)]}])
+        return island
+
+    alone = make_island()
+    for _ in range(10):
+        alone.yearly_island_cycle()
+
+    island1 = make_island()
+    island2 = make_island()
+    for _ in range(10):
+        island1.yearly_island_cycle()
+        island2.yearly_island_cycle()
+
+    assert island1.counts['Herbivore'].tolist() == alone.counts['Herbivore'].tolist()
+    assert island2.counts['Herbivore'].tolist() == alone.counts['Herbivore'].tolist()
+
+
+def run_partitioned_year(island, num_parts):
+    """Runs one year with the active cells split into parts, run in reverse order"""
+    active_cells = island._start_active_year()
+    parts = [active_cells[part::num_parts] for part in range(num_parts)]
+
+    migrants = []
+    for part in reversed(parts):
+        migrants.extend(island._run_cells(part))
+
+    if isinstance(island, ArrayIsland):
+        island._move_all_populations(migrants)
+    else:
+        island._move_migrants(migrants)
+    island._update_active_cells()
+    island.collect_data()
+    island.year += 1
+
+
+def cell_weights(island):
+    """Weights of the animals in every cell"""
+    if isinstance(island, ArrayIsland):
+        return {loc: {species: pop.weight.tolist() for species, pop in pops.items()}
+                for loc, pops in island.populations.items()}
+    return {loc: {species: [animal.weight for animal in animals]
+                  for species, animals in cell.fauna.items()}
+            for loc, cell in island.habital_map.items()}
+
+
+@pytest.mark.parametrize("island_class", [Island, ArrayIsland])
+@pytest.mark.parametrize("num_parts", [2, 3, 5])
+def test_partitioned_run_same_as_serial(island_class, num_parts):
+    """Test that splitting the cells into parts gives bit-identical results"""
+    def make_island():
+        island = island_class("WWWWWW\nWLLLHW\nWLHLDW\nWLLLLW\nWWWWWW", random_seed=4)
+        island.add_population([{'loc': (3, 3),
+                                'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                        for _ in range(80)]},
+                               {'loc': (2, 2),
+                                'pop': [{'species': 'Carnivore', 'age': 5, 'weight': 20}
+                                        for _ in range(20)]}])
+        return island
+
+    serial = make_island()
+    partitioned = make_island()
+    for _ in range(15):
+        serial.yearly_island_cycle()
+        run_partitioned_year(partitioned, num_parts)
+
+        for species in ('Herbivore', 'Carnivore'):
+            assert partitioned.counts[species].tolist() == serial.counts[species].tolist()
+        assert cell_weights(partitioned) == cell_weights(serial)
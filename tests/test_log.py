@@ -0,0 +1,141 @@
+"""Test the PopulationLog-class and reading population logs."""
+import os
+
+import numpy as np
+import pytest
+
+from biosim.log import PopulationLog, log_path, read_log
+
+
+def counts(year):
+    return {'Herbivore': 10 * year, 'Carnivore': year}
+
+
+@pytest.mark.parametrize("file_name, expected",
+                         [('log', 'log.csv'), ('log.csv', 'log.csv'), ('log.bin', 'log.bin'),
+                          ('run.1', 'run.1.csv')])
+def test_log_path(file_name, expected):
+    """Test that '.csv' is added to names without a log suffix."""
+    assert log_path(file_name).name == expected
+
+
+@pytest.mark.parametrize("suffix", ['.csv', '.bin'])
+def test_write_and_read(tmp_path, suffix):
+    """Test that the years written are read back as columns."""
+    with PopulationLog(tmp_path / f'log{suffix}') as log:
+        for year in range(25):
+            log.write(year, counts(year))
+
+    table = read_log(tmp_path / f'log{suffix}')
+    assert list(table) == ['year', 'Herbivore', 'Carnivore']
+    assert table['year'].tolist() == list(range(25))
+    assert table['Herbivore'].tolist() == [10 * year for year in range(25)]
+    assert table['Carnivore'].dtype == np.int64
+
+
+def test_csv_format(tmp_path):
+    """Test the text of a CSV log."""
+    with PopulationLog(tmp_path / 'log.csv') as log:
+        log.write(0, {'Herbivore': 150, 'Carnivore': 50})
+        log.write(1, {'Herbivore': 200, 'Carnivore': 40})
+
+    assert (tmp_path / 'log.csv').read_text() == 'year,Herbivore,Carnivore\n0,150,50\n1,200,40\n'
+
+
+@pytest.mark.parametrize("suffix", ['.csv', '.bin'])
+def test_buffered_flush(tmp_path, suffix):
+    """Test that rows are written every flush_years years, and all rows on close."""
+    log = PopulationLog(tmp_path / f'log{suffix}', flush_years=4)
+    for year in range(6):
+        log.write(year, counts(year))
+        assert len(read_log(log.path)['year']) == 4 * ((year + 1) // 4)
+    log.close()
+    log.close()
+
+    assert len(read_log(log.path)['year']) == 6
+
+
+def test_fsync_interval(tmp_path, mocker):
+    """Test that the file is synced to disk every fsync_years years."""
+    fsync = mocker.patch('biosim.log.os.fsync')
+    with PopulationLog(tmp_path / 'log.bin', flush_years=1, fsync_years=3) as log:
+        for year in range(7):
+            log.write(year, counts(year))
+        assert fsync.call_count == 2
+    assert fsync.call_count == 3
+
+
+def test_fsync_before_flush(tmp_path, mocker):
+    """Test that a sync due before the buffer is full writes the rows and syncs them."""
+    fsync = mocker.patch('biosim.log.os.fsync')
+    with PopulationLog(tmp_path / 'log.csv', flush_years=10, fsync_years=1) as log:
+        for year in range(3):
+            log.write(year, counts(year))
+            assert fsync.call_count == year + 1
+            assert len(read_log(log.path)['year']) == year + 1
+
+
+@pytest.mark.parametrize("suffix", ['.csv', '.bin'])
+def test_start_year_keeps_earlier_rows(tmp_path, suffix):
+    """Test that a log opened from a year keeps only the rows of earlier years."""
+    with PopulationLog(tmp_path / f'log{suffix}') as log:
+        for year in range(10):
+            log.write(year, counts(year))
+
+    with PopulationLog(tmp_path / f'log{suffix}', start_year=6) as log:
+        assert log.last_year == 5
+        for year in range(6, 8):
+            log.write(year, counts(year))
+
+    assert read_log(tmp_path / f'log{suffix}')['year'].tolist() == list(range(8))
+
+    with PopulationLog(tmp_path / f'log{suffix}') as log:
+        log.write(0, counts(0))
+    assert read_log(tmp_path / f'log{suffix}')['year'].tolist() == [0]
+
+
+@pytest.mark.parametrize("suffix", ['.csv', '.bin'])
+def test_partial_row_ignored(tmp_path, suffix):
+    """Test that a row only partly written before a crash is left out and replaced."""
+    path = tmp_path / f'log{suffix}'
+    with PopulationLog(path) as log:
+        for year in range(3):
+            log.write(year, counts(year))
+    with open(path, 'ab') as file:
+        file.write(b'3,3')
+    os.truncate(path, os.path.getsize(path) - 1)
+
+    assert read_log(path)['year'].tolist() == [0, 1, 2]
+
+    with PopulationLog(path, start_year=3) as log:
+        log.write(3, counts(3))
+    assert read_log(path)['year'].tolist() == [0, 1, 2, 3]
+
+
+@pytest.mark.parametrize("suffix", ['.csv', '.bin'])
+def test_start_year_empty_file(tmp_path, suffix):
+    """Test that an empty existing file is written anew, as if it were missing."""
+    path = tmp_path / f'log{suffix}'
+    path.touch()
+
+    with PopulationLog(path, start_year=4) as log:
+        assert log.last_year is None
+        log.write(4, counts(4))
+    assert read_log(path)['year'].tolist() == [4]
+
+
+def test_other_columns(tmp_path):
+    """Test that continuing a log with other columns raises ValueError."""
+    with PopulationLog(tmp_path / 'log.csv') as log:
+        log.write(0, counts(0))
+    with pytest.raises(ValueError):
+        PopulationLog(tmp_path / 'log.csv', species=('Herbivore',), start_year=1)
+
+
+@pytest.mark.parametrize("options", [{'flush_years': 0}, {'flush_years': 1.5},
+                                     {'flush_years': True}, {'fsync_years': 0},
+                                     {'fsync_years': 2.5}])
+def test_invalid_options(tmp_path, options):
+    """Test that invalid buffer and sync intervals raise ValueError."""
+    with pytest.raises(ValueError):
+        PopulationLog(tmp_path / 'log.csv', **options)
@@ -0,0 +1,207 @@
+"""Test the StripWorkers-class and the parallel yearly cycle."""
+import threading
+
+import numpy as np
+import pytest
+
+from biosim.animals import Herbivore, Carnivore
+from biosim.island import Island, ArrayIsland
+from biosim.parallel import row_strips, StripWorkers
+from biosim.simulation import BioSim
+
+geogr = """\
+           WWWWWWWWWWWW
+           WHHHLLLLLLWW
+           WHHLLLLDLLLW
+           WWHLLLLDDLLW
+           WHHHLLLLLLLW
+           WWHHLLLLLWWW
+           WWWWWWWWWWWW"""
+
+ini_pop = [{'loc': (3, 5),
+            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(60)]
+            + [{'species': 'Carnivore', 'age': 5, 'weight': 20} for _ in range(15)]}]
+
+
+@pytest.fixture
+def reset_animal_defaults():
+    """Reset animal parameters to default values after each test."""
+    yield
+
+    Herbivore.set_parameters(Herbivore.default_parameters)
+    Carnivore.set_parameters(Carnivore.default_parameters)
+
+
+@pytest.mark.parametrize("row_weights, num_strips, expected",
+                         [([0, 5, 5, 5, 5, 0], 2, [(0, 3), (3, 6)]),
+                          ([0, 5, 5, 5, 5, 0], 1, [(0, 6)]),
+                          ([0, 20, 1, 1, 0], 2, [(0, 2), (2, 5)]),
+                          ([0, 1, 0], 4, [(0, 2), (2, 3)])])
+def test_row_strips(row_weights, num_strips, expected):
+    """Test that rows are split into strips with about the same weight."""
+    assert row_strips(row_weights, num_strips) == expected
+
+
+@pytest.mark.parametrize("workers", [0, -1, 1.5, True])
+def test_invalid_workers(workers):
+    """Test that workers must be a positive integer."""
+    with pytest.raises(ValueError):
+        StripWorkers(Island(geogr), workers)
+    with pytest.raises(ValueError):
+        BioSim(geogr, vis_years=0, workers=workers)
+
+
+def test_every_cell_has_owner():
+    """Test that every habitable cell is owned by the worker of its row."""
+    island = Island(geogr)
+    strips = StripWorkers(island, 3)
+    strips._partition(np.ones(len(island.cells)))
+
+    assert len(strips.strips) == 3
+    for worker, (start, stop) in enumerate(strips.strips):
+        for loc in island.cell_locations:
+            if start <= loc[0] - 1 < stop:
+                assert strips.owner[island.cell_index[loc]] == worker
+
+
+def test_partition_weighted_by_animals():
+    """Test that a row with many animals gets a strip of its own."""
+    island = Island(geogr)
+    strips = StripWorkers(island, 2)
+    weights = np.zeros(len(island.cells))
+    weights[island.cell_index[(3, 5)]] = 1000
+    weights[island.cell_index[(5, 5)]] = 1
+    strips._partition(weights)
+
+    assert strips.strips == [(0, 3), (3, 7)]
+
+
+@pytest.mark.parametrize("rebalance_years", [-1, 1.5, True])
+def test_invalid_rebalance_years(rebalance_years):
+    """Test that rebalance_years must be a non-negative integer."""
+    with pytest.raises(ValueError):
+        StripWorkers(Island(geogr), 2, rebalance_years=rebalance_years)
+    with pytest.raises(ValueError):
+        BioSim(geogr, vis_years=0, workers=2, rebalance_years=rebalance_years)
+
+
+@pytest.mark.parametrize("rebalance_years, num_rebalances", [(0, 0), (1, 4), (2, 2)])
+def test_simulation_rebalance_years(rebalance_years, num_rebalances, mocker):
+    """Test that the simulation chooses new strips every rebalance_years years."""
+    rebalance = mocker.spy(StripWorkers, 'rebalance')
+    sim = BioSim(geogr, ini_pop, seed=1, vis_years=0, workers=2,
+                 rebalance_years=rebalance_years)
+    sim.simulate(4)
+
+    serial = BioSim(geogr, ini_pop, seed=1, vis_years=0)
+    serial.simulate(4)
+
+    assert rebalance.call_count == num_rebalances
+    assert sim.pop_history == serial.pop_history
+
+
+@pytest.mark.parametrize("engine", ['object', 'array'])
+def test_same_result_as_serial(engine, reset_animal_defaults):
+    """Test that a run with several workers gives the same statistics as one worker."""
+    results = []
+    for workers in (1, 3):
+        Herbivore.set_parameters(Herbivore.default_parameters)
+        sim = BioSim(geogr, ini_pop, seed=5, vis_years=0, engine=engine, workers=workers)
+        sim.simulate(8)
+        sim.set_animal_parameters('Herbivore', {'mu': 0.6})
+        sim.simulate(8)
+        results.append(sim)
+
+    serial, parallel = results
+    assert parallel.pop_history == serial.pop_history
+    assert parallel.island.active_counts == serial.island.active_counts
+    assert parallel.island.fitness_counts == serial.island.fitness_counts
+    for species in ('Herbivore', 'Carnivore'):
+        assert np.array_equal(parallel.island.counts[species], serial.island.counts[species])
+
+
+def test_specs_same_as_serial():
+    """Test that the ages, weights and fitness collected from the workers are the same."""
+    serial = Island(geogr, 3)
+    serial.add_population(ini_pop)
+    island = Island(geogr, 3)
+    island.add_population(ini_pop)
+
+    with StripWorkers(island, 2) as strips:
+        for _ in range(5):
+            serial.yearly_island_cycle()
+            strips.yearly_island_cycle(collect_specs=True)
+
+            assert island.specs == serial.specs
+            assert island.pop == serial.pop
+
+
+@pytest.mark.parametrize("island_class", [Island, ArrayIsland])
+def test_rebalance_same_as_serial(island_class):
+    """Test that moving cells between workers every year does not change the result."""
+    pop = [{'loc': (2, 5),
+            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(60)]},
+           {'loc': (5, 5),
+            'pop': [{'species': 'Carnivore', 'age': 5, 'weight': 20} for _ in range(15)]}]
+    serial = island_class(geogr, 3)
+    serial.add_population(pop)
+    island = island_class(geogr, 3)
+    island.add_population(pop)
+
+    with StripWorkers(island, 3, rebalance_years=1) as strips:
+        for _ in range(8):
+            serial.yearly_island_cycle()
+            strips.yearly_island_cycle()
+
+            assert island.pop == serial.pop
+            for species in ('Herbivore', 'Carnivore'):
+                assert np.array_equal(island.counts[species], serial.counts[species])
+
+    assert len(strips.utilisation) == 8
+    assert len({tuple(year['strips']) for year in strips.utilisation}) > 1
+    for year in strips.utilisation:
+        assert len(year['utilisation']) == 3
+        assert all(0 <= value <= 1 for value in year['utilisation'])
+    assert sum(strips.utilisation[-1]['animals']) == sum(serial.pop.values())
+
+
+def test_animals_returned_to_island():
+    """Test that the animals are back on the island after simulate."""
+    sim = BioSim(geogr, ini_pop, seed=5, vis_years=0, workers=2)
+    sim.simulate(5)
+
+    counts = sim.num_animals_per_species
+    on_island = sum(len(cell.fauna['Herbivore']) for cell in sim.island.cells)
+
+    assert counts['Herbivore'] == on_island
+    assert len(sim.worker_utilisation) == 5
+    assert sim.island.active_cells == {index for index, cell in enumerate(sim.island.cells)
+                                       if cell.animals}
+
+
+def test_killed_worker_raises(monkeypatch):
+    """Test that a simulation raises instead of hanging when a worker process dies."""
+    start = StripWorkers.start
+
+    def start_and_kill(self):
+        start(self)
+        self._processes[1].kill()
+        self._processes[1].join()
+
+    monkeypatch.setattr(StripWorkers, 'start', start_and_kill)
+    sim = BioSim(geogr, ini_pop, seed=1, vis_years=0, workers=2)
+    errors = []
+
+    def run():
+        try:
+            sim.simulate(5)
+        except RuntimeError as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(60)
+
+    assert not thread.is_alive()
+    assert len(errors) == 1
+    assert 'worker process 1' in str(errors[0])
@@ -0,0 +1,170 @@
+"""Test the ParameterSet-class and the parameters of simulations."""
+import pickle
+import threading
+
+import pytest
+
+from biosim.animals import Herbivore, Carnivore
+from biosim.cell import Lowland
+from biosim.parameters import ParameterSet
+from biosim.simulation import BioSim
+
+geogr = """\
+           WWWWWWW
+           WLLLHHW
+           WLLDLLW
+           WWWWWWW"""
+
+ini_pop = [{'loc': (2, 3),
+            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(40)]
+            + [{'species': 'Carnivore', 'age': 5, 'weight': 20} for _ in range(5)]}]
+
+
+@pytest.fixture
+def reset_defaults():
+    """Reset class-level parameters to default values after each test."""
+    yield
+
+    Herbivore.set_parameters(Herbivore.default_parameters)
+    Carnivore.set_parameters(Carnivore.default_parameters)
+    Lowland.set_parameters(Lowland.default_parameters)
+
+
+def test_snapshot_of_classes(reset_defaults):
+    """Test that a set does not follow later changes of the class-level parameters."""
+    parameters = ParameterSet.from_classes()
+    Herbivore.set_parameters({'gamma': 0.5})
+    Lowland.set_parameters({'f_max': 100})
+
+    assert parameters.animal_parameters('Herbivore')['gamma'] == 0.2
+    assert parameters.constants['Herbivore'].gamma == 0.2
+    assert parameters.f_max['Lowland'] == 800
+    assert ParameterSet.default().animal_parameters('Herbivore')['gamma'] == 0.2
+
+
+def test_copy_on_write():
+    """Test that a change makes a new set sharing the unchanged constants."""
+    parameters = ParameterSet.default()
+    changed = parameters.with_animal_parameters('Herbivore', {'mu': 0.6})
+
+    assert parameters.animal_parameters('Herbivore')['mu'] == 0.25
+    assert changed.animal_parameters('Herbivore')['mu'] == 0.6
+    assert changed.constants['Herbivore'].mu == 0.6
+    assert changed.constants['Carnivore'] is parameters.constants['Carnivore']
+
+    landscape = changed.with_landscape_parameters('H', {'f_max': 50})
+    assert landscape.f_max == {'Lowland': 800, 'Highland': 50}
+    assert changed.f_max['Highland'] == 300
+    assert landscape.constants == changed.constants
+
+
+def test_read_only():
+    """Test that the parameters of a set cannot be changed in place."""
+    parameters = ParameterSet.default()
+    with pytest.raises(TypeError):
+        parameters.animal_parameters('Carnivore')['F'] = 10
+    with pytest.raises(TypeError):
+        parameters.landscape_parameters('L')['f_max'] = 10
+
+    changed = parameters.with_animal_parameters('Herbivore', {'mu': 0.6})
+    changed = changed.with_landscape_parameters('L', {'f_max': 700})
+    for parameter_set in (parameters, changed):
+        with pytest.raises(TypeError):
+            parameter_set.constants['Herbivore'] = parameters.constants['Carnivore']
+        with pytest.raises(TypeError):
+            parameter_set.f_max['Lowland'] = 10
+
+
+@pytest.mark.parametrize("species, new_parameters",
+                         [('Fish', {'mu': 1}),
+                          ('Herbivore', {'mu': -1}),
+                          ('Herbivore', {'nu': 1}),
+                          ('Carnivore', {'DeltaPhiMax': 0}),
+                          ('Carnivore', {'eta': 1})])
+def test_invalid_animal_parameters(species, new_parameters):
+    """Test that invalid species and parameters raise ValueError."""
+    with pytest.raises(ValueError):
+        ParameterSet.default().with_animal_parameters(species, new_parameters)
+
+
+@pytest.mark.parametrize("landscape, new_parameters",
+                         [('W', {'f_max': 1}), ('L', {'f_max': -1}), ('H', {'f_min': 1})])
+def test_invalid_landscape_parameters(landscape, new_parameters):
+    """Test that invalid landscapes and parameters raise ValueError."""
+    with pytest.raises(ValueError):
+        ParameterSet.default().with_landscape_parameters(landscape, new_parameters)
+
+
+def test_activate():
+    """Test that animals and cells use the active set, and the classes outside it."""
+    parameters = ParameterSet.default().with_animal_parameters('Herbivore', {'eta': 0.5})
+    parameters = parameters.with_landscape_parameters('L', {'f_max': 10})
+
+    with parameters.activate():
+        assert Herbivore.get_constants() is parameters.constants['Herbivore']
+        assert Lowland.get_f_max() == 10
+        with ParameterSet.default().activate():
+            assert Herbivore.get_constants().eta == 0.05
+        assert Herbivore.get_constants().eta == 0.5
+
+    assert Herbivore.get_constants().eta == 0.05
+    assert Lowland.get_f_max() == 800
+
+
+def test_pickle():
+    """Test that a set is the same after pickling."""
+    parameters = ParameterSet.default().with_animal_parameters('Carnivore', {'F': 20})
+    copied = pickle.loads(pickle.dumps(parameters))
+
+    assert dict(copied.animal_parameters('Carnivore')) == \
+        dict(parameters.animal_parameters('Carnivore'))
+    assert copied.constants['Carnivore'].F == 20
+    assert copied.f_max == parameters.f_max
+
+
+def run_simulation(engine, new_parameters, years=10):
+    """Runs a simulation with changed herbivore parameters."""
+    sim = BioSim(geogr, ini_pop, seed=4, vis_years=0, engine=engine)
+    sim.set_animal_parameters('Herbivore', new_parameters)
+    sim.set_landscape_parameters('L', {'f_max': 400})
+    sim.simulate(years)
+    return sim.pop_history
+
+
+@pytest.mark.parametrize("engine", ['object', 'array'])
+def test_simulations_do_not_share_parameters(engine):
+    """Test that two simulations run interleaved give the same result as run alone."""
+    expected = [run_simulation(engine, {'gamma': 0.5}), run_simulation(engine, {'omega': 0.9})]
+
+    sims = [BioSim(geogr, ini_pop, seed=4, vis_years=0, engine=engine) for _ in range(2)]
+    sims[0].set_animal_parameters('Herbivore', {'gamma': 0.5})
+    sims[1].set_animal_parameters('Herbivore', {'omega': 0.9})
+    for sim in sims:
+        sim.set_landscape_parameters('L', {'f_max': 400})
+    for _ in range(10):
+        for sim in sims:
+            sim.simulate(1)
+
+    assert [sim.pop_history for sim in sims] == expected
+    assert expected[0] != expected[1]
+    assert Herbivore.params['gamma'] == 0.2
+    assert Lowland.f_max == 800
+
+
+def test_simulations_in_threads():
+    """Test that simulations in different threads give the same result as run alone."""
+    changes = [{'gamma': 0.5}, {'omega': 0.9}, {'mu': 0.5}]
+    expected = [run_simulation('object', new_parameters, 15) for new_parameters in changes]
+
+    results = [None] * len(changes)
+
+    def run(number):
+        results[number] = run_simulation('object', changes[number], 15)
+
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(len(changes))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == expected
@@ -0,0 +1,201 @@
+"""Test the Population-class and the array engine."""
+from operator import attrgetter
+
+import numpy as np
+import pytest
+from pytest import approx
+
+from biosim.animals import Herbivore, Carnivore, Prey
+from biosim.island import ArrayIsland
+from biosim.population import Population
+from biosim.rng import BufferedGenerator
+
+
+@pytest.fixture
+def reset_animal_defaults():
+    """Reset animal parameters to default values after each test."""
+    yield
+
+    Herbivore.set_parameters(Herbivore.default_parameters)
+    Carnivore.set_parameters(Carnivore.default_parameters)
+
+
+@pytest.mark.parametrize("animal_class", [Herbivore, Carnivore])
+def test_add(animal_class):
+    """Test that animals are added with fitness and alive flag."""
+    pop = Population(animal_class)
+    pop.add([5, 10], [20, 30])
+
+    assert len(pop) == 2
+    assert pop.alive.all()
+    assert pop.species == animal_class.__name__
+
+
+@pytest.mark.parametrize("animal_class", [Herbivore, Carnivore])
+@pytest.mark.parametrize("age, weight", [(0, 1), (5, 20), (40, 60), (150, 2000)])
+def test_fitness_same_as_animal(animal_class, age, weight):
+    """Test that fitness is the same as for an animal object."""
+    pop = Population(animal_class)
+    pop.add([age], [weight])
+
+    animal = animal_class({'species': animal_class.__name__, 'age': age, 'weight': weight},
+                          (2, 2))
+
+    assert pop.fitness[0] == approx(animal.fitness)
+
+
+def test_compact():
+    """Test that dead animals are removed."""
+    pop = Population(Herbivore)
+    pop.add([1, 2, 3], [10, 20, 30])
+    pop.alive[1] = False
+    pop.compact()
+
+    assert pop.age.tolist() == [1, 3]
+    assert pop.weight.tolist() == [10, 30]
+
+
+def test_take():
+    """Test that selected animals are removed and returned."""
+    pop = Population(Herbivore)
+    pop.add([1, 2, 3], [10, 20, 30])
+    ages, weights = pop.take(np.array([True, False, True]))
+
+    assert ages.tolist() == [1, 3]
+    assert weights.tolist() == [10, 30]
+    assert pop.age.tolist() == [2]
+
+
+def test_procreation(reset_animal_defaults):
+    """Test that all heavy animals give birth when gamma is large."""
+    Herbivore.set_parameters({'gamma': 100})
+    pop = Population(Herbivore)
+    pop.add([5] * 10, [200] * 10)
+    pop.procreation(np.random.default_rng(1))
+
+    assert len(pop) == 20
+    assert (pop.age[10:] == 0).all()
+    assert (pop.weight[:10] < 200).all()
+
+
+def test_grazing():
+    """Test that the fittest herbivores eat first until fodder runs out."""
+    pop = Population(Herbivore)
+    pop.add([5, 5, 5], [10, 30, 20])
+    f = Herbivore.params['F']
+    beta = Herbivore.params['beta']
+
+    fodder = pop.grazing(1.5 * f)
+
+    assert fodder == 0
+    assert pop.weight.tolist() == approx([10, 30 + beta * f, 20 + 0.5 * beta * f])
+
+
+def test_hunting(reset_animal_defaults):
+    """Test that a fit carnivore kills weak herbivores until it is full."""
+    Carnivore.set_parameters({'DeltaPhiMax': 0.01})
+    herbivores = Population(Herbivore)
+    herbivores.add([100] * 10, [20] * 10)
+    carnivores = Population(Carnivore)
+    carnivores.add([5], [50])
+
+    carnivores.hunting(herbivores, BufferedGenerator(1))
+
+    assert len(herbivores) == 10 - Carnivore.params['F'] // 20 - 1
+    assert carnivores.weight[0] == approx(50 + Carnivore.params['F'] * Carnivore.params['beta'])
+
+
+def test_hunting_same_as_objects():
+    """Test that the array engine hunts like carnivore objects using the same draws."""
+    gen = np.random.default_rng(3)
+    herbivore_ages, herbivore_weights = gen.integers(0, 15, 200), gen.uniform(5, 40, 200)
+    carnivore_ages, carnivore_weights = gen.integers(0, 15, 40), gen.uniform(5, 40, 40)
+
+    herbivores = Population(Herbivore)
+    herbivores.add(herbivore_ages, herbivore_weights)
+    carnivores = Population(Carnivore)
+    carnivores.add(carnivore_ages, carnivore_weights)
+    carnivores.hunting(herbivores, BufferedGenerator(7))
+
+    herbivore_objects = [Herbivore({'species': 'Herbivore', 'age': age, 'weight': weight},
+                                   (2, 2))
+                         for age, weight in zip(herbivore_ages, herbivore_weights)]
+    carnivore_objects = [Carnivore({'species': 'Carnivore', 'age': age, 'weight': weight},
+                                   (2, 2))
+                         for age, weight in zip(carnivore_ages, carnivore_weights)]
+    prey = Prey(sorted(herbivore_objects, key=attrgetter('fitness')))
+    rng = BufferedGenerator(7)
+    for carnivore in rng.permutation(len(carnivore_objects)).tolist():
+        carnivore_objects[carnivore].feeding(prey, rng)
+
+    assert 0 < len(herbivores) < 200
+    assert sorted(herbivores.weight.tolist()) == \
+        approx(sorted(herbivore.weight for herbivore in prey.survivors()))
+    assert carnivores.weight.tolist() == \
+        approx([carnivore.weight for carnivore in carnivore_objects])
+
+
+def test_loss_of_weight():
+    """Test that all animals lose weight and fitness is updated."""
+    pop = Population(Carnivore)
+    pop.add([5, 10], [20, 30])
+    pop.loss_of_weight()
+
+    eta = Carnivore.params['eta']
+    assert pop.weight.tolist() == approx([20 - eta * 20, 30 - eta * 30])
+    assert pop.fitness.tolist() == approx(pop.calc_fitness(pop.age, pop.weight).tolist())
+
+
+def test_death_weight():
+    """Test that animals without weight die."""
+    pop = Population(Herbivore)
+    pop.add([5], [20])
+    pop.weight[0] = 0
+    pop.death(np.random.default_rng(1))
+
+    assert not pop.alive[0]
+
+
+def test_array_island_add_population():
+    """Test that animals are added to the populations of the right cell."""
+    island = ArrayIsland("WWWW\nWLDW\nWWWW")
+    island.add_population([{'loc': (2, 3),
+                            'pop': [{'species': 'Carnivore', 'age': 5, 'weight': 20}
+                                    for _ in range(5)]}])
+
+    assert len(island.populations[(2, 3)]['Carnivore']) == 5
+    assert len(island.populations[(2, 2)]['Carnivore']) == 0
+
+
+@pytest.mark.parametrize("animal_info", [{'species': 'Herbivore', 'age': -5, 'weight': 20},
+                                         {'species': 'Skilpadde', 'age': 5, 'weight': 20}])
+def test_array_island_add_invalid(animal_info):
+    """Test that invalid animals raise ValueError."""
+    island = ArrayIsland("WWW\nWLW\nWWW")
+
+    with pytest.raises(ValueError):
+        island.add_population([{'loc': (2, 2), 'pop': [animal_info]}])
+
+
+def test_array_island_add_to_water():
+    """Test that animals cannot be added to water."""
+    island = ArrayIsland("WWW\nWLW\nWWW")
+
+    with pytest.raises(ValueError):
+        island.add_population([{'loc': (1, 1),
+                                'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}]}])
+
+
+def test_array_island_migration(reset_animal_defaults):
+    """Test that migrating animals only move to habitable neighbours."""
+    Herbivore.set_parameters({'mu': 100, 'eta': 0, 'omega': 0, 'gamma': 0})
+    island = ArrayIsland("WWWWW\nWWLWW\nWLLLW\nWWLWW\nWWWWW")
+    island.add_population([{'loc': (3, 3),
+                            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                    for _ in range(100)]}])
+    island.yearly_island_cycle()
+
+    counts = {loc: len(pops['Herbivore']) for loc, pops in island.populations.items()}
+
+    assert counts[(3, 3)] == 0
+    assert sum(counts.values()) == 100
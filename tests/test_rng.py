@@ -0,0 +1,99 @@
+"""Test the BufferedGenerator- and CellGenerator-class."""
+import numpy as np
+import pytest
+
+from biosim.rng import BufferedGenerator, CellGenerator, PROCREATION, FEEDING
+
+
+def test_same_seed_same_numbers():
+    """Test that two generators with the same seed give the same numbers."""
+    rng1 = BufferedGenerator(12)
+    rng2 = BufferedGenerator(12)
+
+    assert [rng1.random() for _ in range(10)] == [rng2.random() for _ in range(10)]
+    assert rng1.random(5).tolist() == rng2.random(5).tolist()
+
+
+@pytest.mark.parametrize("size", [1, 10, BufferedGenerator.block_size + 7])
+def test_single_values_and_arrays_same_stream(size):
+    """Test that single values and arrays are taken from the same stream."""
+    rng1 = BufferedGenerator(3)
+    rng2 = BufferedGenerator(3)
+
+    rng1.random()
+    rng2.random()
+    values = [rng1.random() for _ in range(size)]
+
+    assert rng2.random(size).tolist() == values
+
+
+def test_block_boundary():
+    """Test that drawing past the end of a block continues with a new block."""
+    rng = BufferedGenerator(5)
+    values = rng.random(BufferedGenerator.block_size - 2)
+    more = rng.random(5)
+
+    assert len(values) == BufferedGenerator.block_size - 2
+    assert len(more) == 5
+    assert np.all((more >= 0) & (more < 1))
+
+
+def test_independent_generators():
+    """Test that draws from one generator do not change another."""
+    rng1 = BufferedGenerator(7)
+    rng2 = BufferedGenerator(7)
+    other = BufferedGenerator(7)
+
+    expected = [rng1.random() for _ in range(5)]
+    for _ in range(100):
+        other.random()
+
+    assert [rng2.random() for _ in range(5)] == expected
+
+
+def test_select_same_stream():
+    """Test that selecting a stream again gives the same numbers."""
+    rng = CellGenerator(3)
+    rng.select(4, 10, PROCREATION)
+    values = rng.random(10).tolist()
+    rng.random(1000)
+
+    rng.select(4, 10, PROCREATION)
+    assert [rng.random() for _ in range(10)] == values
+
+
+def test_select_does_not_depend_on_earlier_draws():
+    """Test that a stream is the same whatever was drawn before it."""
+    rng1 = CellGenerator(3)
+    rng2 = CellGenerator(3)
+    rng2.select(0, 1, FEEDING)
+    rng2.random(7)
+    rng2.integers(4, size=3)
+
+    rng1.select(2, 5, FEEDING)
+    rng2.select(2, 5, FEEDING)
+    assert rng1.random(20).tolist() == rng2.random(20).tolist()
+
+
+@pytest.mark.parametrize("stream", [(1, 2, FEEDING), (1, 3, PROCREATION), (2, 2, PROCREATION)])
+def test_streams_differ(stream):
+    """Test that other years, cells and phases give other numbers."""
+    rng = CellGenerator(3)
+    rng.select(1, 2, PROCREATION)
+    values = rng.random(5).tolist()
+
+    rng.select(*stream)
+    assert rng.random(5).tolist() != values
+
+
+def test_negative_seed():
+    """Test that a negative seed is accepted, and gives other numbers than its absolute value."""
+    rng1 = CellGenerator(-1)
+    rng2 = CellGenerator(-1)
+    rng3 = CellGenerator(1)
+    for rng in (rng1, rng2, rng3):
+        rng.select(0, 0, FEEDING)
+
+    values = rng1.random(5).tolist()
+    assert rng2.random(5).tolist() == values
+    assert rng3.random(5).tolist() != values
@@ -1,8 +1,10 @@
+import numpy as np
 import pytest
 from biosim.simulation import BioSim
 from biosim.island import Island
 from biosim.animals import Herbivore, Carnivore
 from biosim.cell import Lowland, Highland
+from biosim.log import read_log
 
 geogr = """\
            WWWWWWWWWWWWWWWWWWWWW
@@ -176,16 +178,18 @@ def reset_animal_defaults():
 @pytest.mark.parametrize("species, change_params", [('Herbivore', {'w_birth': 10, 'w_half': 5}),
                                                     ('Carnivore', {'w_birth': 10, 'w_half': 5})])
 def test_set_animal_parameters(reset_animal_defaults, species, change_params):
-    """Test that set_animal_parameters works correctly"""
-    BioSim().set_animal_parameters(species, change_params)
-
-    if species == 'Herbivore':
-        new_params = {key: Herbivore.params[key] for key in change_params.keys()}
-    else:
-        new_params = {key: Carnivore.params[key] for key in change_params.keys()}
+    """Test that set_animal_parameters only changes the parameters of the simulation"""
+    sim = BioSim()
+    sim.set_animal_parameters(species, change_params)
 
+    parameters = sim.parameters.animal_parameters(species)
+    new_params = {key: parameters[key] for key in change_params.keys()}
     assert new_params == change_params
 
+    animal_class = {'Herbivore': Herbivore, 'Carnivore': Carnivore}[species]
+    class_params = {key: animal_class.params[key] for key in change_params.keys()}
+    assert class_params != change_params
+
 
 @pytest.mark.parametrize("species, change_params", [('Herbivore', {'w_birth': -10}),
                                                     ('Carnivore', {'w_birth': -10})])
@@ -209,13 +213,17 @@ def reset_landscape_defaults():
                          [('L', {'f_max': 100.}),
                           ('H', {'f_max': 200.})])
 def test_set_param_landscape(reset_landscape_defaults, cell_letter, params):
-    """Parameters can be set on landscape classes"""
-
-    BioSim().set_landscape_parameters(cell_letter, params)
+    """Parameters can be set on the landscapes of one simulation"""
+    sim = BioSim(island_map="WWWW\nWLHW\nWWWW", vis_years=0)
+    sim.set_landscape_parameters(cell_letter, params)
 
     cell = {'L': Lowland, 'H': Highland}
+    loc = {'L': (2, 2), 'H': (2, 3)}[cell_letter]
+    sim.add_population([{'loc': loc, 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}]}])
 
-    assert cell[cell_letter].f_max == params['f_max']
+    assert sim.parameters.landscape_parameters(cell_letter)['f_max'] == params['f_max']
+    assert sim.island.map[loc].fodder == params['f_max']
+    assert cell[cell_letter].f_max != params['f_max']
 
 
 @pytest.mark.parametrize('cell_letter, params',
@@ -294,20 +302,210 @@ def test_yearly_cycle(mocker):
               "c_loss_of_weight": Carnivore.loss_of_weight.call_count,
               "c_death": Carnivore.death.call_count}
 
-    # Manually counted method calls:
-    expect = {"h_calc_fit": 5,
-              "h_procreation": 2,
-              "h_feeding": 2,
-              "h_migrate": 2,
-              "h_aging": 2,
-              "h_loss_of_weight": 2,
-              "h_death": 2,
-              "c_calc_fit": 2,
-              "c_procreation": 1,
+    # Manually counted method calls.
+    # Feeding and loss of weight update fitness in bulk for the whole cell,
+    # so calc_fitness is only called when the animals are created.
+    # Births, grazing, migration and the end of the year are handled for the whole
+    # cell at once, without Animal.procreation, Herbivore.feeding, Animal.migrate,
+    # Animal.aging and Animal.death.
+    expect = {"h_calc_fit": 1,
+              "h_procreation": 0,
+              "h_feeding": 0,
+              "h_migrate": 0,
+              "h_aging": 0,
+              "h_loss_of_weight": 0,
+              "h_death": 0,
+              "c_calc_fit": 1,
+              "c_procreation": 0,
               "c_feeding": 0,
-              "c_migrate": 1,
-              "c_aging": 1,
-              "c_loss_of_weight": 1,
-              "c_death": 1}
+              "c_migrate": 0,
+              "c_aging": 0,
+              "c_loss_of_weight": 0,
+              "c_death": 0}
 
     assert result == expect
+
+
+@pytest.mark.parametrize("engine", ["object", "array"])
+def test_engine_population_count(engine):
+    """Test that both engines count the initial population and simulate"""
+    sim = BioSim(geogr, ini_herbs + ini_carns, vis_years=0, engine=engine)
+    sim.simulate(0)
+    assert sim.num_animals_per_species == {'Herbivore': 200, 'Carnivore': 50}
+
+    sim.simulate(5)
+    assert sim.year == 5
+    assert sum(sim.island.pop_in_cell['Herbivore'].values()) == sim.island.pop['Herbivore']
+    assert len(sim.island.specs['Carnivore']['age']) == sim.island.pop['Carnivore']
+
+
+def test_invalid_engine():
+    """Invalid engine must raise error"""
+    with pytest.raises(ValueError):
+        BioSim(geogr, vis_years=0, engine='gpu')
+
+
+@pytest.mark.parametrize("engine", ["object", "array"])
+def test_checkpoint_continues_run(engine, tmp_path):
+    """Test that a simulation loaded from a checkpoint continues as the saved one"""
+    sim = BioSim(geogr, ini_herbs + ini_carns, seed=3, vis_years=0, engine=engine)
+    sim.set_animal_parameters('Carnivore', {'F': 30})
+    sim.simulate(5)
+    path = sim.save_checkpoint(tmp_path / 'sim')
+
+    loaded = BioSim.load_checkpoint(path)
+    assert path.name == 'sim.npz'
+    assert loaded.year == 5
+    assert loaded.num_animals_per_species == sim.num_animals_per_species
+    assert loaded.parameters.animal_parameters('Carnivore')['F'] == 30
+
+    sim.simulate(5)
+    loaded.simulate(5)
+    assert loaded.pop_history == sim.pop_history
+    assert loaded.island.active_counts == sim.island.active_counts
+    for species in ('Herbivore', 'Carnivore'):
+        assert np.array_equal(loaded.island.counts[species], sim.island.counts[species])
+
+
+def test_checkpoint_animal_arrays(tmp_path):
+    """Test that the animals are stored as one array per attribute"""
+    sim = BioSim(geogr, ini_herbs + ini_carns, seed=3, vis_years=0)
+    sim.save_checkpoint(tmp_path / 'sim.npz')
+
+    with np.load(tmp_path / 'sim.npz') as data:
+        assert data['animal_species'].tolist() == [0] * 200 + [1] * 50
+        assert data['animal_age'].tolist() == [5] * 250
+        assert data['animal_weight'].dtype == float
+        assert set(data['animal_cell'].tolist()) == {sim.island.cell_index[(2, 7)]}
+        assert data['history_years'].tolist() == []
+
+
+def test_checkpoint_with_graphics(tmp_path):
+    """Test that a simulation with graphics can be saved, and options can be changed"""
+    sim = BioSim(geogr, ini_herbs, seed=3, vis_years=1, ymax_animals=300)
+    path = sim.save_checkpoint(tmp_path / 'sim')
+
+    loaded = BioSim.load_checkpoint(path, vis_years=0)
+    assert loaded.vis_years == 0
+    assert loaded._options['ymax_animals'] == 300
+    assert loaded.island.rng.seed == 3
+
+
+def test_checkpoint_invalid_version(tmp_path):
+    """Test that a file that is not a checkpoint raises ValueError"""
+    np.savez(tmp_path / 'other.npz', checkpoint_version=99)
+    with pytest.raises(ValueError):
+        BioSim.load_checkpoint(tmp_path / 'other.npz')
+
+
+@pytest.mark.parametrize("option", [{'seed': 4}, {'engine': 'array'}, {'ini_pop': ini_herbs},
+                                    {'island_map': geogr}, {'parameters': None}])
+def test_checkpoint_stored_options(option, tmp_path):
+    """Test that options stored in the checkpoint cannot be replaced"""
+    path = BioSim(geogr, ini_herbs, seed=3, vis_years=0).save_checkpoint(tmp_path / 'sim')
+    with pytest.raises(ValueError):
+        BioSim.load_checkpoint(path, **option)
+
+
+@pytest.mark.parametrize("engine, workers", [("object", 1), ("array", 1), ("object", 2)])
+def test_resume_same_as_uninterrupted(engine, workers, tmp_path):
+    """Test that a run resumed from the newest checkpoint ends as an uninterrupted run"""
+    uninterrupted = BioSim(geogr, ini_herbs + ini_carns, seed=3, vis_years=0, engine=engine)
+    uninterrupted.simulate(12)
+
+    sim = BioSim(geogr, ini_herbs + ini_carns, seed=3, vis_years=0, engine=engine,
+                 workers=workers)
+    sim.simulate(12, checkpoint_every=5, checkpoint_dir=tmp_path)
+    assert sim.pop_history == uninterrupted.pop_history
+
+    resumed = BioSim.resume(tmp_path)
+    assert resumed.year == 10
+    assert resumed.final_year == 12
+    resumed.simulate(resumed.final_year - resumed.year)
+    assert resumed.pop_history == uninterrupted.pop_history
+
+
+def test_checkpoint_retention(tmp_path):
+    """Test that only the newest checkpoints are kept, and no temporary files are left"""
+    sim = BioSim(geogr, ini_herbs, seed=3, vis_years=0)
+    sim.simulate(7, checkpoint_every=1, checkpoint_dir=tmp_path / 'run', keep_checkpoints=3)
+
+    names = sorted(path.name for path in (tmp_path / 'run').iterdir())
+    assert names == ['checkpoint_000005.npz', 'checkpoint_000006.npz', 'checkpoint_000007.npz']
+
+    sim.simulate(2, checkpoint_every=1, checkpoint_dir=tmp_path / 'run', keep_checkpoints=None)
+    assert len(list((tmp_path / 'run').iterdir())) == 5
+
+
+@pytest.mark.parametrize("options", [{'checkpoint_every': 0},
+                                     {'checkpoint_every': 2.5},
+                                     {'checkpoint_every': 2},
+                                     {'checkpoint_every': True},
+                                     {'checkpoint_every': 2, 'keep_checkpoints': 0},
+                                     {'checkpoint_every': 2, 'keep_checkpoints': 1.5}])
+def test_invalid_checkpoint_options(options, tmp_path):
+    """Test that invalid checkpoint options raise ValueError"""
+    if 'keep_checkpoints' in options:
+        options['checkpoint_dir'] = tmp_path
+    sim = BioSim(geogr, ini_herbs, seed=3, vis_years=0)
+    with pytest.raises(ValueError):
+        sim.simulate(3, **options)
+
+
+def test_resume_without_checkpoints(tmp_path):
+    """Test that resuming from a directory without checkpoints raises ValueError"""
+    with pytest.raises(ValueError):
+        BioSim.resume(tmp_path)
+
+
+def history_columns(sim):
+    """Returns the population history of a simulation as log columns"""
+    years = sorted(sim.pop_history['Herbivore'])
+    columns = {'year': years}
+    columns.update({species: [history[year] for year in years]
+                    for species, history in sim.pop_history.items()})
+    return columns
+
+
+@pytest.mark.parametrize("suffix", ['.csv', '.bin'])
+def test_log_written_while_simulating(suffix, tmp_path):
+    """Test that the log file has the counts of every year after simulate"""
+    sim = BioSim(geogr, ini_herbs + ini_carns, seed=3, vis_years=0,
+                 log_file=tmp_path / f'log{suffix}', log_flush_years=4)
+    sim.simulate(6)
+    sim.simulate(3)
+
+    log = read_log(tmp_path / f'log{suffix}')
+    assert {name: column.tolist() for name, column in log.items()} == history_columns(sim)
+
+
+def test_log_continues_after_resume(tmp_path):
+    """Test that a resumed run continues its log without repeating years"""
+    uninterrupted = BioSim(geogr, ini_herbs + ini_carns, seed=3, vis_years=0)
+    uninterrupted.simulate(12)
+
+    sim = BioSim(geogr, ini_herbs + ini_carns, seed=3, vis_years=0,
+                 log_file=tmp_path / 'log.bin')
+    sim.simulate(12, checkpoint_every=5, checkpoint_dir=tmp_path / 'run')
+
+    resumed = BioSim.resume(tmp_path / 'run')
+    resumed.simulate(resumed.final_year - resumed.year)
+
+    log = read_log(tmp_path / 'log.bin')
+    assert {name: column.tolist() for name, column in log.items()} == \
+        history_columns(uninterrupted)
+
+
+def test_without_history(tmp_path):
+    """Test that without keep_history only the last year is kept, and the log has all"""
+    full = BioSim(geogr, ini_herbs + ini_carns, seed=3, vis_years=0)
+    full.simulate(5)
+
+    sim = BioSim(geogr, ini_herbs + ini_carns, seed=3, vis_years=0, keep_history=False,
+                 log_file=tmp_path / 'log')
+    sim.simulate(5)
+
+    assert sim.pop_history == {species: {5: history[5]}
+                               for species, history in full.pop_history.items()}
+    log = read_log(tmp_path / 'log.csv')
+    assert {name: column.tolist() for name, column in log.items()} == history_columns(full)
@@ -0,0 +1,137 @@
+"""Test the parameter sweep module."""
+import numpy as np
+import pytest
+
+from biosim.ensemble import run_replica
+from biosim.sweep import parameter_grid, split_point, point_key, SweepStore, run_sweep
+
+geogr = """\
+           WWWWWW
+           WLLLHW
+           WLDLLW
+           WWWWWW"""
+
+ini_pop = [{'loc': (2, 3),
+            'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(30)]}]
+
+
+def test_parameter_grid():
+    """Test that the grid has every combination of values."""
+    points = parameter_grid({'Herbivore.gamma': [0.1, 0.2], 'L.f_max': [500, 600, 700]})
+
+    assert len(points) == 6
+    assert {'Herbivore.gamma': 0.2, 'L.f_max': 600} in points
+
+
+def test_split_point():
+    """Test that parameters are split into animal and landscape parameters."""
+    animal_parameters, landscape_parameters = split_point(
+        {'Herbivore.gamma': 0.1, 'Carnivore.F': 40, 'Carnivore.omega': 0.5, 'H.f_max': 100})
+
+    assert animal_parameters == {'Herbivore': {'gamma': 0.1},
+                                 'Carnivore': {'F': 40, 'omega': 0.5}}
+    assert landscape_parameters == {'H': {'f_max': 100}}
+
+
+def test_split_point_invalid_name():
+    """Test that a parameter without species raises ValueError."""
+    with pytest.raises(ValueError):
+        split_point({'gamma': 0.1})
+
+
+@pytest.mark.parametrize("name", ['D.f_max', 'W.f_max', 'Fox.gamma', 'Herbivore.foo',
+                                  'Herbivore.DeltaPhiMax', 'L.gamma'])
+def test_split_point_unknown_name(name):
+    """Test that an unknown species, landscape or parameter name raises ValueError."""
+    with pytest.raises(ValueError):
+        split_point({name: 100})
+
+
+def test_run_sweep_invalid_point(tmp_path):
+    """Test that an invalid point is rejected before any simulation is run."""
+    with pytest.raises(ValueError):
+        run_sweep([{'Herbivore.gamma': 0.1}, {'Herbivore.foo': 1}], [1], 4, tmp_path,
+                  workers=1, island_map=geogr, ini_pop=ini_pop)
+    assert SweepStore(tmp_path).keys() == []
+
+
+@pytest.mark.parametrize("change", [{'seed': 2}, {'num_years': 6}, {'engine': 'array'},
+                                    {'point': {'Herbivore.gamma': 0.3}},
+                                    {'island_map': "WWWW\nWLLW\nWWWW"}])
+def test_point_key_changes(change):
+    """Test that the key depends on every input."""
+    inputs = {'point': {'Herbivore.gamma': 0.2}, 'seed': 1, 'num_years': 5,
+              'island_map': geogr, 'ini_pop': ini_pop, 'engine': 'object'}
+    key = point_key(**inputs)
+    inputs.update(change)
+
+    assert point_key(**inputs) != key
+
+
+def test_point_key_map_indentation():
+    """Test that the indentation of the map does not change the key."""
+    assert point_key({}, 1, 5, geogr) == point_key({}, 1, 5, geogr.replace('           ', ''))
+
+
+def test_point_key_numeric_values():
+    """Test that integer and float parameter values give the same key."""
+    assert point_key({'L.f_max': 700}, 1, 5, geogr) == point_key({'L.f_max': 700.0}, 1, 5, geogr)
+
+
+def test_run_sweep_resumes(tmp_path):
+    """Test that points already in the store are skipped."""
+    points = parameter_grid({'Herbivore.gamma': [0.1, 0.3]})
+
+    assert run_sweep(points, [1], 4, tmp_path, workers=2, island_map=geogr,
+                     ini_pop=ini_pop) == 2
+    assert run_sweep(points, [1, 2], 4, tmp_path, workers=2, island_map=geogr,
+                     ini_pop=ini_pop) == 2
+    assert run_sweep(points, [1, 2], 4, tmp_path, workers=2, island_map=geogr,
+                     ini_pop=ini_pop) == 0
+    assert len(SweepStore(tmp_path).keys()) == 4
+
+
+def test_store_table(tmp_path):
+    """Test that the table has one row for every simulation, with its results."""
+    points = [{'Herbivore.gamma': 0.1}, {'L.f_max': 500}]
+    run_sweep(points, [3], 4, tmp_path, workers=2, island_map=geogr, ini_pop=ini_pop)
+    table = SweepStore(tmp_path).load()
+
+    assert table['Herbivore'].shape == (2, 5)
+    row = int(np.flatnonzero(table['Herbivore.gamma'] == 0.1)[0])
+    assert np.isnan(table['L.f_max'][row])
+    assert table['seed'][row] == 3
+
+    replica = run_replica(3, 4, island_map=geogr, ini_pop=ini_pop,
+                          animal_parameters={'Herbivore': {'gamma': 0.1}})
+    assert table['Herbivore'][row].tolist() == replica.populations['Herbivore'].tolist()
+
+
+def test_store_ignores_partial_files(tmp_path):
+    """Test that a file left by an interrupted save is not a result."""
+    store = SweepStore(tmp_path)
+    (tmp_path / 'abc.tmp.npz').write_bytes(b'')
+
+    assert 'abc' not in store
+    assert store.keys() == []
+
+
+def test_consolidate(tmp_path):
+    """Test that the results are collected into one table, and new results are added to it."""
+    store = SweepStore(tmp_path)
+    store.save('a', {'Herbivore.gamma': 0.1}, 1, {'Herbivore': np.arange(5)})
+    store.save('b', {'L.f_max': 500}, 2, {'Herbivore': np.arange(5) + 1})
+
+    assert store.consolidate() == 2
+    assert [path.name for path in tmp_path.iterdir()] == ['table.npz']
+    assert 'a' in store and 'b' in SweepStore(tmp_path)
+
+    store.save('c', {'Herbivore.gamma': 0.3}, 1, {'Herbivore': np.arange(5) + 2})
+    assert store.keys() == ['a', 'b', 'c']
+    assert store.consolidate() == 3
+
+    table = store.load()
+    assert table['key'].tolist() == ['a', 'b', 'c']
+    assert table['Herbivore'][:, 0].tolist() == [0, 1, 2]
+    assert np.isnan(table['Herbivore.gamma'][1])
+    assert table['L.f_max'][1] == 500